@@ -9,10 +9,16 @@ from flask import Flask, render_template, request, redirect, url_for,jsonify
 from supabase import create_client
 from dotenv import load_dotenv
 
+from src.core.reflow import reflow
+
 load_dotenv()
 
 app = Flask(__name__)
 
+# Hvor langt før opgavens plan_date der hentes tasks når en forsinkelse skubbes
+# videre (flerdags-jobs der startede tidligere kan ligge på samme maler)
+REFLOW_LOOKBACK_DAYS = 14
+
 
 @app.route("/calendar")
 def calendar_grid():
@@ -180,13 +186,8 @@ def delay(task_id):
         return render_template("task.html", task=task,
             msg=f"⚠ Konflikt med {conflict_with} — admin er adviseret og vender tilbage.")
     else:
-        # Opdater blokken direkte
-        for b in blocks:
-            if b.get("kind") == resource:
-                b["start"] = f"{plan_date}T{new_start}"
-                b["end"]   = new_end.isoformat()
-
-        sb.table("tasks").update({"plan": plan}).eq("task_id", task_id).execute()
+        # Flyt blokken og skub de blokke der afhænger af den
+        moved = _apply_move(sb, task, resource, new_dt, minutes)
 
         # Notificér de andre ressourcer på opgaven
         notify_emails = _get_other_emails(resource, task)
@@ -199,8 +200,41 @@ def delay(task_id):
                 f"Se opdateret plan på: {request.host_url}task/{task_id}",
             )
 
+        pushed = len(moved) - 1 if moved else 0
         return render_template("task.html", task=task,
-            msg=f"✓ Tidspunkt opdateret til {new_start}. Øvrige parter er notificeret.")
+            msg=f"✓ Tidspunkt opdateret til {new_start}. Øvrige parter er notificeret."
+                + (f" {pushed} efterfølgende blokke er skubbet." if pushed else ""))
+
+
+def _apply_move(sb, task: dict, resource: str, new_dt: datetime, minutes: int) -> list:
+    """
+    Flytter opgavens blok for resource til new_dt og skubber de blokke der
+    afhænger af den (samme opgave: tømrer -> maler, samme person: de
+    efterfølgende opgaver) — src/core/reflow.py. Kun ændrede tasks opdateres.
+    """
+    plan_date = task.get("plan_date") or new_dt.date().isoformat()
+    since = (datetime.fromisoformat(plan_date[:10]) - timedelta(days=REFLOW_LOOKBACK_DAYS)).date().isoformat()
+    rows = sb.table("tasks").select("task_id, plan, plan_date").gte("plan_date", since).execute().data or []
+
+    by_id = {r["task_id"]: r for r in rows}
+    by_id[task["task_id"]] = task
+    for r in by_id.values():
+        r["plan"] = r.get("plan") or {}
+        r["plan"].setdefault("blocks", [])
+    plans = {tid: r["plan"]["blocks"] for tid, r in by_id.items()}
+
+    moved = reflow(
+        plans, task["task_id"], resource, new_dt, minutes,
+        os.getenv("WORKDAY_START", "07:00"), os.getenv("WORKDAY_END", "15:00"),
+    )
+    for tid in dict.fromkeys(m.task_id for m in moved):
+        r = by_id[tid]
+        starts = [b["start"] for b in r["plan"]["blocks"] if b.get("start")]
+        update = {"plan": r["plan"]}
+        if starts:
+            update["plan_date"] = min(starts)[:10]
+        sb.table("tasks").update(update).eq("task_id", tid).execute()
+    return moved
 
 
 def _get_other_emails(changed_resource: str, task: dict) -> list[str]:
@@ -244,17 +278,10 @@ def approve(change_id):
     # Opdater selve opgaven
     task_res = sb.table("tasks").select("*").eq("task_id", ch["task_id"]).single().execute()
     task = task_res.data
-    plan = task.get("plan") or {}
-    blocks = plan.get("blocks", [])
     plan_date = task.get("plan_date", "")
-    new_end = (datetime.fromisoformat(f"{plan_date}T{ch['new_start']}") + timedelta(minutes=ch["minutes"])).isoformat()
-
-    for b in blocks:
-        if b.get("kind") == ch["resource"]:
-            b["start"] = f"{plan_date}T{ch['new_start']}"
-            b["end"]   = new_end
+    new_dt = datetime.fromisoformat(f"{plan_date}T{ch['new_start']}")
 
-    sb.table("tasks").update({"plan": plan}).eq("task_id", ch["task_id"]).execute()
+    _apply_move(sb, task, ch["resource"], new_dt, ch["minutes"])
     sb.table("pending_changes").update({"status": "APPROVED"}).eq("id", change_id).execute()
 
     return redirect(url_for("admin", token=token))
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+
+_T0 = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# ---------------------------------------------------------------------------
+# python -m src <kommando>
+#
+#   ingest  [--source outlook|graph|graph-async]   del A (default: INGEST_SOURCE / outlook)
+#   analyze                                         del B
+#   plan    [--optimize SEK]                        del C (SEK > 0: lokalsøgning, PLAN_OPTIMIZE_SECONDS)
+#   all     [--source ...] [--optimize SEK]         A -> B -> C (som src.pipeline.run_all)
+#
+# Kun den valgte dels moduler importeres. Import-tiden skrives ud til sidst.
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m src", description="job_mail_planner pipeline")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name, help_ in (
+        ("ingest", "del A: hent mails + pdf + tekst -> tasks"),
+        ("analyze", "del B: analyse + tømrer-preview"),
+        ("plan", "del C: lav plan"),
+        ("all", "A -> B -> C"),
+    ):
+        p = sub.add_parser(name, help=help_)
+        if name in ("ingest", "all"):
+            p.add_argument("--source", choices=["outlook", "graph", "graph-async"], default=None)
+        if name in ("plan", "all"):
+            p.add_argument("--optimize", type=float, default=None, metavar="SEK",
+                           help="forbedr planen med lokalsøgning i SEK sekunder")
+    args = ap.parse_args(argv)
+    if getattr(args, "optimize", None) is not None:
+        # læses når c_plan_schedule importeres
+        os.environ["PLAN_OPTIMIZE_SECONDS"] = str(args.optimize)
+
+    from src.pipeline import run_all
+
+    cli_ms = (time.perf_counter() - _T0) * 1000
+    if args.cmd == "all":
+        run_all.run_all(args.source)
+    else:
+        run_all.load_step(args.cmd, getattr(args, "source", None))()
+
+    parts = [f"cli {cli_ms:.0f} ms"] + [f"{k} {v:.0f} ms" for k, v in run_all.IMPORT_MS.items()]
+    print(f"[CLI] Import: {', '.join(parts)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
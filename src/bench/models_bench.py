@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from src.core.models import TaskRecord
+
+# ---------------------------------------------------------------------------
+# Hukommelse og (de)serialisering for task-modellerne
+#   python -m src.bench.models_bench [--n 50000]
+#
+# Syntetiske tasks i samme form som tasks.json efter stage C (features,
+# analysis, plan med 1-4 blokke). Sammenligner rå dicts (som stages brugte
+# før) med TaskRecord: hukommelse for hele backloggen (tracemalloc),
+# from_dict/to_dict, JSON ind/ud og en typisk stage C-operation (sortér på
+# modtagelsestid og tjek deadline mod blok-start), hvor dict-udgaven
+# parser ISO-strenge hver gang.
+# ---------------------------------------------------------------------------
+
+
+def _task(i: int, rng: random.Random, base: datetime) -> dict[str, Any]:
+    received = base + timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+    start = received.replace(hour=7, minute=0, second=0, tzinfo=None) + timedelta(days=rng.randint(1, 20))
+    blocks = []
+    for k in range(rng.randint(1, 4)):
+        s = start + timedelta(days=k)
+        blocks.append({
+            "label": "TØMRER" if k == 0 and i % 2 else f"MALER (PAINTER_{i % 6 + 1})",
+            "start": s.isoformat(timespec="seconds"),
+            "end": (s + timedelta(minutes=rng.randint(60, 480))).isoformat(timespec="seconds"),
+            "kind": "carpenter" if k == 0 and i % 2 else "painter",
+        })
+    sqm = rng.choice([None, float(rng.randint(20, 180))])
+    trades = {"carpenter": bool(i % 2), "painter": True, "cleaning": i % 7 == 0}
+    deadline = (start + timedelta(days=rng.randint(0, 30))).date().isoformat() if i % 3 else None
+    return {
+        "task_id": f"AAMk{i:012d}",
+        "source_message_id": f"AAMk{i:012d}",
+        "received_at": received.isoformat(timespec="seconds"),
+        "from": f"kunde{i % 50}@boligselskab.dk",
+        "subject": f"Arbejdsordre {i}",
+        "address": f"Nørregade {i % 200 + 1}, {rng.choice(['8000 Aarhus C', '7100 Vejle', '5000 Odense C'])}",
+        "pdf_paths": [f"data/inbox_attachments/AAMk{i:012d}/opgave.pdf"],
+        "text_sha": f"{i:064x}",
+        "status": "PLANNED",
+        "features": {
+            "fp": f"{i:016x}-p2-f47c4d7c", "sqm": sqm, "rooms": rng.choice([None, 2, 3, 4]),
+            "deadline": deadline, "trades": trades,
+            "trade_hits": [{"trade": "painter", "keyword": "maling", "start": 10, "end": 16}],
+        },
+        "analysis": {
+            "fp": f"{i:016x}-p2-f47c4d7c-e1-12/60/240", "needs_carpenter": bool(i % 2),
+            "sqm": sqm, "rooms": None, "estimated_minutes": 60 + (int(sqm * 12) if sqm else 240),
+            "trades": trades,
+        },
+        "plan": {"zone": rng.choice(["Aarhus", "Trekantområdet", "Odense"]), "blocks": blocks},
+    }
+
+
+def build_tasks(n: int, seed: int = 1) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    base = datetime(2026, 1, 1, 8, 0)
+    return [_task(i, rng, base) for i in range(n)]
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def _mem(build: Callable[[], Any]) -> tuple[int, Any]:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, obj
+
+
+def _stage_c_dicts(tasks: list[dict[str, Any]]) -> int:
+    late = 0
+    for t in sorted(tasks, key=lambda t: datetime.fromisoformat(t["received_at"])):
+        dl = t["features"].get("deadline")
+        if dl and datetime.fromisoformat(t["plan"]["blocks"][0]["start"]).date() > datetime.fromisoformat(dl).date():
+            late += 1
+    return late
+
+
+def _stage_c_records(recs: list[TaskRecord]) -> int:
+    late = 0
+    for t in sorted(recs, key=lambda t: t.received_ts):
+        dl = t.features.deadline
+        if dl and t.plan.blocks[0].start.date() > dl:
+            late += 1
+    return late
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Hukommelse/serialisering for TaskRecord vs dicts")
+    ap.add_argument("--n", type=int, default=50_000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    raw = json.dumps(build_tasks(args.n, args.seed), ensure_ascii=False)
+    print(f"{args.n} tasks, JSON {len(raw.encode('utf-8')) / 1e6:.1f} MB\n")
+
+    mem_dicts, dicts = _mem(lambda: json.loads(raw))
+    mem_recs, recs = _mem(lambda: [TaskRecord.from_dict(d) for d in json.loads(raw)])
+
+    rows = [
+        ("json.loads", _timed(lambda: json.loads(raw), args.repeat)[0]),
+        ("from_dict", _timed(lambda: [TaskRecord.from_dict(d) for d in dicts], args.repeat)[0]),
+        ("to_dict", _timed(lambda: [r.to_dict() for r in recs], args.repeat)[0]),
+        ("json.dumps", _timed(lambda: json.dumps(dicts, ensure_ascii=False), args.repeat)[0]),
+        ("load->records", _timed(lambda: [TaskRecord.from_dict(d) for d in json.loads(raw)], args.repeat)[0]),
+        ("records->save", _timed(lambda: json.dumps([r.to_dict() for r in recs], ensure_ascii=False), args.repeat)[0]),
+    ]
+    t_dc, late_d = _timed(lambda: _stage_c_dicts(dicts), args.repeat)
+    t_rc, late_r = _timed(lambda: _stage_c_records(recs), args.repeat)
+    assert late_d == late_r
+
+    print(f"{'hukommelse':<16}{'MB':>10}{'bytes/task':>12}")
+    print(f"{'dicts':<16}{mem_dicts / 1e6:>10.1f}{mem_dicts / args.n:>12.0f}")
+    print(f"{'TaskRecord':<16}{mem_recs / 1e6:>10.1f}{mem_recs / args.n:>12.0f}"
+          f"   ({mem_recs / mem_dicts:.0%} af dicts)")
+    print(f"\n{'operation':<16}{'ms':>10}{'µs/task':>12}")
+    for name, sec in rows:
+        print(f"{name:<16}{sec * 1000:>10.0f}{sec * 1e6 / args.n:>12.2f}")
+    print(f"\nstage C-opslag (sortér + deadline-tjek): dicts {t_dc * 1000:.0f} ms, "
+          f"TaskRecord {t_rc * 1000:.0f} ms ({t_dc / t_rc:.1f}x)")
+
+    # Round-trip skal være tabsfri
+    assert [r.to_dict() for r in recs[:1000]] == [
+        TaskRecord.from_dict(r.to_dict()).to_dict() for r in recs[:1000]
+    ]
+
+
+if __name__ == "__main__":
+    main()
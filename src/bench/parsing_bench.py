@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from src.core import parsing, rules, trades
+from src.core.storage import load_tasks, task_text
+
+# ---------------------------------------------------------------------------
+# Benchmark af regex-laget (parsing/rules/trades) på et syntetisk korpus
+#   python -m src.bench.parsing_bench [--sizes 1000,10000,100000] [--save-baseline]
+#
+# Korpusset bygges deterministisk (--seed) ud fra task-teksterne i tasks.json:
+# arbejdssedler med varierende adresser (fuld linje / "Adresse:" over flere
+# linjer / kun postnr / ingen), m²/kvm-notation, værelser, deadlines, fag og
+# støj (sidefødder, CVR/tlf., beskrivelser med tal). Ca. hver femte er en
+# task med flere PDF'er.
+#
+# Resultatet sammenlignes med parsing_baseline.json ved siden af denne fil:
+# docs/s under baseline minus --tolerance giver exit-kode 1. Et ændret antal
+# fund vises som advarsel (kan være en tilsigtet parser-ændring).
+# Baseline er maskinafhængig — gem en ny (--save-baseline) på den maskine
+# der sammenlignes på.
+# ---------------------------------------------------------------------------
+
+BASELINE_PATH = Path(__file__).with_name("parsing_baseline.json")
+
+_STREETS = [
+    "Nørregade", "Vestergade", "Søndre Boulevard", "Åboulevarden", "Kongensgade",
+    "Ærøvej", "Skovvej", "Strandvejen", "H.C. Andersens Vej", "Ny Østergade",
+    "Bispensgade", "Jægergårdsgade", "Hans Broges Gade", "Vesterbrogade",
+]
+_CITIES = [
+    ("8000", "Aarhus C"), ("2100", "København Ø"), ("5000", "Odense C"),
+    ("9000", "Aalborg"), ("7100", "Vejle"), ("8900", "Randers C"),
+    ("7000", "Fredericia"), ("6700", "Esbjerg"), ("4000", "Roskilde"),
+    ("3000", "Helsingør"), ("2200", "København N"), ("8200", "Aarhus N"),
+]
+_DOORS = ["th", "tv", "mf", "1", "2"]
+
+_FALLBACK_SEED = """Arbejdsordre – Maling
+Beskrivelse af opgave:
+Lejligheden skal males i alle opholdsrum. Vægge og lofter skal have 2 lag maling.
+Billeder/notes:
+• Foto 1: (placeholder) • Note: adgang via nøgleboks."""
+
+
+def _address(rng: random.Random) -> str:
+    street = rng.choice(_STREETS)
+    num = f"{rng.randint(1, 250)}{rng.choice(['', '', 'A', 'B'])}"
+    pc, city = rng.choice(_CITIES)
+    floor = f", {rng.randint(1, 6)}. {rng.choice(_DOORS)}." if rng.random() < 0.5 else ""
+    kind = rng.random()
+    if kind < 0.45:
+        return f"{street} {num}{floor}, {pc} {city}"
+    if kind < 0.75:
+        return f"Adresse:\n{street} {num}{floor}\n{pc} {city}"
+    if kind < 0.9:
+        return f"Ejendom: {pc} {city}"
+    return "Adresse: oplyses senere"
+
+
+def _sqm(rng: random.Random) -> str:
+    v = rng.randint(20, 180)
+    return rng.choice([
+        f"Der er i alt {v} m2 der skal males.",
+        f"Areal: {v} m²",
+        f"ca. {v} kvm",
+        f"{v},5 kvadratmeter gulv",
+        f"m²\n{v}",                       # tabel-layout fra pdfplumber — matcher ikke
+        "Areal ikke oplyst.",
+    ])
+
+
+def _rooms(rng: random.Random) -> str:
+    n = rng.randint(1, 6)
+    return rng.choice([f"{n} værelser samt stue", f"{n}-værelses lejlighed", f"{n} rum", "Antal værelser\n" + str(n), ""])
+
+
+def _deadline(rng: random.Random) -> str:
+    d, m = rng.randint(1, 28), rng.randint(1, 12)
+    return rng.choice([
+        f"Senest {d}.{m}.2026",
+        f"Deadline: {d}/{m}",
+        f"Klar til uge {rng.randint(1, 52)}",
+        f"Aflevering: {d}-{m}-26",
+        "Arbejdet ønskes udført i uge 12.",
+        "",
+    ])
+
+
+def _trade_lines(rng: random.Random) -> list[str]:
+    pool = [
+        "Tømrerarbejde:", "Der skal udføres tømmerarbejde ved dørkarme.", "Kræver toemrer.",
+        "Maling af vægge og lofter.", "Spartelarbejde inden maling.",
+        "Slutrengøring efter arbejdet.", "Vinduespudsning udvendigt.",
+    ]
+    return rng.sample(pool, rng.randint(0, 3))
+
+
+def _noise(rng: random.Random, seed_lines: list[str]) -> list[str]:
+    out = []
+    for _ in range(rng.randint(3, 25)):
+        r = rng.random()
+        if r < 0.5 and seed_lines:
+            out.append(rng.choice(seed_lines))
+        elif r < 0.6:
+            out.append(f"Side {rng.randint(1, 4)} af {rng.randint(4, 6)}")
+        elif r < 0.7:
+            out.append(f"CVR {rng.randint(10_000_000, 99_999_999)} · Tlf. {rng.randint(20, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}")
+        elif r < 0.8:
+            out.append(f"Sag nr. 2026-{rng.randint(10000, 99999)} / rekv. {rng.randint(1000, 9999)}")
+        else:
+            out.append(
+                f"Der skal bruges {rng.randint(2, 20)} spande à {rng.randint(5, 10)} liter, "
+                f"{rng.randint(1, 9)} ruller tape og {rng.randint(100, 2000)} g spartel til {rng.randint(2, 30)} huller."
+            )
+    return out
+
+
+def _work_order(rng: random.Random, seed_lines: list[str]) -> str:
+    parts = ["Arbejdsordre – " + rng.choice(["Maling", "Maling og Tømrerarbejde", "Istandsættelse", "Flytteopgave"])]
+    rest = [[_sqm(rng)], [_rooms(rng)], [_deadline(rng)], _trade_lines(rng), _noise(rng, seed_lines)]
+    rng.shuffle(rest)
+    for s in [[_address(rng)]] + rest:  # adressen står oftest øverst
+        parts.extend(x for x in s if x)
+    return "\n".join(parts)
+
+
+def load_seed_texts() -> list[str]:
+    return [x for x in (task_text(t) for t in load_tasks()) if x] or [_FALLBACK_SEED]
+
+
+def seed_digest(seed_texts: list[str]) -> str:
+    return hashlib.sha256("\x00".join(seed_texts).encode("utf-8")).hexdigest()[:16]
+
+
+def build_corpus(n: int, seed: int = 1, seed_texts: list[str] | None = None) -> list[str]:
+    if seed_texts is None:
+        seed_texts = load_seed_texts()
+    seed_lines = [l.strip() for t in seed_texts for l in t.splitlines() if l.strip()]
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        # ~20 % er tasks med flere PDF'er (teksterne sættes sammen som i stage A)
+        k = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+        docs.append("\n\n".join(_work_order(rng, seed_lines) for _ in range(k)))
+    return docs
+
+
+EXTRACTORS: dict[str, Callable[[str], object]] = {
+    "address": parsing.extract_address_from_text,
+    "sqm": parsing.extract_sqm,
+    "rooms": parsing.extract_rooms,
+    "deadline": parsing.extract_deadline,
+    "trades": lambda t: any(trades.detect_trades(t).values()) or None,
+    "features": lambda t: parsing.extract_features(t).address,
+    "analyze": lambda t: rules.analyze(t, 12, 60, 240).sqm,
+}
+
+
+def run_bench(sizes: list[int], seed: int, repeat: int) -> dict[str, dict[str, dict[str, float]]]:
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for n in sizes:
+        docs = build_corpus(n, seed)
+        mb = sum(len(d.encode("utf-8")) for d in docs) / 1e6
+        print(f"\n{n} dokumenter, {mb:.1f} MB")
+        print(f"{'extractor':<12}{'docs/s':>12}{'MB/s':>10}{'fundet':>10}")
+        results[str(n)] = {}
+        for name, fn in EXTRACTORS.items():
+            best = float("inf")
+            found = 0
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                found = sum(1 for d in docs if fn(d) is not None)
+                best = min(best, time.perf_counter() - t0)
+            row = {"docs_per_sec": n / best, "mb_per_sec": mb / best, "found": found}
+            results[str(n)][name] = row
+            print(f"{name:<12}{row['docs_per_sec']:>12.0f}{row['mb_per_sec']:>10.2f}{100 * found / n:>9.1f}%")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """True hvis ingen extractor er blevet mere end tolerance langsommere."""
+    ok = True
+    base_results = baseline.get("results", {})
+    print(f"\nSammenligning med baseline ({baseline.get('machine', '?')}), tolerance {tolerance:.0%}:")
+    for size, rows in results.items():
+        for name, row in rows.items():
+            base = base_results.get(size, {}).get(name)
+            if not base:
+                continue
+            ratio = row["docs_per_sec"] / base["docs_per_sec"]
+            status = "ok"
+            if ratio < 1 - tolerance:
+                status = "REGRESSION"
+                ok = False
+            if row["found"] != base["found"]:
+                status += f" (fund ændret: {base['found']} -> {row['found']})"
+            print(f"  {size:>7} {name:<12} {ratio:>6.2f}x  {status}")
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark af parsing/rules på syntetiske arbejdssedler")
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--tolerance", type=float, default=0.25, help="tilladt fald i docs/s før det er en regression")
+    ap.add_argument("--save-baseline", action="store_true")
+    args = ap.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    results = run_bench(sizes, args.seed, args.repeat)
+
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps({
+            "machine": f"{platform.machine()} / {platform.processor() or platform.system()} / Python {platform.python_version()}",
+            "seed": args.seed,
+            "corpus": seed_digest(load_seed_texts()),
+            "results": results,
+        }, indent=2), encoding="utf-8")
+        print(f"\nBaseline gemt: {BASELINE_PATH}")
+        return
+
+    if not BASELINE_PATH.exists():
+        print("\nIngen baseline endnu — kør med --save-baseline")
+        return
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    if baseline.get("seed") != args.seed or baseline.get("corpus") != seed_digest(load_seed_texts()):
+        print("\nKorpus afviger fra baseline (andet --seed eller ændret tasks.json) — fund kan ikke sammenlignes")
+    if not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
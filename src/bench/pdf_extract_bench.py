@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from src.core import pdf_extract
+from src.core.parsing import extract_address_from_text
+
+# ---------------------------------------------------------------------------
+# Benchmark af PDF-udtræk pr. side
+#   python -m src.bench.pdf_extract_bench [mappe] [--repeat N]
+# Default: alle PDF'er under data/inbox_attachments. Cachen bruges ikke.
+# ---------------------------------------------------------------------------
+
+
+def _pymupdf_all(p: Path) -> tuple[str, int, int]:
+    import fitz
+    with fitz.open(str(p)) as doc:
+        return "\n".join(page.get_text("text") for page in doc), len(doc), 0
+
+
+def _pdfplumber_all(p: Path) -> tuple[str, int, int]:
+    import pdfplumber
+    with pdfplumber.open(str(p)) as pdf:
+        return "\n".join(page.extract_text() or "" for page in pdf.pages), len(pdf.pages), len(pdf.pages)
+
+
+def _legacy(p: Path) -> tuple[str, int, int]:
+    return pdf_extract._extract_text_legacy(p), _PAGES[p], -1
+
+
+def _adaptive(p: Path) -> tuple[str, int, int]:
+    pages = list(pdf_extract.iter_pdf_pages(p))
+    fallbacks = sum(1 for _i, _t, engine in pages if engine == "pdfplumber")
+    return "\n".join(t for _i, t, _e in pages), len(pages), fallbacks
+
+
+def _adaptive_address(p: Path) -> tuple[str, int, int]:
+    parts: list[str] = []
+    fallbacks = 0
+    for _i, t, engine in pdf_extract.iter_pdf_pages(p):
+        parts.append(t)
+        fallbacks += engine == "pdfplumber"
+        if extract_address_from_text("\n".join(parts)):
+            break
+    return "\n".join(parts), len(parts), fallbacks
+
+
+_PAGES: dict[Path, int] = {}
+
+
+def _page_count(p: Path) -> int:
+    import fitz
+    with fitz.open(str(p)) as doc:
+        return len(doc)
+
+
+STRATEGIES = {
+    "pymupdf": _pymupdf_all,
+    "pdfplumber": _pdfplumber_all,
+    "legacy": _legacy,
+    "adaptive": _adaptive,
+    "adaptive+stop@adresse": _adaptive_address,
+}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark af PDF-tekstudtræk pr. side")
+    ap.add_argument("folder", nargs="?", default="data/inbox_attachments")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    pdfs = sorted(Path(args.folder).rglob("*.pdf"))
+    if not pdfs:
+        print(f"Ingen PDF'er i {args.folder}")
+        return
+
+    for p in pdfs:
+        _PAGES[p] = _page_count(p)
+
+    print(f"{len(pdfs)} PDF'er, {args.repeat} gentagelser pr. strategi\n")
+    print(f"{'strategi':<24}{'sider':>8}{'ms/side':>10}{'ms/pdf':>10}{'pdfplumber-sider':>18}{'adresse ok':>12}")
+
+    for name, fn in STRATEGIES.items():
+        best = float("inf")
+        pages = fallbacks = found = 0
+        for _ in range(args.repeat):
+            pages = fallbacks = found = 0
+            t0 = time.perf_counter()
+            for p in pdfs:
+                text, n, fb = fn(p)
+                pages += n
+                fallbacks += max(fb, 0)
+                found += extract_address_from_text(text) is not None
+            best = min(best, time.perf_counter() - t0)
+
+        fb_col = "-" if name == "legacy" else str(fallbacks)
+        print(
+            f"{name:<24}{pages:>8}{1000 * best / max(pages, 1):>10.2f}"
+            f"{1000 * best / len(pdfs):>10.2f}{fb_col:>18}{found:>9}/{len(pdfs)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
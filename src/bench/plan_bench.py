@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from src.core.models import TaskAnalysis, TaskFeatures, TaskRecord
+from src.core.postcodes import _load
+from src.core.timeline import FITS
+from src.pipeline.c_plan_optimize import optimize, score
+from src.pipeline import c_plan_schedule
+from src.pipeline.c_plan_schedule import PlanResult, build_plan
+
+# ---------------------------------------------------------------------------
+# Planlægning (del C) på en syntetisk backlog
+#   python -m src.bench.plan_bench [--n 500] [--painters 6] [--short] [--cap N]
+#
+# Tasks fordeles over postnumrene i src/core/data/dk_postcodes.csv (så
+# zonerne er de rigtige), med estimater som stage B laver dem og ~40 %
+# tømreropgaver; ~20 % har en deadline 1-8 uger efter START. Samme pool
+# planlægges med hver placeringsstrategi; rapporterer køretid, antal
+# plandage, udnyttelse pr. maler-dag og malernes kørsel (km efter
+# sekvensering og km sparet i forhold til placeringsrækkefølgen). --optimize SEK kører også
+# lokalsøgningen (c_plan_optimize.py) og viser gevinsten over greedy.
+# --short giver småopgaver (60-150 min) og --cap N sætter
+# MAX_TASKS_PER_DAY_PER_PAINTER — flere besøg pr. dag, så sekvenseringen
+# har noget at ordne.
+# ---------------------------------------------------------------------------
+
+
+START = date(2026, 3, 2)
+
+
+def build_pool(n: int, seed: int = 1, short: bool = False) -> list[TaskRecord]:
+    rng = random.Random(seed)
+    rows = _load()[0]
+    # vægt mod de store byzoner, som i den rigtige backlog
+    weights = [5 if r.zone in ("København", "Aarhus", "Odense", "Aalborg", "Trekantområdet") else 1 for r in rows]
+    base = datetime(2026, 1, 1, 8, 0)
+    pool = []
+    for i in range(n):
+        r = rng.choices(rows, weights)[0]
+        pc = rng.randint(r.code_from, min(r.code_to, r.code_from + 9))
+        sqm = rng.choice([None, float(rng.randint(20, 140))])
+        needs_carp = rng.random() < 0.4
+        deadline = START + timedelta(days=rng.randint(7, 56)) if rng.random() < 0.2 else None
+        pool.append(TaskRecord(
+            task_id=f"T{i:06d}",
+            source_message_id=f"T{i:06d}",
+            received_at=base + timedelta(minutes=rng.randint(0, 60 * 24 * 60)),
+            from_address="kunde@boligselskab.dk",
+            subject=f"Arbejdsordre {i}",
+            address=f"Testvej {rng.randint(1, 120)}, {pc} {r.city}",
+            pdf_paths=[],
+            status="ANALYZED",
+            features=TaskFeatures(fp="bench", sqm=sqm, deadline=deadline),
+            analysis=TaskAnalysis(
+                needs_carpenter=needs_carp,
+                sqm=sqm,
+                estimated_minutes=rng.randint(60, 150) if short else 60 + (int(sqm * 12) if sqm else 240),
+                trades={"carpenter": needs_carp, "painter": True},
+            ),
+        ))
+    return pool
+
+
+def _painter_days(res: PlanResult) -> int:
+    return max((p.timeline.last_day + 1 for p in res.painters), default=0)
+
+
+def _avg_util(res: PlanResult) -> float:
+    used = [p for p in res.painters if p.timeline.booked]
+    return sum(p.utilization() for p in used) / len(used) if used else 0.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Planlægning på syntetisk backlog")
+    ap.add_argument("--n", type=int, default=500)
+    ap.add_argument("--painters", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--optimize", type=float, default=0, metavar="SEK")
+    ap.add_argument("--short", action="store_true", help="småopgaver (60-150 min)")
+    ap.add_argument("--cap", type=int, default=None, help="MAX_TASKS_PER_DAY_PER_PAINTER")
+    args = ap.parse_args()
+    if args.cap:
+        c_plan_schedule.MAX_TASKS_PER_DAY_PER_PAINTER = args.cap
+
+    s = SimpleNamespace(workday_start="07:00", workday_end="15:00", num_painters=args.painters)
+    start = START
+    print(f"{args.n} tasks, {args.painters} malere\n")
+    print(f"{'fit':<10}{'sek':>8}{'plandage':>10}{'udnyttelse':>12}{'tømrer':>9}{'km':>9}{'sparet':>8}")
+    for fit in FITS:
+        pool = build_pool(args.n, args.seed, args.short)
+        t0 = time.perf_counter()
+        res = build_plan(pool, s, start, fit)
+        sec = time.perf_counter() - t0
+        print(f"{fit:<10}{sec:>8.2f}{_painter_days(res):>10}{_avg_util(res):>12.0%}"
+              f"{res.carpenter.utilization():>9.0%}{res.route.km_after:>9.0f}"
+              f"{res.route.km_before - res.route.km_after:>8.0f}")
+
+    if args.optimize > 0:
+        res, report = optimize(build_pool(args.n, args.seed, args.short), s, start, args.optimize)
+        print()
+        print("\n".join(report.lines()))
+        assert score(res, report.day_minutes) == report.best
+
+
+if __name__ == "__main__":
+    main()
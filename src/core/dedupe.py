@@ -0,0 +1,113 @@
+from __future__ import annotations
+import os
+
+from src.core.models import TaskRecord, parse_datetime
+from src.core.parsing import address_key
+from src.core.storage import load_task, load_tasks
+
+# ---------------------------------------------------------------------------
+# Dublet-opgaver på tværs af mails (samme lejlighed sendt igen med en ny PDF)
+#
+# Dedupe på mail-id og attachment-sha fanger ikke en genudsendt opgave med
+# en re-eksporteret PDF. Her bruges adressenøglen fra parsing.address_key()
+# (vej|husnr|etage|dør|postnr) som indeks i seen["address_keys"]:
+#   nøgle -> {"task_id": første task for adressen, "received_at": seneste mail}
+# Opslaget er ét dict-opslag pr. ny task.
+#
+# DUPLICATE_MODE:
+#   flag  (default) ny task gemmes med status DUPLICATE + duplicate_of, så
+#                   B/C springer den over (sæt status til NEW hvis den er ægte)
+#   merge           ingen ny task: PDF'erne lægges på den eksisterende task, og
+#                   er den ikke planlagt endnu, tilføjes den nye tekst efter den
+#                   gamle (stage B genparser den pga. ændret text_sha)
+#   off             ingen dublet-tjek
+# DUPLICATE_WINDOW_DAYS: kun mails inden for så mange dage af den forrige
+# mail for adressen regnes som dubletter (en ny opgave samme sted et halvt år
+# senere er ægte).
+# ---------------------------------------------------------------------------
+
+DUPLICATE_MODE = (os.getenv("DUPLICATE_MODE") or "flag").strip().lower()
+DUPLICATE_WINDOW_DAYS = float(os.getenv("DUPLICATE_WINDOW_DAYS", "30") or "30")
+
+# Tasks der stadig kan få ny tekst ved merge
+_OPEN = ("NEW", "ANALYZED", "CARPENTER_REQUESTED")
+
+_backfilled = False
+
+
+def _backfill(seen: dict, msg_seen: dict) -> None:
+    """Første gang (ældre state uden indeks): byg address_keys ud fra de gemte tasks."""
+    global _backfilled
+    _backfilled = True
+    if seen.get("address_keys"):
+        return
+    index: dict[str, dict] = {}
+    for d in load_tasks():
+        key = address_key(d.get("address"))
+        if key is None or d.get("status") == "DUPLICATE":
+            continue
+        prev = index.get(key)
+        ts = parse_datetime(d.get("received_at"))
+        if prev is None:
+            index[key] = {"task_id": d["task_id"], "received_at": d.get("received_at"), "_ts": ts}
+        elif ts and (prev["_ts"] is None or ts.timestamp() > prev["_ts"].timestamp()):
+            prev["received_at"], prev["_ts"] = d.get("received_at"), ts
+    for v in index.values():
+        del v["_ts"]
+    if index:
+        seen.setdefault("address_keys", {}).update(index)
+        msg_seen.setdefault("address_keys", {}).update(index)
+
+
+def _within_window(prev_iso: str | None, task: TaskRecord) -> bool:
+    prev = parse_datetime(prev_iso)
+    if prev is None or task.received_at is None:
+        return True
+    return abs(task.received_ts - prev.timestamp()) <= DUPLICATE_WINDOW_DAYS * 86400
+
+
+def _register(key: str, task_id: str, task: TaskRecord, seen: dict, msg_seen: dict) -> None:
+    entry = {"task_id": task_id, "received_at": task.received_at.isoformat() if task.received_at else None}
+    seen.setdefault("address_keys", {})[key] = entry
+    msg_seen.setdefault("address_keys", {})[key] = entry
+
+
+def check_duplicate(task: TaskRecord, seen: dict, msg_seen: dict) -> TaskRecord:
+    """
+    Kaldes i stage A før en ny task gemmes. Returnerer den task der skal
+    gemmes: den nye (evt. markeret DUPLICATE) eller — ved merge — den
+    eksisterende med den nye mail lagt på. Indekset opdateres i seen/msg_seen.
+    """
+    if DUPLICATE_MODE == "off":
+        return task
+    key = address_key(task.address)
+    if key is None:
+        return task
+    if not _backfilled:
+        _backfill(seen, msg_seen)
+
+    entry = seen.get("address_keys", {}).get(key)
+    if not entry or entry.get("task_id") == task.task_id or not _within_window(entry.get("received_at"), task):
+        _register(key, task.task_id, task, seen, msg_seen)
+        return task
+
+    original_id = entry["task_id"]
+    if DUPLICATE_MODE == "merge":
+        d = load_task(original_id)
+        if d is None:  # original slettet — den nye overtager adressen
+            _register(key, task.task_id, task, seen, msg_seen)
+            return task
+        original = TaskRecord.from_dict(d)
+        original.pdf_paths += [p for p in task.pdf_paths if p not in original.pdf_paths]
+        original.merged_from.append(task.source_message_id)
+        if original.status in _OPEN and task.text_raw and task.text_raw not in original.text_raw:
+            original.text_raw = "\n\n".join(t for t in (original.text_raw, task.text_raw) if t)
+        _register(key, original_id, task, seen, msg_seen)
+        print(f"[DEDUPE] {task.source_message_id} lagt sammen med {original_id} ({task.address})")
+        return original
+
+    task.status = "DUPLICATE"
+    task.duplicate_of = original_id
+    _register(key, original_id, task, seen, msg_seen)
+    print(f"[DEDUPE] {task.task_id} ligner {original_id} ({task.address}) — status DUPLICATE")
+    return task
@@ -1,16 +1,104 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict, field
-from typing import Any
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Iterable
 
-@dataclass
+from src.core.storage import get_text, put_text, load_tasks_by_status, upsert_tasks
+
+# ---------------------------------------------------------------------------
+# Arbejdsrepræsentationen for tasks i stage A/B/C
+#
+# State gemmes stadig som dicts/JSON (storage.py, web-appen). Stages
+# konverterer ved grænsen: from_dict() efter load, to_dict() før upsert.
+# I hukommelsen er tidspunkter datetime/date (ISO-strenge kun i to_dict),
+# og klasserne har __slots__, så store backlogs fylder mindre.
+# Ukendte nøgler (fx fra web-appen) bevares i TaskRecord.extra, ligesom
+# tidspunkter der ikke kan parses (så de ikke tabes ved load/save).
+# ---------------------------------------------------------------------------
+
+
+def parse_datetime(s: str | None) -> datetime | None:
+    if not s:
+        return None
+    if isinstance(s, str) and s.endswith(("Z", "z")):
+        s = s[:-1] + "+00:00"  # Graph skriver UTC som "...Z" (fromisoformat < 3.11 kan ikke)
+    try:
+        return datetime.fromisoformat(s)
+    except (TypeError, ValueError):
+        print(f"[MODELS] Kan ikke læse tidspunkt: {s!r}")
+        return None
+
+
+def _d(s: str | None) -> date | None:
+    if not s:
+        return None
+    try:
+        return date.fromisoformat(s)
+    except (TypeError, ValueError):
+        return None
+
+
+def _iso(v: date | datetime | None) -> str | None:
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return v.isoformat(timespec="seconds")
+    return v.isoformat()
+
+
+@dataclass(slots=True)
+class TaskFeatures:
+    """Felter parset fra teksten (stage B). fp = tekst-hash + parser-version."""
+    fp: str
+    sqm: float | None = None
+    rooms: int | None = None
+    deadline: date | None = None
+    trades: dict[str, bool] = field(default_factory=dict)
+    trade_hits: list[dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "fp": self.fp,
+            "sqm": self.sqm,
+            "rooms": self.rooms,
+            "deadline": _iso(self.deadline),
+            "trades": self.trades,
+            "trade_hits": self.trade_hits,
+        }
+
+    @staticmethod
+    def from_dict(d: dict[str, Any] | None) -> "TaskFeatures | None":
+        if not d:
+            return None
+        return TaskFeatures(
+            fp=str(d.get("fp") or ""),
+            sqm=d.get("sqm"),
+            rooms=d.get("rooms"),
+            deadline=_d(d.get("deadline")),
+            trades=dict(d.get("trades") or {}),
+            trade_hits=list(d.get("trade_hits") or []),
+        )
+
+
+@dataclass(slots=True)
 class TaskAnalysis:
+    """Estimater afledt af features + settings. fp = features-fp + settings."""
     needs_carpenter: bool
     sqm: float | None = None
     rooms: int | None = None
     estimated_minutes: int = 0
+    trades: dict[str, bool] = field(default_factory=dict)
+    fp: str | None = None
 
     def to_dict(self) -> dict[str, Any]:
-        return asdict(self)
+        return {
+            "fp": self.fp,
+            "needs_carpenter": self.needs_carpenter,
+            "sqm": self.sqm,
+            "rooms": self.rooms,
+            "estimated_minutes": self.estimated_minutes,
+            "trades": self.trades,
+        }
 
     @staticmethod
     def from_dict(d: dict[str, Any] | None) -> "TaskAnalysis | None":
@@ -21,74 +109,163 @@ class TaskAnalysis:
             sqm=d.get("sqm"),
             rooms=d.get("rooms"),
             estimated_minutes=int(d.get("estimated_minutes") or 0),
+            trades=dict(d.get("trades") or {}),
+            fp=d.get("fp"),
         )
 
-@dataclass
+
+@dataclass(slots=True)
 class PlanBlock:
     label: str
-    start: str  # ISO string
-    end: str    # ISO string
+    start: datetime
+    end: datetime
+    kind: str = ""   # "carpenter" | "painter" | "cleaning" (som web-appens ressourcer)
 
     def to_dict(self) -> dict[str, Any]:
-        return asdict(self)
+        return {"label": self.label, "start": _iso(self.start), "end": _iso(self.end), "kind": self.kind}
+
+    @staticmethod
+    def from_dict(d: dict[str, Any]) -> "PlanBlock":
+        return PlanBlock(
+            label=str(d.get("label") or ""),
+            start=datetime.fromisoformat(d["start"]),
+            end=datetime.fromisoformat(d["end"]),
+            kind=str(d.get("kind") or ""),
+        )
+
 
-@dataclass
+@dataclass(slots=True)
 class TaskPlan:
-    painter_id: int
-    bucket: str
+    zone: str
     blocks: list[PlanBlock] = field(default_factory=list)
 
     def to_dict(self) -> dict[str, Any]:
-        return {
-            "painter_id": self.painter_id,
-            "bucket": self.bucket,
-            "blocks": [b.to_dict() for b in self.blocks],
-        }
+        # "bucket" er det gamle navn for zone — skrives stadig for ældre læsere af state
+        return {"zone": self.zone, "bucket": self.zone, "blocks": [b.to_dict() for b in self.blocks]}
+
+    @staticmethod
+    def from_dict(d: dict[str, Any] | None) -> "TaskPlan | None":
+        if not d:
+            return None
+        return TaskPlan(
+            zone=str(d.get("zone") or d.get("bucket") or ""),
+            blocks=[PlanBlock.from_dict(b) for b in d.get("blocks") or []],
+        )
+
+
+# Nøgler TaskRecord selv kender — alt andet havner i extra
+_KNOWN = frozenset({
+    "task_id", "source_message_id", "received_at", "from", "from_address", "subject",
+    "address", "pdf_paths", "text_sha", "text_raw", "status", "features", "analysis",
+    "plan", "deadline", "carpenter_notified", "carpenter_notified_at", "duplicate_of",
+    "merged_from",
+})
 
-@dataclass
+
+@dataclass(slots=True)
 class TaskRecord:
     task_id: str
     source_message_id: str
-    received_at: str
+    received_at: datetime | None
     from_address: str | None
     subject: str
     address: str
     pdf_paths: list[str]
-    text_raw: str
+    text_sha: str | None = None
     status: str = "NEW"
+    features: TaskFeatures | None = None
     analysis: TaskAnalysis | None = None
     plan: TaskPlan | None = None
+    deadline: date | None = None          # manuelt sat deadline (vinder over den parsede)
+    carpenter_notified: bool = False
+    carpenter_notified_at: datetime | None = None
+    duplicate_of: str | None = None                         # status DUPLICATE: samme adresse som denne task
+    merged_from: list[str] = field(default_factory=list)    # mails der er lagt sammen med denne task
+    extra: dict[str, Any] = field(default_factory=dict)
+    _text: str | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def text_raw(self) -> str:
+        # Teksten hentes fra blob-lageret første gang den bruges
+        if self._text is None:
+            self._text = get_text(self.text_sha) if self.text_sha else ""
+        return self._text
+
+    @text_raw.setter
+    def text_raw(self, text: str) -> None:
+        self._text = text
+        self.text_sha = put_text(text)
+
+    @property
+    def received_ts(self) -> float:
+        """Sorteringsnøgle — virker på tværs af Graph (UTC) og Outlook (lokal tid uden tz)."""
+        return self.received_at.timestamp() if self.received_at else 0.0
 
     def to_dict(self) -> dict[str, Any]:
-        d = asdict(self)
-        # asdict kan håndtere dataclasses, men vi vil have pæn struktur:
-        d["analysis"] = self.analysis.to_dict() if self.analysis else None
-        d["plan"] = self.plan.to_dict() if self.plan else None
+        d: dict[str, Any] = {
+            "task_id": self.task_id,
+            "source_message_id": self.source_message_id,
+            "received_at": _iso(self.received_at),
+            "from": self.from_address,
+            "subject": self.subject,
+            "address": self.address,
+            "pdf_paths": self.pdf_paths,
+            "text_sha": self.text_sha,
+            "status": self.status,
+        }
+        if self.features is not None:
+            d["features"] = self.features.to_dict()
+        if self.analysis is not None:
+            d["analysis"] = self.analysis.to_dict()
+        if self.plan is not None:
+            d["plan"] = self.plan.to_dict()
+        if self.deadline is not None:
+            d["deadline"] = _iso(self.deadline)
+        if self.carpenter_notified:
+            d["carpenter_notified"] = True
+            d["carpenter_notified_at"] = _iso(self.carpenter_notified_at)
+        if self.duplicate_of:
+            d["duplicate_of"] = self.duplicate_of
+        if self.merged_from:
+            d["merged_from"] = self.merged_from
+        if self.extra:
+            d.update(self.extra)
         return d
 
     @staticmethod
     def from_dict(d: dict[str, Any]) -> "TaskRecord":
-        analysis = TaskAnalysis.from_dict(d.get("analysis"))
-        plan_d = d.get("plan")
-        plan = None
-        if plan_d:
-            blocks = [PlanBlock(**b) for b in plan_d.get("blocks", [])]
-            plan = TaskPlan(
-                painter_id=int(plan_d.get("painter_id")),
-                bucket=str(plan_d.get("bucket")),
-                blocks=blocks,
-            )
-
-        return TaskRecord(
+        rec = TaskRecord(
             task_id=str(d["task_id"]),
-            source_message_id=str(d["source_message_id"]),
-            received_at=str(d.get("received_at", "")),
+            source_message_id=str(d.get("source_message_id") or d["task_id"]),
+            received_at=parse_datetime(d.get("received_at")),
             from_address=d.get("from") or d.get("from_address"),
-            subject=str(d.get("subject", "")),
-            address=str(d.get("address", "")),
-            pdf_paths=list(d.get("pdf_paths", [])),
-            text_raw=str(d.get("text_raw", "")),
-            status=str(d.get("status", "NEW")),
-            analysis=analysis,
-            plan=plan,
+            subject=str(d.get("subject") or ""),
+            address=str(d.get("address") or ""),
+            pdf_paths=list(d.get("pdf_paths") or []),
+            text_sha=d.get("text_sha"),
+            status=str(d.get("status") or "NEW"),
+            features=TaskFeatures.from_dict(d.get("features")),
+            analysis=TaskAnalysis.from_dict(d.get("analysis")),
+            plan=TaskPlan.from_dict(d.get("plan")),
+            deadline=_d(d.get("deadline")),
+            carpenter_notified=bool(d.get("carpenter_notified")),
+            carpenter_notified_at=parse_datetime(d.get("carpenter_notified_at")),
+            duplicate_of=d.get("duplicate_of"),
+            merged_from=list(d.get("merged_from") or []),
+            extra={k: v for k, v in d.items() if k not in _KNOWN},
         )
+        # Tidspunkter der ikke kan parses beholdes som rå strenge (to_dict skriver dem igen)
+        for key in ("received_at", "carpenter_notified_at"):
+            if d.get(key) and getattr(rec, key) is None:
+                rec.extra[key] = d[key]
+        if "text_raw" in d:  # ældre task med teksten inline
+            rec.text_raw = str(d.get("text_raw") or "")
+        return rec
+
+
+def load_records_by_status(*statuses: str) -> list[TaskRecord]:
+    return [TaskRecord.from_dict(d) for d in load_tasks_by_status(*statuses)]
+
+
+def upsert_records(records: Iterable[TaskRecord]) -> None:
+    upsert_tasks([r.to_dict() for r in records])
@@ -1,26 +1,23 @@
 from __future__ import annotations
 
 from pathlib import Path
-import shutil
-import time
-import win32com.client
+
+from src.core.storage import sha256_file, link_or_copy
 
 
 def _shorten_attachment_path(src: Path, spool_dir: Path) -> Path:
     """
-    Copy attachment to a short path to avoid Outlook/Windows long-path issues.
-    Returns the new path (or original if already short enough).
+    Link attachment to a short path to avoid Outlook/Windows long-path issues.
+    Returns the spool path (<spool>/<sha[:12]>/<filnavn>).
     """
-    spool_dir.mkdir(parents=True, exist_ok=True)
-
-    # Outlook/COM kan fejle ved lange stier. Vi copier altid til spool med kort navn.
-    # Brug timestamp + original filnavn, så vi undgår collisions.
-    ts = int(time.time() * 1000)
-    safe_name = f"{ts}_{src.name}".replace(" ", "_")
-    dst = spool_dir / safe_name
+    # Outlook/COM kan fejle ved lange stier. Spool-stien er nøglet på indholdet,
+    # så samme PDF sendt igen genbruger den eksisterende hardlink i stedet for
+    # en ny kopi pr. afsendelse — og filnavnet i mailen forbliver det originale.
+    sha = sha256_file(src)
+    safe_name = src.name.replace(" ", "_")
+    dst = spool_dir / sha[:12] / safe_name
 
-    shutil.copy2(src, dst)
-    return dst
+    return link_or_copy(src, dst)
 
 
 def send_mail_outlook(
@@ -35,8 +32,10 @@ def send_mail_outlook(
     Sender en mail via lokal Outlook (COM) med vedhæftninger.
     Løser typiske issues:
       - relative paths -> absolut
-      - long path / OneDrive path issues -> copy til kort spool path
+      - long path / OneDrive path issues -> hardlink til kort spool path
     """
+    import win32com.client  # kun Windows/Outlook — importeres først når der sendes
+
     outlook = win32com.client.Dispatch("Outlook.Application")
     mail = outlook.CreateItem(0)  # 0 = MailItem
 
@@ -67,7 +66,7 @@ def send_mail_outlook(
                     errors += 1
                     continue
 
-                # copy til kort spool path (meget vigtig ved lange stier)
+                # link til kort spool path (meget vigtig ved lange stier)
                 dst = _shorten_attachment_path(src, spool)
 
                 mail.Attachments.Add(str(dst))
@@ -1,10 +1,19 @@
 from __future__ import annotations
 import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from src.core.trades import TradeHit, default_matcher, find_trade_hits
+
+# Tælles op når et udtræk (regex/strategi) ændrer resultat — stage B
+# genparser så gemte features hvis fingerprint indeholder en ældre version
+PARSER_VERSION = "3"
 
 # ---------------------------------------------------------------------------
 # Adresse-parsing
 # ---------------------------------------------------------------------------
-# Dansk adresse-mønster: "Nørregade 5", "Vestervej 12B", "Markvej 3, 3. tv"
+# Dansk adresse-mønster: "Nørregade 5", "Vestervej 12B", "Markvej 3, 3. tv",
+# "Markvej 3, st. th" (stuen/kælder som etage "st"/"kl")
 # Postnummer: 4 cifre (1000-9999 DK)
 # By: ét eller flere ord med æøåÆØÅ og bindestreg
 # ---------------------------------------------------------------------------
@@ -15,7 +24,7 @@ _POSTCODE_RE = re.compile(
     \s+
     (?P<num>\d+\s*[A-Za-z]?)                              # husnummer (+ evt. bogstav)
     [,\s]*
-    (?:(?P<floor>\d+)\.\s*(?P<door>[a-zA-Z0-9\.]+)\s*)?  # etage + dør (valgfrit)
+    (?:(?P<floor>\d+|st|kl)\.\s*(?P<door>[a-zA-Z0-9\.]+)\s*)?  # etage (2., st., kl.) + dør (valgfrit)
     [,\s]*
     (?P<postcode>\d{4})                                   # postnummer
     \s+
@@ -36,45 +45,106 @@ _POSTCODE_CITY_RE = re.compile(
 )
 
 
-def extract_address_from_text(text: str) -> str | None:
+# Hurtigt forfilter til _POSTCODE_RE: halen af enhver fuld adresse
+# (husnr [+ etage/dør] + postnr + by). _POSTCODE_RE's dovne vejnavn prøver
+# alle startpositioner i linjen og er langsom på lange linjer med tal —
+# den køres kun på linjer hvor halen findes.
+_FULL_TAIL_RE = re.compile(
+    r"\d\s*[A-Za-z]?[,\s]*(?:(?:\d+|st|kl)\.\s*[a-zA-Z0-9\.]+\s*)?[,\s]*\d{4}\s+[A-Za-zÆØÅæøå][A-Za-zÆØÅæøå\s\-]",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class AddressCandidate:
+    kind: str      # "full" | "label" | "postcode"
+    line_no: int   # linjenummer i teksten (0-baseret)
+    text: str
+
+
+def _scan_address(text: str) -> tuple[str | None, list[AddressCandidate]]:
     """
-    Forsøger 3 strategier i prioriteret rækkefølge:
-    1) Fuld adresse: vejnavn + husnr + postnr + by
-    2) Labelbaseret: "Adresse: ..."
-    3) Bare postnr + by (zonebrug stadig mulig)
+    Ét gennemløb af linjerne. Prioritet som før: første fulde adresse,
+    ellers første label-adresse med postnr, ellers første linje med postnr + by.
+    Scanningen stopper ved første fulde adresse (den kan ikke slås).
     """
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    candidates: list[AddressCandidate] = []
+    label: str | None = None
+    postcode: str | None = None
+    pending: tuple[int, str] | None = None  # "Adresse:" uden postnr — prøv med næste linje
 
-    # Strategi 1: fuld adresse
-    for line in lines:
-        m = _POSTCODE_RE.search(line)
-        if m:
-            return line  # returner hele linjen (inkl. etage/dør info)
+    for line_no, raw in enumerate(text.splitlines()):
+        line = raw.strip()
+        if not line:
+            continue
+
+        # PDF'er splitter tit "Adresse:\nVej 5\n8000 By"
+        if pending is not None:
+            combined = pending[1] + " " + line
+            if _POSTCODE_CITY_RE.search(combined):
+                candidates.append(AddressCandidate("label", pending[0], combined))
+                label = label or combined
+            pending = None
+
+        if _POSTCODE_CITY_RE.search(line):
+            if _FULL_TAIL_RE.search(line) and _POSTCODE_RE.search(line):
+                # returner hele linjen (inkl. etage/dør info)
+                candidates.append(AddressCandidate("full", line_no, line))
+                return line, candidates
+            candidates.append(AddressCandidate("postcode", line_no, line))
+            postcode = postcode or line
 
-    # Strategi 2: label-baseret
-    for line in lines:
         m = _LABEL_RE.match(line)
         if m:
             candidate = m.group(1).strip()
             # Validér at der er et postnummer i kandidaten
             if _POSTCODE_CITY_RE.search(candidate):
-                return candidate
-            # Ellers er det nok ikke en adresse
-            # Men check næste linje — PDF'er splitter tit "Adresse:\nVej 5\n8000 By"
-            idx = lines.index(line)
-            if idx + 1 < len(lines):
-                next_line = lines[idx + 1].strip()
-                combined = candidate + " " + next_line
-                if _POSTCODE_CITY_RE.search(combined):
-                    return combined
-
-    # Strategi 3: bare postnr + by (brugbar til zone-batching)
-    for line in lines:
-        m = _POSTCODE_CITY_RE.search(line)
-        if m:
-            return line
+                candidates.append(AddressCandidate("label", line_no, candidate))
+                label = label or candidate
+            else:
+                pending = (line_no, candidate)
+
+    return label or postcode, candidates
+
+
+def extract_address_from_text(text: str) -> str | None:
+    """
+    Forsøger 3 strategier i prioriteret rækkefølge:
+    1) Fuld adresse: vejnavn + husnr + postnr + by
+    2) Labelbaseret: "Adresse: ..."
+    3) Bare postnr + by (zonebrug stadig mulig)
+    """
+    return _scan_address(text)[0]
+
+
+_TRANSLIT = str.maketrans({"æ": "ae", "ø": "oe", "å": "aa", "é": "e"})
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _norm(part: str | None) -> str:
+    return _NON_ALNUM_RE.sub("", (part or "").lower().translate(_TRANSLIT))
 
-    return None
+
+def address_key(address: str | None) -> str | None:
+    """
+    Normaliseret nøgle for en fuld adresse: "vej|husnr|etage|dør|postnr".
+    "Adresse: Nørregade 45, 2. th., 8000 Aarhus C" og
+    "NOERREGADE 45 2.TH 8000 Aarhus" giver begge "noerregade|45|2|th|8000".
+    None hvis der ikke er vej + husnr + postnr (kun postnr er ikke nok til dedupe).
+    """
+    if not address:
+        return None
+    label = _LABEL_RE.match(address.strip())
+    m = _POSTCODE_RE.search(label.group(1) if label else address)
+    if not m:
+        return None
+    return "|".join((
+        _norm(m.group("street")),
+        _norm(m.group("num")),
+        _norm(m.group("floor")),
+        _norm(m.group("door")),
+        m.group("postcode"),
+    ))
 
 
 # ---------------------------------------------------------------------------
@@ -85,8 +155,7 @@ _SQM_RE = re.compile(
     re.IGNORECASE,
 )
 
-def extract_sqm(text: str) -> float | None:
-    m = _SQM_RE.search(text)
+def _sqm_from_match(m: re.Match | None) -> float | None:
     if not m:
         return None
     val = float(m.group(1).replace(",", "."))
@@ -95,6 +164,9 @@ def extract_sqm(text: str) -> float | None:
         return val
     return None
 
+def extract_sqm(text: str) -> float | None:
+    return _sqm_from_match(_SQM_RE.search(text))
+
 
 # ---------------------------------------------------------------------------
 # Rum/værelser parsing
@@ -104,8 +176,7 @@ _ROOMS_RE = re.compile(
     re.IGNORECASE,
 )
 
-def extract_rooms(text: str) -> int | None:
-    m = _ROOMS_RE.search(text)
+def _rooms_from_match(m: re.Match | None) -> int | None:
     if not m:
         return None
     val = int(m.group(1))
@@ -113,6 +184,9 @@ def extract_rooms(text: str) -> int | None:
         return val
     return None
 
+def extract_rooms(text: str) -> int | None:
+    return _rooms_from_match(_ROOMS_RE.search(text))
+
 
 # ---------------------------------------------------------------------------
 # Deadline parsing (P1 feature — bruges i c_plan_schedule.py)
@@ -129,26 +203,17 @@ _DEADLINE_RE = re.compile(
     re.VERBOSE | re.IGNORECASE,
 )
 
-def extract_deadline(text: str) -> str | None:
-    """
-    Returnerer deadline som 'YYYY-MM-DD' streng hvis fundet, ellers None.
-    """
-    from datetime import datetime, date
-    import isoweek  # pip install isoweek -- valgfri; graceful fallback
-
-    m = _DEADLINE_RE.search(text)
+def _deadline_from_match(m: re.Match | None) -> str | None:
     if not m:
         return None
 
     try:
         if m.group("week"):
-            try:
-                week = int(m.group("week"))
-                year = date.today().year
-                d = isoweek.Week(year, week).monday()
-                return d.isoformat()
-            except Exception:
-                return None
+            # mandag i ISO-ugen; uge 0/54+ ruller over i nabo-året (som isoweek.Week gjorde)
+            week = int(m.group("week"))
+            year = date.today().year
+            d = date.fromisocalendar(year, 1, 1) + timedelta(weeks=week - 1)
+            return d.isoformat()
         else:
             day = int(m.group("day"))
             month = int(m.group("month"))
@@ -159,3 +224,49 @@ def extract_deadline(text: str) -> str | None:
             return date(year, month, day).isoformat()
     except Exception:
         return None
+
+def extract_deadline(text: str) -> str | None:
+    """
+    Returnerer deadline som 'YYYY-MM-DD' streng hvis fundet, ellers None.
+    """
+    return _deadline_from_match(_DEADLINE_RE.search(text))
+
+
+# ---------------------------------------------------------------------------
+# Samlet udtræk: alle felter i ét kald
+# ---------------------------------------------------------------------------
+@dataclass
+class DocumentFeatures:
+    address: str | None
+    address_candidates: list[AddressCandidate] = field(default_factory=list)
+    sqm: float | None = None
+    rooms: int | None = None
+    deadline: str | None = None
+    trades: dict[str, bool] = field(default_factory=dict)
+    trade_hits: list[TradeHit] = field(default_factory=list)
+
+    @property
+    def needs_carpenter(self) -> bool:
+        return self.trades.get("carpenter", False)
+
+
+def extract_features(text: str) -> DocumentFeatures:
+    """
+    Alle felter fra en tekst i ét kald: adresse (+ kandidater med linjenr.),
+    m², rum, deadline og fag (+ hvor ordene står). Linjerne gennemløbes
+    én gang for adressen; m²/rum/deadline er hver én søgning i C (en samlet
+    alternation var langsommere); fagene findes i ét gennemløb af
+    Aho-Corasick-automaten i src/core/trades.py.
+    """
+    address, candidates = _scan_address(text)
+    hits = find_trade_hits(text)
+    found = {h.trade for h in hits}
+    return DocumentFeatures(
+        address=address,
+        address_candidates=candidates,
+        sqm=_sqm_from_match(_SQM_RE.search(text)),
+        rooms=_rooms_from_match(_ROOMS_RE.search(text)),
+        deadline=_deadline_from_match(_DEADLINE_RE.search(text)),
+        trades={t: t in found for t in default_matcher().trade_names},
+        trade_hits=hits,
+    )
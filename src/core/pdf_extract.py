@@ -1,7 +1,322 @@
 from __future__ import annotations
+import os
+import time
+import multiprocessing
+from multiprocessing.context import TimeoutError as _PoolTimeout
+from collections import deque
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
 
-def extract_text_from_pdf(pdf_path: Path) -> str:
+from src.core import text_cache
+from src.core.storage import sha256_file
+
+T = TypeVar("T")
+
+# "adaptive" (default): PyMuPDF pr. side, pdfplumber kun på de sider der kræver det.
+# "legacy": pdfplumber på hele dokumentet, PyMuPDF igen på det hele hvis < 50 tegn.
+PDF_ENGINE = (os.getenv("PDF_ENGINE") or "adaptive").strip().lower()
+
+# Bump når udtrækningen ændres, så gamle cache-rækker ikke genbruges
+EXTRACTOR_VERSION = "1" if PDF_ENGINE == "legacy" else "2-adaptive"
+
+# Sider med mindre tekst end dette i PyMuPDF's tekstlag prøves med pdfplumber
+MIN_PAGE_CHARS = 20
+
+def extract_text_from_pdf(
+    pdf_path: Path,
+    sha: str | None = None,
+    stop_when: Callable[[str], bool] | None = None,
+) -> str:
+    """
+    Tekst fra PDF, slået op i text_cache på (sha256, EXTRACTOR_VERSION) først.
+    sha kan gives med hvis kalderen allerede har hashet indholdet.
+    TEXT_CACHE=0 slår cachen fra.
+
+    stop_when: streamer siderne og stopper så snart stop_when(tekst indtil nu)
+    er sand — fx når adressen er fundet. Delvis tekst gemmes ikke i cachen.
+    """
+    use_cache = os.getenv("TEXT_CACHE", "1") == "1"
+    if use_cache:
+        sha = sha or sha256_file(pdf_path)
+        cached = text_cache.get(sha, EXTRACTOR_VERSION)
+        if cached is not None:
+            return cached
+
+    if stop_when is not None and PDF_ENGINE != "legacy":
+        parts: list[str] = []
+        try:
+            for _i, t, _engine in iter_pdf_pages(pdf_path):
+                parts.append(t)
+                if stop_when("\n".join(parts)):
+                    return "\n".join(parts).strip()
+            text = "\n".join(parts).strip()
+        except Exception:
+            text = _extract_text_legacy(pdf_path)
+    else:
+        text = _extract_text(pdf_path)
+
+    if use_cache:
+        text_cache.put(sha, EXTRACTOR_VERSION, text)
+    return text
+
+def cached_text(sha: str) -> str | None:
+    """Tekst fra cachen for (sha, EXTRACTOR_VERSION), eller None."""
+    if os.getenv("TEXT_CACHE", "1") != "1":
+        return None
+    return text_cache.get(sha, EXTRACTOR_VERSION)
+
+def remember_text(sha: str, text: str) -> None:
+    if os.getenv("TEXT_CACHE", "1") == "1":
+        text_cache.put(sha, EXTRACTOR_VERSION, text)
+
+def extract_uncached(pdf_path: Path) -> str:
+    """Ren udtræk uden cache — det workers i en process-pool skal køre."""
+    return _extract_text(pdf_path)
+
+def extract_texts(
+    items: list[tuple[Path, str | None]],
+    workers: int | None = None,
+    timeout: float | None = None,
+) -> list[str]:
+    """
+    Udtræk tekst fra mange PDF'er. items = [(sti, sha256 eller None), ...].
+    Resultatet har samme rækkefølge som items ("" for en PDF der fejlede).
+    Se extract_stream for workers/timeout.
+    """
+    _key, texts, _ok = next(extract_stream([(None, items)], workers, timeout))
+    return texts
+
+def extract_stream(
+    groups: Iterable[tuple[T, list[tuple[Path, str | None]]]],
+    workers: int | None = None,
+    timeout: float | None = None,
+) -> Iterator[tuple[T, list[str], bool]]:
+    """
+    Udtræk tekst gruppe for gruppe (typisk én gruppe = én mails PDF'er).
+    groups = [(nøgle, [(sti, sha256 eller None), ...]), ...] — må være en
+    generator (fx downloads), der kun læses så langt frem som nødvendigt.
+    Giver (nøgle, tekster, ok) i samme rækkefølge som groups, så snart
+    gruppens tekster er klar — kalderen kan gemme hver mail med det samme.
+    ok er False hvis en af PDF'erne fejlede (teksten er så "").
+
+    workers (EXTRACT_WORKERS, default 0): 0 = i denne proces, én ad gangen.
+    >0 = cache-misses parses i en process-pool med højst 2 × workers PDF'er
+    undervejs. En PDF der hænger eller crasher sin worker opgives efter
+    timeout sekunder (EXTRACT_TIMEOUT_SECONDS, default 60): poolen
+    termineres og de andre igangværende PDF'er køres videre i en ny.
+    """
+    if workers is None:
+        workers = int(os.getenv("EXTRACT_WORKERS", "0") or "0")
+    if timeout is None:
+        timeout = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "60") or "60")
+
+    if workers <= 0:
+        for key, items in groups:
+            yield key, [extract_text_from_pdf(p, sha=h) for p, h in items], True
+        return
+
+    stream = ExtractPool(workers, timeout)
+    window: deque[tuple[T, list[_Slot]]] = deque()
+    it = iter(groups)
+    exhausted = False
+    try:
+        while True:
+            # Fyld vinduet op (download/hash af de næste mails sker her)
+            # (cache-hits fylder ikke poolen, så vinduet er også begrænset i antal grupper)
+            while not exhausted and (
+                not window or (len(stream.pending) < 2 * workers and len(window) < 4 * workers)
+            ):
+                nxt = next(it, None)
+                if nxt is None:
+                    exhausted = True
+                    break
+                key, items = nxt
+                window.append((key, [stream.submit(p, h) for p, h in items]))
+            if not window:
+                return
+            key, slots = window.popleft()
+            done = [stream.result(slot) for slot in slots]
+            yield key, [text for text, _ok in done], all(ok for _text, ok in done)
+    finally:
+        stream.close()
+
+class _Slot:
+    __slots__ = ("path", "sha", "job", "started", "text", "ok", "done")
+
+    def __init__(self, path: Path, sha: str):
+        self.path, self.sha = path, sha
+        self.job = None
+        self.started = 0.0  # time.monotonic() ved (gen)afsendelse til poolen
+        self.text, self.ok, self.done = "", False, False
+
+class ExtractPool:
+    """
+    Process-pool (spawn) til extract_stream og asyncio-udgaven af stage A.
+    Hver PDF er sit eget job; ved timeout termineres hele poolen (den eneste
+    måde at stoppe en hængende worker på — en worker der crasher erstattes
+    af poolen, og dens job ender også i timeout), og de jobs der ikke var
+    færdige sendes til en ny pool.
+    """
+
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self.ctx = multiprocessing.get_context("spawn")
+        self.pool = None
+        self.pending: list[_Slot] = []
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = self.ctx.Pool(processes=self.workers)
+        return self.pool
+
+    def submit(self, path: Path, sha: str | None) -> _Slot:
+        slot = _Slot(path, sha or sha256_file(path))
+        cached = cached_text(slot.sha)
+        if cached is not None:
+            slot.text, slot.ok, slot.done = cached, True, True
+            return slot
+        self._send(slot)
+        self.pending.append(slot)
+        return slot
+
+    def _send(self, slot: _Slot) -> None:
+        slot.job = self._pool().apply_async(_extract_text, (str(slot.path),))
+        slot.started = time.monotonic()
+
+    def result(self, slot: _Slot, timeout: float | None = None) -> tuple[str, bool]:
+        """(tekst, ok) — venter højst timeout (default self.timeout) sekunder."""
+        if not slot.done:
+            try:
+                slot.text = slot.job.get(timeout=self.timeout if timeout is None else timeout)
+                slot.ok = True
+                remember_text(slot.sha, slot.text)
+            except _PoolTimeout:
+                print(f"[EXTRACT] Timeout efter {self.timeout:.0f}s: {slot.path}")
+                self.pending.remove(slot)
+                self._restart()
+            except Exception as e:
+                print(f"[EXTRACT] Fejl i {slot.path}: {e}")
+            slot.done = True
+            if slot in self.pending:
+                self.pending.remove(slot)
+        return slot.text, slot.ok
+
+    def _restart(self) -> None:
+        self.close()
+        for slot in self.pending:
+            # færdige resultater overlever terminate; resten køres om
+            if not (slot.job.ready() and slot.job.successful()):
+                self._send(slot)
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+def _extract_text(pdf_path: Path) -> str:
+    if PDF_ENGINE == "legacy":
+        return _extract_text_legacy(pdf_path)
+    try:
+        return "\n".join(t for _i, t, _engine in iter_pdf_pages(pdf_path)).strip()
+    except Exception:
+        # Fejl uden for de enkelte sider (fx et ødelagt sidetræ): den gamle
+        # motor sluger alle fejl og giver i værste fald "" — ingen crash i stage A
+        return _extract_text_legacy(pdf_path)
+
+def iter_pdf_pages(pdf_path: Path) -> Iterator[tuple[int, str, str]]:
+    """
+    Adaptiv udtræk side for side: (sidenr, tekst, "pymupdf"|"pdfplumber").
+
+    PyMuPDF's tekstlag er hurtigt og bruges først. pdfplumber (layout-analyse,
+    langsom) åbnes kun hvis en side er tom/næsten tom, eller hvis siden har
+    tekstblokke side om side (tabeller/kolonner), hvor pdfplumber giver en
+    bedre læserækkefølge.
+
+    En side der ikke kan læses giver "" (som den gamle motor) i stedet for
+    at stoppe dokumentet.
+    """
+    try:
+        import fitz
+        doc = fitz.open(str(pdf_path))
+    except Exception:
+        # PyMuPDF mangler eller kan ikke åbne filen — prøv pdfplumber på det hele
+        for i, t in _plumber_pages(pdf_path):
+            yield i, t, "pdfplumber"
+        return
+
+    plumber = None
+    try:
+        for i, page in enumerate(doc):
+            try:
+                text = page.get_text("text") or ""
+            except Exception:
+                text = ""
+            if len(text.strip()) >= MIN_PAGE_CHARS and not _layout_matters(page):
+                yield i, text, "pymupdf"
+                continue
+
+            if plumber is None:
+                plumber = _open_plumber(pdf_path)
+            alt = ""
+            if plumber is not None:
+                try:
+                    alt = plumber.pages[i].extract_text() or ""
+                except Exception:
+                    alt = ""
+            if alt.strip():
+                yield i, alt, "pdfplumber"
+            else:
+                yield i, text, "pymupdf"
+    finally:
+        doc.close()
+        if plumber is not None:
+            plumber.close()
+
+def _open_plumber(pdf_path: Path):
+    try:
+        import pdfplumber
+        return pdfplumber.open(str(pdf_path))
+    except Exception:
+        return None
+
+def _plumber_pages(pdf_path: Path) -> Iterator[tuple[int, str]]:
+    pdf = _open_plumber(pdf_path)
+    if pdf is None:
+        return
+    with pdf:
+        for i, page in enumerate(pdf.pages):
+            try:
+                text = page.extract_text() or ""
+            except Exception:
+                text = ""
+            yield i, text
+
+def _layout_matters(page) -> bool:
+    """
+    True hvis to tekstblokke ligger ved siden af hinanden (overlap lodret,
+    adskilt vandret) — typisk tabel eller flere kolonner. False hvis
+    blokkene ikke kan læses.
+    """
+    try:
+        blocks = sorted(
+            (b for b in page.get_text("blocks") if b[6] == 0 and b[4].strip()),
+            key=lambda b: b[1],
+        )
+    except Exception:
+        return False
+    for n, a in enumerate(blocks):
+        ah = a[3] - a[1]
+        for b in blocks[n + 1:]:
+            if b[1] >= a[3]:
+                break  # sorteret på y0 — resten ligger under a
+            overlap = min(a[3], b[3]) - b[1]
+            if overlap > 0.5 * min(ah, b[3] - b[1]) and (b[0] >= a[2] or a[0] >= b[2]):
+                return True
+    return False
+
+def _extract_text_legacy(pdf_path: Path) -> str:
     text = ""
 
     # 1) pdfplumber (god til tekstlag)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import csv
+import math
+import re
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+# ---------------------------------------------------------------------------
+# Offline postnummer-opslag (zone / region / koordinater)
+#
+# Tabellen ligger i data/dk_postcodes.csv ved siden af dette modul. Hver
+# række dækker et interval af postnumre (til næste rækkes start), så
+# nabopostnumre som 8000/8200 havner i samme zone ("Aarhus"), mens fjerne
+# områder med samme første cifre (fx 4000 Roskilde / 4900 Nakskov) ikke gør.
+#
+# Indekset er et array('H') med 10.000 pladser: postnr -> rækkenummer + 1
+# (0 = ukendt). Opslag er ét array-indeks — ingen regex, ingen søgning.
+# Koordinater er omtrentlige by-centroider (til zoner og km-overslag).
+# ---------------------------------------------------------------------------
+
+DATA_PATH = Path(__file__).parent / "data" / "dk_postcodes.csv"
+
+# "8000 Aarhus C" foretrækkes frem for et vilkårligt 4-cifret tal (husnr., årstal)
+_PC_CITY_RE = re.compile(r"(?<!\d)(\d{4})\s+[^\W\d_]")
+_PC_RE = re.compile(r"\b(\d{4})\b")
+
+
+@dataclass(frozen=True)
+class PostcodeInfo:
+    code_from: int
+    code_to: int      # inklusiv
+    city: str
+    region: str
+    zone: str
+    lat: float
+    lon: float
+
+
+_rows: list[PostcodeInfo] | None = None
+_index: array | None = None
+
+
+def _load() -> tuple[list[PostcodeInfo], array]:
+    global _rows, _index
+    if _index is not None:
+        return _rows, _index
+
+    with DATA_PATH.open(encoding="utf-8", newline="") as f:
+        lines = [l for l in f if l.strip() and not l.startswith("#")]
+    raw = sorted(csv.DictReader(lines), key=lambda r: int(r["postnr"]))
+
+    rows: list[PostcodeInfo] = []
+    index = array("H", bytes(2 * 10000))
+    for i, r in enumerate(raw):
+        start = int(r["postnr"])
+        end = int(raw[i + 1]["postnr"]) - 1 if i + 1 < len(raw) else 9999
+        if not r["zone"]:
+            continue  # fx 3800-3999 (Færøerne/Grønland) — ikke et arbejdsområde
+        rows.append(PostcodeInfo(
+            start, end, r["by"], r["region"], r["zone"], float(r["lat"]), float(r["lon"]),
+        ))
+        index[start:end + 1] = array("H", [len(rows)]) * (end + 1 - start)
+
+    _rows, _index = rows, index
+    return rows, index
+
+
+def lookup(postcode: int | str | None) -> PostcodeInfo | None:
+    if postcode is None:
+        return None
+    try:
+        pc = int(postcode)
+    except ValueError:
+        return None
+    if not 0 <= pc < 10000:
+        return None
+    rows, index = _load()
+    i = index[pc]
+    return rows[i - 1] if i else None
+
+
+def postcode_of(address: str | None) -> str | None:
+    if not address:
+        return None
+    m = _PC_CITY_RE.search(address) or _PC_RE.search(address)
+    return m.group(1) if m else None
+
+
+@lru_cache(maxsize=4096)
+def locate(address: str | None) -> PostcodeInfo | None:
+    return lookup(postcode_of(address))
+
+
+def zone_of(address: str | None) -> str | None:
+    info = locate(address)
+    return info.zone if info else None
+
+
+def region_of(address: str | None) -> str | None:
+    info = locate(address)
+    return info.region if info else None
+
+
+def coords_of(address: str | None) -> tuple[float, float] | None:
+    info = locate(address)
+    return (info.lat, info.lon) if info else None
+
+
+def distance_km(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Luftlinje (haversine) mellem to (lat, lon)."""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def zones() -> list[str]:
+    return sorted({r.zone for r in _load()[0]})
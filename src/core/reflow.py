@@ -0,0 +1,176 @@
+from __future__ import annotations
+import heapq
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+# ---------------------------------------------------------------------------
+# Skub planlagte blokke når én blok flyttes (forsinkelse via /delay i app.py)
+#
+# Blokkene er dicts som i task["plan"]["blocks"]: {label, start, end, kind}.
+# Ressourcen er label ("TØMRER", "MALER (PAINTER_2)") — samme label = samme
+# person. Når en blok flyttes, skubbes kun det der afhænger af den:
+#   - samme task, senere fag: tømrer -> maler -> rengøring (maleren kan
+#     ikke starte før tømreren er færdig)
+#   - samme ressource: efterfølgende blokke der nu overlapper
+# Skubbede blokke flyttes kun senere, beholder deres længde og lægges inden
+# for arbejdstiden (passer blokken ikke i resten af dagen, flyttes den til
+# næste morgen). Kun berørte blokke røres — resten af horisonten er uændret.
+#
+# Den flyttede blok selv kan også rykkes tidligere. Den startes dog aldrig
+# før tidligere fag på samme task er færdige, og den flyttes frem i
+# ressourcens rækkefølge. Blokke foran den, der nu overlapper den,
+# skubbes til efter den.
+# ---------------------------------------------------------------------------
+
+# Rækkefølge af fag på samme task
+STAGE = {"carpenter": 0, "painter": 1, "cleaning": 2}
+
+
+@dataclass
+class Moved:
+    task_id: str
+    label: str
+    kind: str
+    old_start: datetime
+    old_end: datetime
+    new_start: datetime
+    new_end: datetime
+
+    def describe(self) -> str:
+        return (
+            f"{self.task_id} [{self.label}] {self.old_start:%Y-%m-%d %H:%M} -> "
+            f"{self.new_start:%Y-%m-%d %H:%M}-{self.new_end:%H:%M}"
+        )
+
+
+def _hm(s: str) -> tuple[int, int]:
+    hh, mm = s.split(":")
+    return int(hh), int(mm)
+
+
+class _Block:
+    __slots__ = ("task_id", "d", "start", "end", "old_start", "old_end", "resource", "stage")
+
+    def __init__(self, task_id: str, d: dict):
+        self.task_id = task_id
+        self.d = d
+        self.start = self.old_start = datetime.fromisoformat(d["start"])
+        self.end = self.old_end = datetime.fromisoformat(d["end"])
+        self.resource = d.get("label") or d.get("kind") or ""
+        self.stage = STAGE.get(d.get("kind") or "", 1)
+
+
+def _move_forward(lst: list[_Block], target: _Block, start: datetime, key: dict[int, datetime]) -> None:
+    """
+    target rykkes tidligere til start: flyt den frem i lst (sorteret på
+    old_start) og læg de blokke foran den der slutter efter start — dem den
+    nu overlapper — lige efter den, så de skubbes når target behandles.
+    """
+    lst.remove(target)
+    k = bisect_left(lst, start, key=lambda b: b.old_start)
+    j = k
+    while j > 0 and lst[j - 1].old_end > start:  # blokkene på én ressource overlapper ikke
+        j -= 1
+    lst[j:k] = [target, *lst[j:k]]
+    for b in lst[j:k + 1]:
+        key[id(b)] = start
+
+
+def reflow(
+    plans: dict[str, list[dict]],
+    task_id: str,
+    kind: str,
+    new_start: datetime,
+    minutes: int | None = None,
+    workday_start: str = "07:00",
+    workday_end: str = "15:00",
+) -> list[Moved]:
+    """
+    Flyt task_id's første blok af kind til new_start (varighed minutes, ellers
+    uændret) og skub de blokke der afhænger af den. plans: task_id -> blokke
+    (rettes på stedet). Returnerer de flyttede blokke, den flyttede først.
+    """
+    ws, we = _hm(workday_start), _hm(workday_end)
+
+    by_resource: dict[str, list[_Block]] = {}
+    by_task: dict[str, list[_Block]] = {}
+    for tid, bl in plans.items():
+        for d in bl:
+            if not d.get("start") or not d.get("end"):
+                continue
+            b = _Block(tid, d)
+            by_resource.setdefault(b.resource, []).append(b)
+            by_task.setdefault(tid, []).append(b)
+    for lst in by_resource.values():
+        lst.sort(key=lambda b: (b.old_start, b.old_end))
+    target = next(
+        (b for b in sorted(by_task.get(task_id, []), key=lambda b: b.old_start) if b.d.get("kind") == kind),
+        None,
+    )
+    if target is None:
+        return []
+
+    def fit_day(start: datetime, duration: timedelta) -> datetime:
+        day_start = start.replace(hour=ws[0], minute=ws[1], second=0, microsecond=0)
+        day_end = start.replace(hour=we[0], minute=we[1], second=0, microsecond=0)
+        if start < day_start:
+            start = day_start
+        if start + duration > day_end and duration <= day_end - day_start:
+            start = day_start + timedelta(days=1)
+        return start
+
+    changed: list[_Block] = []
+
+    def move(b: _Block, start: datetime, duration: timedelta) -> None:
+        if b.start == b.old_start and b.end == b.old_end:
+            changed.append(b)
+        b.start, b.end = start, start + duration
+        heapq.heappush(heap, (b.start, id(b), b))
+
+    duration = timedelta(minutes=minutes) if minutes else target.old_end - target.old_start
+    # ikke før tidligere fag på samme task er færdige (tømrer før maler)
+    ready = max((y.end for y in by_task[task_id] if y.stage < target.stage), default=new_start)
+    if ready > new_start:
+        new_start = fit_day(ready, duration)
+
+    # Rækkefølgen pr. ressource (scan-nøgle = oprindelig start). Rykkes blokken
+    # tidligere, flyttes den frem i sin ressources liste, og blokke foran den
+    # der overlapper den nye start, lægges lige efter den (nøgle = ny start).
+    key: dict[int, datetime] = {}
+    if new_start < target.old_start:
+        _move_forward(by_resource[target.resource], target, new_start, key)
+    order_key = {id(b): i for lst in by_resource.values() for i, b in enumerate(lst)}
+
+    heap: list[tuple[datetime, int, _Block]] = []
+    move(target, new_start, duration)
+
+    while heap:
+        _s, _i, x = heapq.heappop(heap)
+        if _s != x.start:
+            continue  # forældet — blokken er flyttet igen siden
+        deps: list[_Block] = []
+        # samme ressource: efterfølgere i rækkefølgen der nu overlapper (listen er
+        # sorteret på nøglen, og skubbede blokke flyttes kun senere end den — så
+        # ingen efter første nøgle >= x.end kan overlappe)
+        lst = by_resource[x.resource]
+        i = order_key[id(x)] + 1
+        while i < len(lst) and key.get(id(lst[i]), lst[i].old_start) < x.end:
+            deps.append(lst[i])
+            i += 1
+        # samme task, senere fag
+        for y in by_task[x.task_id]:
+            if y.stage > x.stage and y.start < x.end:
+                deps.append(y)
+        for y in deps:
+            if y.start < x.end:
+                move(y, fit_day(x.end, y.end - y.start), y.end - y.start)
+
+    moved = []
+    for b in changed:
+        if b.start == b.old_start and b.end == b.old_end:
+            continue
+        b.d["start"] = b.start.isoformat(timespec="seconds")
+        b.d["end"] = b.end.isoformat(timespec="seconds")
+        moved.append(Moved(b.task_id, b.resource, b.d.get("kind") or "", b.old_start, b.old_end, b.start, b.end))
+    return moved
@@ -1,15 +1,108 @@
 from __future__ import annotations
-import re
+import math
+import os
+from functools import lru_cache
+
+from src.core.postcodes import distance_km, lookup, postcode_of, zone_of
 
 def postal_code(address: str | None) -> str | None:
-    if not address:
-        return None
-    m = re.search(r"\b(\d{4})\b", address)
-    return m.group(1) if m else None
+    return postcode_of(address)
 
 def route_bucket(address: str | None) -> str:
-    # Ultra MVP: bucket på første 1-2 cifre i postnr (giver “nord/syd-ish” i DK)
+    # Zone fra postnummer-tabellen (src/core/data/dk_postcodes.csv);
+    # postnr uden for tabellen falder tilbage til de to første cifre
     pc = postal_code(address)
     if not pc:
         return "UNK"
-    return pc[:2]
+    return zone_of(address) or pc[:2]
+
+
+# ---------------------------------------------------------------------------
+# Kørsel mellem adresser (offline, postnummer-centroider)
+#
+# Afstande er luftlinje mellem postnumrenes centroider (dk_postcodes.csv)
+# gange ROAD_FACTOR, slået op i en cache pr. postnummer-par. Kørselstid =
+# km / TRAVEL_KMH + TRAVEL_MIN_MINUTES (pak sammen/parkering), rundet op
+# til 5 min. Samme adresse = 0. TRAVEL_KMH=0 slår kørsel fra.
+#
+# sequence() ordner en dags besøg: nearest neighbour fra startpunktet og
+# derefter 2-opt (vend delstykker så længe ruten bliver kortere). Dagene
+# har få besøg, så en fuld 2-opt-runde er billig.
+# ---------------------------------------------------------------------------
+
+ROAD_FACTOR = 1.3
+TRAVEL_KMH = float(os.getenv("TRAVEL_KMH", "50") or "0")
+TRAVEL_MIN_MINUTES = int(os.getenv("TRAVEL_MIN_MINUTES", "10") or "0")
+
+
+@lru_cache(maxsize=65536)
+def _pc_km(a: str, b: str) -> float | None:
+    ia, ib = lookup(a), lookup(b)
+    if ia is None or ib is None:
+        return None
+    if ia is ib:
+        return 0.0
+    return distance_km((ia.lat, ia.lon), (ib.lat, ib.lon)) * ROAD_FACTOR
+
+
+def travel_km(a: str | None, b: str | None) -> float:
+    """Vej-km mellem to adresser (0 hvis en af dem ikke kan slås op)."""
+    pa, pb = postcode_of(a), postcode_of(b)
+    if not pa or not pb:
+        return 0.0
+    if pa > pb:
+        pa, pb = pb, pa
+    return _pc_km(pa, pb) or 0.0
+
+
+def travel_minutes(a: str | None, b: str | None) -> int:
+    """Buffer mellem et job på a og næste job på b."""
+    if TRAVEL_KMH <= 0 or not a or not b or a == b:
+        return 0
+    minutes = travel_km(a, b) / TRAVEL_KMH * 60 + TRAVEL_MIN_MINUTES
+    return int(math.ceil(minutes / 5) * 5)
+
+
+def route_km(stops: list[str | None], start: str | None = None, end: str | None = None) -> float:
+    path = ([start] if start else []) + list(stops) + ([end] if end else [])
+    return sum(travel_km(a, b) for a, b in zip(path, path[1:]))
+
+
+def sequence(stops: list[str | None], start: str | None = None, end: str | None = None) -> list[int]:
+    """
+    Rækkefølge (indeks i stops) der gør ruten start -> stops -> end kort:
+    nearest neighbour + 2-opt. start/end er faste endepunkter (fx et job der
+    fortsætter fra i går / fortsætter i morgen) og kan være None.
+    """
+    n = len(stops)
+    if n <= 1:
+        return list(range(n))
+
+    # nearest neighbour
+    left = set(range(n))
+    order: list[int] = []
+    cur = start if start else None
+    while left:
+        if cur is None:
+            nxt = min(left)  # uden startpunkt: første i den nuværende rækkefølge
+        else:
+            nxt = min(left, key=lambda i: (travel_km(cur, stops[i]), i))
+        order.append(nxt)
+        left.remove(nxt)
+        cur = stops[nxt]
+
+    # 2-opt på stien (endepunkter start/end holdes faste)
+    def path_len(o: list[int]) -> float:
+        return route_km([stops[i] for i in o], start, end)
+
+    best = path_len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                cand = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                length = path_len(cand)
+                if length < best - 1e-9:
+                    order, best, improved = cand, length, True
+    return order
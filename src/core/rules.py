@@ -1,6 +1,20 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from src.core.parsing import extract_sqm, extract_rooms
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from functools import partial
+from typing import Any, Iterable
+from src.core.models import TaskAnalysis, TaskFeatures, TaskRecord
+from src.core.parsing import PARSER_VERSION, extract_features
+from src.core.storage import task_text
+from src.core.trades import TradeHit, detect_trades, load_trades
+
+# Tælles op hvis formlen i estimate_minutes() ændres
+ESTIMATE_VERSION = "1"
 
 @dataclass
 class Analysis:
@@ -8,36 +22,226 @@ class Analysis:
     sqm: float | None
     rooms: int | None
     estimated_minutes: int
-
-# Alle varianter vi har set i PDF'er (med/uden stavefejl, med/uden æøå)
-_CARPENTER_KEYWORDS = [
-    "tømrerarbejde",
-    "toemrerarbejde",
-    "tømrer arbejde",
-    "tømrer",         # bred match — fanger "tømrer skal", "kræver tømrer" osv.
-    "tømrermester",
-    # Gamle stavefejl fra tidligere version — beholdes for sikkerhedsskyld
-    "tømmerarbejde",
-    "toemmerarbejde",
-]
+    trades: dict[str, bool] = field(default_factory=dict)
+    trade_hits: list[TradeHit] = field(default_factory=list)
+    deadline: str | None = None
 
 def needs_carpenter(text: str) -> bool:
-    t = text.lower()
-    return any(kw in t for kw in _CARPENTER_KEYWORDS)
+    return detect_trades(text)["carpenter"]
 
 
 def analyze(text: str, minutes_per_sqm: int, setup_minutes: int, fallback_minutes: int) -> Analysis:
-    sqm = extract_sqm(text)
-    rooms = extract_rooms(text)
+    f = extract_features(text)
+    return Analysis(
+        needs_carpenter=f.needs_carpenter,
+        sqm=f.sqm,
+        rooms=f.rooms,
+        estimated_minutes=estimate_minutes(f.sqm, minutes_per_sqm, setup_minutes, fallback_minutes),
+        trades=f.trades,
+        trade_hits=f.trade_hits,
+        deadline=f.deadline,
+    )
+
 
+def estimate_minutes(sqm: float | None, minutes_per_sqm: int, setup_minutes: int, fallback_minutes: int) -> int:
     if sqm is None:
-        est = setup_minutes + fallback_minutes
-    else:
-        est = setup_minutes + int(round(sqm * minutes_per_sqm))
+        return setup_minutes + fallback_minutes
+    return setup_minutes + int(round(sqm * minutes_per_sqm))
 
-    return Analysis(
-        needs_carpenter=needs_carpenter(text),
-        sqm=sqm,
-        rooms=rooms,
-        estimated_minutes=est,
+
+@dataclass
+class BatchStats:
+    count: int = 0
+    seconds: float = 0.0
+    workers: int = 0
+    # felt -> antal analyser hvor feltet blev fundet / er sandt
+    hits: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        rate = self.count / self.seconds if self.seconds else 0.0
+        fields = ", ".join(
+            f"{k} {100 * v / self.count:.0f}%" for k, v in self.hits.items()
+        ) if self.count else "-"
+        return (
+            f"{self.count} tasks på {self.seconds:.2f}s ({rate:.0f}/s, workers={self.workers}) | "
+            f"fundet: {fields}"
+        )
+
+
+def _text_of(item: Any) -> str:
+    # rå tekst, task-dict eller TaskRecord
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return task_text(item)
+    return getattr(item, "text_raw", "") or ""
+
+
+def analyze_many(
+    items: Iterable[Any],
+    minutes_per_sqm: int,
+    setup_minutes: int,
+    fallback_minutes: int,
+    workers: int | None = None,
+    chunksize: int | None = None,
+) -> tuple[list[Analysis], BatchStats]:
+    """
+    analyze() på mange tekster/tasks. Resultaterne har samme rækkefølge som items.
+
+    workers (ANALYZE_WORKERS, default 0): 0 = i denne proces.
+    >0 = teksterne deles i bidder (chunksize) over en process-pool —
+    til at gen-estimere en stor backlog efter en config-/parser-ændring.
+    """
+    if workers is None:
+        workers = int(os.getenv("ANALYZE_WORKERS", "0") or "0")
+    texts = [_text_of(x) for x in items]
+    fn = partial(
+        analyze,
+        minutes_per_sqm=minutes_per_sqm,
+        setup_minutes=setup_minutes,
+        fallback_minutes=fallback_minutes,
     )
+
+    t0 = time.perf_counter()
+    # Under et par hundrede tekster æder opstarten af poolen gevinsten
+    if workers <= 0 or len(texts) < 200:
+        workers = 0
+        results = [fn(t) for t in texts]
+    else:
+        if chunksize is None:
+            chunksize = max(1, min(256, len(texts) // (workers * 4)))
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(processes=workers) as pool:
+            results = pool.map(fn, texts, chunksize=chunksize)
+
+    stats = BatchStats(count=len(results), seconds=time.perf_counter() - t0, workers=workers)
+    stats.hits["sqm"] = sum(a.sqm is not None for a in results)
+    stats.hits["rooms"] = sum(a.rooms is not None for a in results)
+    for a in results:
+        for trade, found in a.trades.items():
+            stats.hits[trade] = stats.hits.get(trade, 0) + bool(found)
+    return results, stats
+
+
+# ---------------------------------------------------------------------------
+# Inkrementel gen-analyse
+#
+# En task har to lag, hver med et fingerprint af sine input:
+#   t.features  sqm/rooms/deadline/trades/trade_hits fra teksten
+#               fp = tekst-hash + PARSER_VERSION + fag-ordbog
+#   t.analysis  estimater afledt af features + settings
+#                  fp = features-fp + ESTIMATE_VERSION + MINUTES_PER_SQM/SETUP/FALLBACK
+#
+# refresh_analyses() genparser kun tasks hvor tekst eller parser er ændret,
+# og genberegner kun estimaterne (ren aritmetik) når settings er ændret.
+# Uændrede tasks koster to streng-sammenligninger (teksten læses ikke).
+# ---------------------------------------------------------------------------
+
+_parser_fp: str | None = None
+
+
+def text_sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parser_fingerprint() -> str:
+    """PARSER_VERSION + hash af fag-ordbogen (TRADES_FILE kan udvide den)."""
+    global _parser_fp
+    if _parser_fp is None:
+        trades = json.dumps(load_trades(), sort_keys=True, ensure_ascii=False)
+        _parser_fp = f"p{PARSER_VERSION}-{hashlib.sha256(trades.encode('utf-8')).hexdigest()[:8]}"
+    return _parser_fp
+
+
+def settings_fingerprint(minutes_per_sqm: int, setup_minutes: int, fallback_minutes: int) -> str:
+    return f"e{ESTIMATE_VERSION}-{minutes_per_sqm}/{setup_minutes}/{fallback_minutes}"
+
+
+def _hits_for_review(hits: list[TradeHit], per_trade: int = 5) -> list[dict]:
+    # hvor fag-ordene står i teksten (til manuel kontrol), max per_trade pr. fag
+    out = []
+    count: dict[str, int] = {}
+    for h in hits:
+        if count.get(h.trade, 0) < per_trade:
+            count[h.trade] = count.get(h.trade, 0) + 1
+            out.append({"trade": h.trade, "keyword": h.keyword, "start": h.start, "end": h.end})
+    return out
+
+
+@dataclass
+class RefreshStats:
+    tasks: int = 0
+    reparsed: int = 0
+    reestimated: int = 0
+    seconds: float = 0.0
+    parse: BatchStats | None = None
+
+    def summary(self) -> str:
+        s = (
+            f"{self.tasks} tasks på {self.seconds * 1000:.0f} ms | "
+            f"genparset {self.reparsed}, genberegnet {self.reestimated}"
+        )
+        if self.parse and self.parse.count:
+            s += f" | parsing: {self.parse.summary()}"
+        return s
+
+
+def refresh_analyses(
+    tasks: list[TaskRecord],
+    minutes_per_sqm: int,
+    setup_minutes: int,
+    fallback_minutes: int,
+    workers: int | None = None,
+) -> tuple[list[TaskRecord], RefreshStats]:
+    """
+    Bringer t.features og t.analysis up to date (in place).
+    Returnerer de tasks der blev ændret + statistik.
+    """
+    t0 = time.perf_counter()
+    stats = RefreshStats(tasks=len(tasks))
+    parser_fp = parser_fingerprint()
+    est_fp = settings_fingerprint(minutes_per_sqm, setup_minutes, fallback_minutes)
+
+    stale: list[TaskRecord] = []
+    stale_fps: list[str] = []
+    for t in tasks:
+        # text_sha fra stage A/storage — teksten læses kun for tasks der skal genparses
+        fp = f"{(t.text_sha or text_sha(t.text_raw))[:16]}-{parser_fp}"
+        if t.features is None or t.features.fp != fp:
+            stale.append(t)
+            stale_fps.append(fp)
+
+    if stale:
+        results, stats.parse = analyze_many(
+            stale, minutes_per_sqm, setup_minutes, fallback_minutes, workers=workers
+        )
+        for t, fp, a in zip(stale, stale_fps, results):
+            t.features = TaskFeatures(
+                fp=fp,
+                sqm=a.sqm,
+                rooms=a.rooms,
+                deadline=date.fromisoformat(a.deadline) if a.deadline else None,
+                trades=a.trades,
+                trade_hits=_hits_for_review(a.trade_hits),
+            )
+    stats.reparsed = len(stale)
+
+    changed = {t.task_id: t for t in stale}
+    for t in tasks:
+        f = t.features
+        fp = f"{f.fp}-{est_fp}"
+        if t.analysis is not None and t.analysis.fp == fp:
+            continue
+        t.analysis = TaskAnalysis(
+            needs_carpenter=bool(f.trades.get("carpenter")),
+            sqm=f.sqm,
+            rooms=f.rooms,
+            estimated_minutes=estimate_minutes(f.sqm, minutes_per_sqm, setup_minutes, fallback_minutes),
+            trades=f.trades,
+            fp=fp,
+        )
+        changed[t.task_id] = t
+        stats.reestimated += 1
+
+    stats.seconds = time.perf_counter() - t0
+    return list(changed.values()), stats
@@ -1,19 +1,117 @@
 from __future__ import annotations
+import os
 import json
 import hashlib
+import shutil
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
+from src.core import storage_sqlite, storage_journal
+
 STATE_DIR = Path("data/state")
 ATT_DIR = Path("data/inbox_attachments")
+BLOB_DIR = Path("data/blobs")
+TEXT_DIR = BLOB_DIR / "text"
 OUT_DIR = Path("data/out")
 
 STATE_DIR.mkdir(parents=True, exist_ok=True)
 ATT_DIR.mkdir(parents=True, exist_ok=True)
+BLOB_DIR.mkdir(parents=True, exist_ok=True)
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 TASKS_PATH = STATE_DIR / "tasks.json"
 SEEN_PATH = STATE_DIR / "seen.json"
+DB_PATH = STATE_DIR / "state.sqlite3"
+DELTA_PATH = STATE_DIR / "graph_delta.json"
+
+# "json" (default): tasks.json/seen.json læses og skrives i hele taget.
+# "sqlite": én række pr. task i data/state/state.sqlite3 (src/core/storage_sqlite.py).
+# "journal": append-only journal.jsonl + snapshot.json (src/core/storage_journal.py).
+def _backend() -> str:
+    return (os.getenv("STATE_BACKEND") or "json").strip().lower()
+
+# ---------------------------------------------------------------------------
+# Samlede skrivninger for JSON-backend'en (stage A's per-mail commits)
+#
+# Uden batch læser og omskriver hver upsert_tasks/update_seen hele
+# tasks.json/seen.json — O(mails × historik) I/O. Inde i batched_writes()
+# holdes begge filer i hukommelsen, og de skrives (atomisk, tasks før seen)
+# for hver JSON_FLUSH_EVERY commits og når blokken forlades — også ved en
+# exception. Et crash koster højst de sidste JSON_FLUSH_EVERY mails, og de
+# hentes igen næste kørsel (seen skrives aldrig før deres tasks).
+# sqlite/journal skriver allerede kun de nye rækker og batches ikke.
+# ---------------------------------------------------------------------------
+JSON_FLUSH_EVERY = max(1, int(os.getenv("JSON_FLUSH_EVERY", "25") or "25"))
+
+
+class _JsonBatch:
+    def __init__(self, every: int):
+        self.every = every
+        self.tasks: list[dict[str, Any]] | None = None
+        self.pos: dict[str, int] = {}
+        self.seen: dict[str, Any] | None = None
+        self.tasks_dirty = self.seen_dirty = False
+        self.commits = 0
+
+    def load_tasks(self) -> list[dict[str, Any]]:
+        if self.tasks is None:
+            # text_raw i ældre tasks flyttes ud én gang, som upsert_tasks ville gøre
+            self.set_tasks([_externalize_text(t) for t in _load_json(TASKS_PATH, default=[])])
+            self.tasks_dirty = False
+        return self.tasks
+
+    def set_tasks(self, tasks: list[dict[str, Any]]) -> None:
+        self.tasks = tasks
+        self.pos = {str(t.get("task_id")): i for i, t in enumerate(tasks)}
+        self.tasks_dirty = True
+
+    def load_seen(self) -> dict[str, Any]:
+        if self.seen is None:
+            self.seen = _load_json(SEEN_PATH, default={})
+        return self.seen
+
+    def committed(self) -> None:
+        self.commits += 1
+        if self.commits % self.every == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.tasks_dirty:
+            _save_json(TASKS_PATH, self.tasks)
+            self.tasks_dirty = False
+        if self.seen_dirty:
+            _save_json(SEEN_PATH, self.seen)
+            self.seen_dirty = False
+
+
+_batch: _JsonBatch | None = None
+
+
+@contextmanager
+def batched_writes(every: int | None = None):
+    """
+    Saml JSON-backend'ens skrivninger i blokken (se ovenfor). Indlejrede
+    kald og andre backends bruger blot den ydre / direkte skrivning.
+    """
+    global _batch
+    if _backend() != "json" or _batch is not None:
+        yield
+        return
+    _batch = _JsonBatch(every or JSON_FLUSH_EVERY)
+    try:
+        yield
+    finally:
+        batch, _batch = _batch, None
+        batch.flush()
+
+def _db():
+    return storage_sqlite.connect(DB_PATH, TASKS_PATH, SEEN_PATH)
+
+def _journal() -> storage_journal.JournalStore:
+    return storage_journal.open_store(STATE_DIR, TASKS_PATH, SEEN_PATH)
 
 def _load_json(path: Path, default):
     if not path.exists():
@@ -21,27 +119,223 @@ def _load_json(path: Path, default):
     return json.loads(path.read_text(encoding="utf-8"))
 
 def _save_json(path: Path, data) -> None:
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Skriv til temp-fil og byt ind atomisk — en afbrudt skrivning
+    # efterlader den gamle fil intakt i stedet for en halv JSON.
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 def sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
 def load_seen() -> dict[str, Any]:
+    if _backend() == "sqlite":
+        return storage_sqlite.load_seen(_db())
+    if _backend() == "journal":
+        return _journal().load_seen()
+    if _batch is not None:
+        return json.loads(json.dumps(_batch.load_seen()))  # kopi, som fra disk
     return _load_json(SEEN_PATH, default={})
 
 def save_seen(seen: dict[str, Any]) -> None:
+    if _backend() == "sqlite":
+        return storage_sqlite.save_seen(_db(), seen)
+    if _backend() == "journal":
+        return _journal().save_seen(seen)
+    if _batch is not None:
+        _batch.seen, _batch.seen_dirty = seen, True
+        return
+    _save_json(SEEN_PATH, seen)
+
+def update_seen(updates: dict[str, Any]) -> None:
+    """
+    Merger kun de nye seen-nøgler ind (besked-id'er + attachment_hashes/address_keys).
+    """
+    if _backend() == "sqlite":
+        return storage_sqlite.update_seen(_db(), updates)
+    if _backend() == "journal":
+        return _journal().update_seen(updates)
+    seen = _batch.load_seen() if _batch is not None else _load_json(SEEN_PATH, default={})
+    for k, v in updates.items():
+        if k in ("attachment_hashes", "address_keys"):
+            seen.setdefault(k, {}).update(v)
+        else:
+            seen[k] = v
+    if _batch is not None:
+        # seen opdateres sidst i en mails commit (efter dens task)
+        _batch.seen_dirty = True
+        _batch.committed()
+        return
     _save_json(SEEN_PATH, seen)
 
 def load_tasks() -> list[dict[str, Any]]:
+    if _backend() == "sqlite":
+        return storage_sqlite.load_tasks(_db())
+    if _backend() == "journal":
+        return _journal().load_tasks()
+    if _batch is not None:
+        return list(_batch.load_tasks())
     return _load_json(TASKS_PATH, default=[])
 
 def save_tasks(tasks: list[dict[str, Any]]) -> None:
+    tasks = [_externalize_text(t) for t in tasks]
+    if _backend() == "sqlite":
+        return storage_sqlite.save_tasks(_db(), tasks)
+    if _backend() == "journal":
+        return _journal().save_tasks(tasks)
+    if _batch is not None:
+        _batch.set_tasks(list(tasks))
+        return
     _save_json(TASKS_PATH, tasks)
 
-def save_attachment(message_id: str, filename: str, content: bytes) -> Path:
+def load_tasks_by_status(*statuses: str) -> list[dict[str, Any]]:
+    """
+    Kun tasks med en af de givne statusser (stage B: NEW, stage C: ANALYZED/...).
+    Gem dem igen med upsert_tasks() — save_tasks() ville slette resten.
+    """
+    if _backend() == "sqlite":
+        return storage_sqlite.load_tasks_by_status(_db(), statuses)
+    if _backend() == "journal":
+        return _journal().load_tasks_by_status(statuses)
+    wanted = set(statuses)
+    return [t for t in load_tasks() if t.get("status") in wanted]
+
+def load_task(task_id: str) -> dict[str, Any] | None:
+    if _backend() == "sqlite":
+        return storage_sqlite.load_task(_db(), task_id)
+    if _backend() == "journal":
+        return _journal().load_task(task_id)
+    return next((t for t in load_tasks() if str(t.get("task_id")) == str(task_id)), None)
+
+def upsert_tasks(tasks: list[dict[str, Any]]) -> None:
+    """
+    Indsæt/opdater de givne tasks (match på task_id). Øvrige tasks røres ikke.
+    """
+    if not tasks:
+        return
+    tasks = [_externalize_text(t) for t in tasks]
+    if _backend() == "sqlite":
+        return storage_sqlite.upsert_tasks(_db(), tasks)
+    if _backend() == "journal":
+        return _journal().upsert_tasks(tasks)
+    if _batch is not None:
+        # listen i hukommelsen rettes på stedet
+        all_tasks, pos = _batch.load_tasks(), _batch.pos
+    else:
+        all_tasks = [_externalize_text(t) for t in load_tasks()]
+        pos = {str(t.get("task_id")): i for i, t in enumerate(all_tasks)}
+    for t in tasks:
+        i = pos.get(str(t["task_id"]))
+        if i is None:
+            pos[str(t["task_id"])] = len(all_tasks)
+            all_tasks.append(t)
+        else:
+            all_tasks[i] = t
+    if _batch is not None:
+        _batch.tasks_dirty = True
+        return
+    _save_json(TASKS_PATH, all_tasks)
+
+def load_delta_link(key: str) -> str | None:
+    """Gemt Graph @odata.deltaLink (key = fx mailbox + mappe)."""
+    return _load_json(DELTA_PATH, default={}).get(key)
+
+def save_delta_link(key: str, link: str) -> None:
+    links = _load_json(DELTA_PATH, default={})
+    links[key] = link
+    _save_json(DELTA_PATH, links)
+
+# ---------------------------------------------------------------------------
+# Content-addressed blobs: data/blobs/<sha[:2]>/<sha>
+# Hver unik fil skrives én gang; mail-mapper og mail-spool er hardlinks hertil.
+# ---------------------------------------------------------------------------
+def blob_path(sha: str) -> Path:
+    return BLOB_DIR / sha[:2] / sha
+
+def put_blob(content: bytes, sha: str | None = None) -> Path:
+    sha = sha or sha256_bytes(content)
+    p = blob_path(sha)
+    if p.exists():
+        return p
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, p)
+    return p
+
+def link_or_copy(src: Path, dst: Path) -> Path:
+    """
+    Hardlink src -> dst (ingen ekstra disk/skrive-I/O). Falder tilbage til
+    kopi hvis filsystemet ikke kan (FAT, netværksdrev, på tværs af drev).
+    Findes dst allerede som samme fil, gøres intet.
+    """
+    if dst.exists():
+        if os.path.samefile(src, dst):
+            return dst
+        dst.unlink()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+    return dst
+
+def save_attachment(message_id: str, filename: str, content: bytes, sha: str | None = None) -> Path:
     safe = filename.replace("/", "_").replace("\\", "_")
     folder = ATT_DIR / message_id
-    folder.mkdir(parents=True, exist_ok=True)
-    p = folder / safe
-    p.write_bytes(content)
-    return p
+    blob = put_blob(content, sha)
+    return link_or_copy(blob, folder / safe)
+
+# ---------------------------------------------------------------------------
+# Udtrukket PDF-tekst: zlib-komprimerede blobs i data/blobs/text/<sha[:2]>/<sha>.z
+# (sha = sha256 af teksten som UTF-8). Tasks gemmer kun "text_sha"; teksten
+# hentes med task_text(t) når en stage faktisk skal bruge den.
+# Ældre tasks med "text_raw" flyttes ud ved næste save/upsert.
+# ---------------------------------------------------------------------------
+def text_blob_path(sha: str) -> Path:
+    return TEXT_DIR / sha[:2] / f"{sha}.z"
+
+def put_text(text: str) -> str:
+    raw = text.encode("utf-8")
+    sha = sha256_bytes(raw)
+    p = text_blob_path(sha)
+    if not p.exists():
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(p.name + ".tmp")
+        tmp.write_bytes(zlib.compress(raw, 6))
+        os.replace(tmp, p)
+    return sha
+
+@lru_cache(maxsize=256)
+def get_text(sha: str) -> str:
+    return zlib.decompress(text_blob_path(sha).read_bytes()).decode("utf-8")
+
+def task_text(task: dict[str, Any]) -> str:
+    """PDF-teksten for en task (inline text_raw i ældre tasks, ellers fra blob)."""
+    if "text_raw" in task:
+        return task.get("text_raw") or ""
+    sha = task.get("text_sha")
+    return get_text(sha) if sha else ""
+
+def _externalize_text(task: dict[str, Any]) -> dict[str, Any]:
+    if "text_raw" not in task:
+        return task
+    out = {k: v for k, v in task.items() if k != "text_raw"}
+    out["text_sha"] = put_text(task.get("text_raw") or "")
+    return out
+
+def externalize_texts() -> int:
+    """Flyt text_raw ud af alle gemte tasks (sqlite/journal flytter ellers kun ved næste upsert)."""
+    fat = [t for t in load_tasks() if "text_raw" in t]
+    upsert_tasks(fat)
+    return len(fat)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import atexit
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+# ---------------------------------------------------------------------------
+# Journal-motor bag src/core/storage.py (STATE_BACKEND=journal)
+# ---------------------------------------------------------------------------
+# State = snapshot.json + journal.jsonl
+#   - journal.jsonl er append-only: én linje pr. ændring, fsync'et inden
+#     append() returnerer. En halvt skrevet sidste linje (proces dræbt midt
+#     i en write) ignoreres ved load, så state er altid den sidste hele record.
+#   - snapshot.json er den komprimerede state op til et givent seq-nummer.
+#     Den skrives til en temp-fil og byttes ind med os.replace (atomisk).
+#   - Compaction kører i en baggrundstråd når journalen har fået
+#     COMPACT_EVERY nye records, og fjerner derefter de records der nu er
+#     dækket af snapshot'et.
+#
+# Record-typer:
+#   {"seq": n, "op": "task", "task": {...}}         upsert af hele task'en
+#   {"seq": n, "op": "delete", "task_id": "..."}
+#   {"seq": n, "op": "seen", "updates": {...}}      merge af seen-nøgler
+#   {"seq": n, "op": "reset_seen"}
+# ---------------------------------------------------------------------------
+
+COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "500") or "500")
+
+
+def _dumps(d: Any) -> str:
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fsync_dir(path: Path) -> None:
+    # Gør rename/truncate holdbar på POSIX. Windows understøtter ikke
+    # at åbne mapper, så der er det en no-op.
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JournalStore:
+    def __init__(self, state_dir: Path, tasks_json: Path | None = None, seen_json: Path | None = None):
+        self.journal_path = state_dir / "journal.jsonl"
+        self.snapshot_path = state_dir / "snapshot.json"
+        self._lock = threading.RLock()
+        self._compactor: threading.Thread | None = None
+
+        self.tasks: dict[str, dict[str, Any]] = {}  # task_id -> task (indsættelsesorden)
+        self.seen: dict[str, Any] = {}
+        self.seq = 0
+        self._since_compact = 0
+
+        state_dir.mkdir(parents=True, exist_ok=True)
+        fresh = not self.journal_path.exists() and not self.snapshot_path.exists()
+        self._load()
+        if fresh:
+            self._import_json(tasks_json, seen_json)
+
+    # -----------------------------------------------------------------
+    # Load: snapshot + replay af journal
+    # -----------------------------------------------------------------
+    def _load(self) -> None:
+        snap_seq = 0
+        if self.snapshot_path.exists():
+            snap = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            snap_seq = int(snap.get("seq", 0))
+            self.tasks = {str(t["task_id"]): t for t in snap.get("tasks", [])}
+            self.seen = snap.get("seen", {})
+        self.seq = snap_seq
+
+        if not self.journal_path.exists():
+            return
+
+        good_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for raw in f:
+                # Afbrudt append — alt herefter er ugyldigt
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    rec = json.loads(raw)
+                except ValueError:
+                    break
+                good_bytes += len(raw)
+                if rec["seq"] <= snap_seq:
+                    continue  # allerede i snapshot (crash mellem snapshot og truncate)
+                self._apply(rec)
+                self.seq = rec["seq"]
+                self._since_compact += 1
+
+        # Skær en evt. halv sidste linje af, så nye appends starter rent
+        if good_bytes != self.journal_path.stat().st_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _import_json(self, tasks_json: Path | None, seen_json: Path | None) -> None:
+        if tasks_json and tasks_json.exists():
+            self.upsert_tasks(json.loads(tasks_json.read_text(encoding="utf-8")))
+        if seen_json and seen_json.exists():
+            self.update_seen(json.loads(seen_json.read_text(encoding="utf-8")))
+
+    def _apply(self, rec: dict[str, Any]) -> None:
+        op = rec["op"]
+        if op == "task":
+            t = rec["task"]
+            self.tasks[str(t["task_id"])] = t
+        elif op == "delete":
+            self.tasks.pop(str(rec["task_id"]), None)
+        elif op == "seen":
+            for k, v in rec["updates"].items():
+                if k in ("attachment_hashes", "address_keys"):
+                    self.seen.setdefault(k, {}).update(v)
+                else:
+                    self.seen[k] = v
+        elif op == "reset_seen":
+            self.seen = {}
+
+    # -----------------------------------------------------------------
+    # Append
+    # -----------------------------------------------------------------
+    def _append(self, recs: list[dict[str, Any]]) -> None:
+        if not recs:
+            return
+        with self._lock:
+            lines = []
+            for rec in recs:
+                self.seq += 1
+                rec["seq"] = self.seq
+                lines.append(_dumps(rec) + "\n")
+            # Én write + fsync pr. batch: enten lander hele linjer, eller den
+            # sidste er halv og bliver skåret af ved næste load.
+            with open(self.journal_path, "ab") as f:
+                f.write("".join(lines).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            # Anvend de serialiserede records, så indekset ikke deler
+            # objekter med kalderen
+            for line in lines:
+                self._apply(json.loads(line))
+            self._since_compact += len(recs)
+            if self._since_compact >= COMPACT_EVERY:
+                self.compact_async()
+
+    def upsert_tasks(self, tasks: Iterable[dict[str, Any]]) -> None:
+        self._append([{"op": "task", "task": t} for t in tasks])
+
+    def save_tasks(self, tasks: list[dict[str, Any]]) -> None:
+        keep = {str(t["task_id"]) for t in tasks}
+        with self._lock:
+            recs = [{"op": "delete", "task_id": tid} for tid in self.tasks if tid not in keep]
+            recs += [{"op": "task", "task": t} for t in tasks if self.tasks.get(str(t["task_id"])) != t]
+            self._append(recs)
+
+    def update_seen(self, updates: dict[str, Any]) -> None:
+        if updates:
+            self._append([{"op": "seen", "updates": updates}])
+
+    def save_seen(self, seen: dict[str, Any]) -> None:
+        self._append([{"op": "reset_seen"}, {"op": "seen", "updates": seen}])
+
+    # -----------------------------------------------------------------
+    # Læsning (kopier, så kaldere ikke ændrer indekset direkte)
+    # -----------------------------------------------------------------
+    def load_tasks(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return json.loads(_dumps(list(self.tasks.values())))
+
+    def load_task(self, task_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            t = self.tasks.get(str(task_id))
+            return json.loads(_dumps(t)) if t is not None else None
+
+    def load_tasks_by_status(self, statuses: Iterable[str]) -> list[dict[str, Any]]:
+        wanted = set(statuses)
+        with self._lock:
+            return json.loads(_dumps([t for t in self.tasks.values() if t.get("status") in wanted]))
+
+    def load_seen(self) -> dict[str, Any]:
+        with self._lock:
+            return json.loads(_dumps(self.seen))
+
+    # -----------------------------------------------------------------
+    # Compaction
+    # -----------------------------------------------------------------
+    def compact(self) -> None:
+        with self._lock:
+            seq = self.seq
+            snap = _dumps({"seq": seq, "tasks": list(self.tasks.values()), "seen": self.seen})
+            self._since_compact = 0
+
+        # Snapshot skrives uden lås — appends kan fortsætte imens
+        tmp = self.snapshot_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(snap)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        _fsync_dir(self.snapshot_path.parent)
+
+        # Behold kun records nyere end snapshot'et
+        with self._lock:
+            tail: list[bytes] = []
+            if self.journal_path.exists():
+                with open(self.journal_path, "rb") as f:
+                    tail = [raw for raw in f if json.loads(raw)["seq"] > seq]
+            tmp = self.journal_path.with_suffix(".jsonl.tmp")
+            with open(tmp, "wb") as f:
+                f.writelines(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal_path)
+            _fsync_dir(self.journal_path.parent)
+
+    def compact_async(self) -> None:
+        with self._lock:
+            if self._compactor and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, name="journal-compact")
+            self._compactor.start()
+
+    def wait(self) -> None:
+        t = self._compactor
+        if t:
+            t.join()
+
+
+_stores: dict[Path, JournalStore] = {}
+
+
+def open_store(state_dir: Path, tasks_json: Path | None = None, seen_json: Path | None = None) -> JournalStore:
+    store = _stores.get(state_dir)
+    if store is None:
+        store = _stores[state_dir] = JournalStore(state_dir, tasks_json, seen_json)
+        atexit.register(store.wait)
+    return store
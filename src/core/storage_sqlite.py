@@ -0,0 +1,209 @@
+from __future__ import annotations
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Iterable
+
+# ---------------------------------------------------------------------------
+# SQLite-motor bag src/core/storage.py (STATE_BACKEND=sqlite)
+# ---------------------------------------------------------------------------
+# Samme API som JSON-filerne (load_tasks/save_tasks/load_seen/save_seen),
+# men hver task er én række, så stage B/C kan hente kun de statusser de
+# skal bruge, og gemme med upsert pr. række i stedet for at skrive alt.
+# Hele task-dict'en ligger som JSON i kolonnen "data"; de felter vi
+# søger på er trukket ud i egne, indekserede kolonner.
+# ---------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id           TEXT PRIMARY KEY,
+    source_message_id TEXT,
+    status            TEXT,
+    received_at       TEXT,
+    data              TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS ix_tasks_received_at ON tasks(received_at);
+CREATE INDEX IF NOT EXISTS ix_tasks_source_message_id ON tasks(source_message_id);
+
+CREATE TABLE IF NOT EXISTS seen_messages (
+    message_id TEXT PRIMARY KEY,
+    data       TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS attachment_hashes (
+    sha256     TEXT PRIMARY KEY,
+    message_id TEXT,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_attachment_hashes_message_id ON attachment_hashes(message_id);
+
+CREATE TABLE IF NOT EXISTS address_keys (
+    address_key TEXT PRIMARY KEY,
+    task_id     TEXT,
+    data        TEXT NOT NULL
+);
+"""
+
+_UPSERT_TASK = """
+INSERT INTO tasks (task_id, source_message_id, status, received_at, data)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(task_id) DO UPDATE SET
+    source_message_id = excluded.source_message_id,
+    status            = excluded.status,
+    received_at       = excluded.received_at,
+    data              = excluded.data
+"""
+
+_UPSERT_SEEN = """
+INSERT INTO seen_messages (message_id, data) VALUES (?, ?)
+ON CONFLICT(message_id) DO UPDATE SET data = excluded.data
+"""
+
+_UPSERT_ATTACHMENT = """
+INSERT INTO attachment_hashes (sha256, message_id, data) VALUES (?, ?, ?)
+ON CONFLICT(sha256) DO UPDATE SET message_id = excluded.message_id, data = excluded.data
+"""
+
+_UPSERT_ADDRESS = """
+INSERT INTO address_keys (address_key, task_id, data) VALUES (?, ?, ?)
+ON CONFLICT(address_key) DO UPDATE SET task_id = excluded.task_id, data = excluded.data
+"""
+
+_conns: dict[Path, sqlite3.Connection] = {}
+
+
+def connect(db_path: Path, tasks_json: Path | None = None, seen_json: Path | None = None) -> sqlite3.Connection:
+    """
+    Åbner (og cacher) forbindelsen til state-databasen.
+    Første gang en tom database åbnes importeres tasks.json/seen.json, så
+    man kan skifte backend uden at miste historik.
+    """
+    conn = _conns.get(db_path)
+    if conn is not None:
+        return conn
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    _conns[db_path] = conn
+
+    empty = conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is None and \
+        conn.execute("SELECT 1 FROM seen_messages LIMIT 1").fetchone() is None
+    if empty:
+        _import_json(conn, tasks_json, seen_json)
+    return conn
+
+
+def _import_json(conn: sqlite3.Connection, tasks_json: Path | None, seen_json: Path | None) -> None:
+    if tasks_json and tasks_json.exists():
+        upsert_tasks(conn, json.loads(tasks_json.read_text(encoding="utf-8")))
+    if seen_json and seen_json.exists():
+        update_seen(conn, json.loads(seen_json.read_text(encoding="utf-8")))
+
+
+def _dumps(d: Any) -> str:
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":"))
+
+
+def _task_row(t: dict[str, Any]) -> tuple:
+    return (
+        str(t["task_id"]),
+        t.get("source_message_id"),
+        t.get("status"),
+        t.get("received_at"),
+        _dumps(t),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tasks
+# ---------------------------------------------------------------------------
+def load_tasks(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+    rows = conn.execute("SELECT data FROM tasks ORDER BY rowid")
+    return [json.loads(r[0]) for r in rows]
+
+
+def load_task(conn: sqlite3.Connection, task_id: str) -> dict[str, Any] | None:
+    row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (str(task_id),)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def load_tasks_by_status(conn: sqlite3.Connection, statuses: Iterable[str]) -> list[dict[str, Any]]:
+    statuses = list(statuses)
+    if not statuses:
+        return []
+    marks = ",".join("?" for _ in statuses)
+    rows = conn.execute(
+        f"SELECT data FROM tasks WHERE status IN ({marks}) ORDER BY rowid", statuses
+    )
+    return [json.loads(r[0]) for r in rows]
+
+
+def upsert_tasks(conn: sqlite3.Connection, tasks: Iterable[dict[str, Any]]) -> None:
+    with conn:
+        conn.executemany(_UPSERT_TASK, (_task_row(t) for t in tasks))
+
+
+def save_tasks(conn: sqlite3.Connection, tasks: list[dict[str, Any]]) -> None:
+    """
+    Samme semantik som JSON-versionen: listen ER den fulde state.
+    Rækker der ikke er med i listen slettes.
+    """
+    keep = [str(t["task_id"]) for t in tasks]
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _keep (task_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM _keep")
+        conn.executemany("INSERT OR IGNORE INTO _keep VALUES (?)", ((k,) for k in keep))
+        conn.execute("DELETE FROM tasks WHERE task_id NOT IN (SELECT task_id FROM _keep)")
+        conn.executemany(_UPSERT_TASK, (_task_row(t) for t in tasks))
+
+
+# ---------------------------------------------------------------------------
+# Seen (dedupe pr. mail + pr. attachment-hash + pr. adresse)
+# ---------------------------------------------------------------------------
+def load_seen(conn: sqlite3.Connection) -> dict[str, Any]:
+    seen: dict[str, Any] = {}
+    for mid, data in conn.execute("SELECT message_id, data FROM seen_messages ORDER BY rowid"):
+        seen[mid] = json.loads(data)
+    hashes = {h: json.loads(data) for h, data in conn.execute(
+        "SELECT sha256, data FROM attachment_hashes ORDER BY rowid"
+    )}
+    if hashes:
+        seen["attachment_hashes"] = hashes
+    addresses = {k: json.loads(data) for k, data in conn.execute(
+        "SELECT address_key, data FROM address_keys ORDER BY rowid"
+    )}
+    if addresses:
+        seen["address_keys"] = addresses
+    return seen
+
+
+def update_seen(conn: sqlite3.Connection, updates: dict[str, Any]) -> None:
+    """Upsert af kun de nøgler der er med i updates."""
+    with conn:
+        _write_seen(conn, updates)
+
+
+def save_seen(conn: sqlite3.Connection, seen: dict[str, Any]) -> None:
+    with conn:
+        conn.execute("DELETE FROM seen_messages")
+        conn.execute("DELETE FROM attachment_hashes")
+        conn.execute("DELETE FROM address_keys")
+        _write_seen(conn, seen)
+
+
+def _write_seen(conn: sqlite3.Connection, updates: dict[str, Any]) -> None:
+    hashes = updates.get("attachment_hashes") or {}
+    addresses = updates.get("address_keys") or {}
+    conn.executemany(_UPSERT_SEEN, (
+        (k, _dumps(v)) for k, v in updates.items() if k not in ("attachment_hashes", "address_keys")
+    ))
+    conn.executemany(_UPSERT_ATTACHMENT, (
+        (h, (v or {}).get("message_id"), _dumps(v)) for h, v in hashes.items()
+    ))
+    conn.executemany(_UPSERT_ADDRESS, (
+        (k, (v or {}).get("task_id"), _dumps(v)) for k, v in addresses.items()
+    ))
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import atexit
+import os
+import sqlite3
+import time
+
+from src.core.storage import STATE_DIR
+
+# ---------------------------------------------------------------------------
+# Disk-cache for udtrukket PDF-tekst
+# ---------------------------------------------------------------------------
+# Nøgle = sha256 af PDF-indholdet + extractor-version, så samme PDF (gen-
+# ingest, videresendt i flere mails, genkørsel efter parser-fix) kun parses
+# én gang pr. extractor-version. Størrelsen holdes under TEXT_CACHE_MAX_MB
+# ved at smide de mindst nyligt brugte rækker ud (LRU på last_used).
+# Den samlede størrelse summeres én gang pr. forbindelse og holdes derefter
+# ajour ved hver put, så en put ikke skal scanne hele tabellen. Når grænsen
+# nås, ryddes der ned til 90 % af den, så oprydningen ikke kører ved hver put.
+# Et hit skriver ikke selv: last_used samles i hukommelsen og skrives i én
+# transaktion ved næste put (før en evt. oprydning), for hver _TOUCH_BATCH
+# hits og ved procesafslutning — ellers kostede hvert hit en commit + fsync.
+# ---------------------------------------------------------------------------
+
+CACHE_PATH = STATE_DIR / "text_cache.sqlite3"
+MAX_BYTES = int(float(os.getenv("TEXT_CACHE_MAX_MB", "200") or "200") * 1024 * 1024)
+_LOW_WATER = int(MAX_BYTES * 0.9)
+_TOUCH_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS text_cache (
+    key       TEXT PRIMARY KEY,
+    text      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_text_cache_last_used ON text_cache(last_used);
+"""
+
+# Tællere for denne proces (printes af stage A)
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+_conn: sqlite3.Connection | None = None
+_total: int | None = None  # bytes i cachen (løbende, se _evict)
+_touched: dict[str, float] = {}  # key -> last_used der endnu ikke er skrevet
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(str(CACHE_PATH))
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def _key(sha: str, version: str) -> str:
+    return f"{sha}:{version}"
+
+
+def get(sha: str, version: str) -> str | None:
+    conn = _db()
+    key = _key(sha, version)
+    row = conn.execute("SELECT text FROM text_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    _touched[key] = time.time()
+    if len(_touched) >= _TOUCH_BATCH:
+        flush()
+    return row[0]
+
+
+def _write_touched(conn: sqlite3.Connection) -> None:
+    if _touched:
+        conn.executemany(
+            "UPDATE text_cache SET last_used = ? WHERE key = ?",
+            [(ts, key) for key, ts in _touched.items()],
+        )
+        _touched.clear()
+
+
+def flush() -> None:
+    """Skriv opsamlede last_used (kaldes også automatisk ved exit)."""
+    if _conn is not None and _touched:
+        with _conn:
+            _write_touched(_conn)
+
+
+def put(sha: str, version: str, text: str) -> None:
+    global _total
+    conn = _db()
+    key = _key(sha, version)
+    size = len(text.encode("utf-8"))
+    with conn:
+        _write_touched(conn)  # LRU-rækkefølgen skal være ajour før en evt. oprydning
+        if _total is None:
+            _total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM text_cache").fetchone()[0]
+        old = conn.execute("SELECT size FROM text_cache WHERE key = ?", (key,)).fetchone()
+        _total += size - (old[0] if old else 0)
+        conn.execute(
+            "INSERT OR REPLACE INTO text_cache (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, text, size, time.time()),
+        )
+        if _total > MAX_BYTES:
+            _evict(conn)
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    global _total
+    # Tælleren kan være skæv hvis en anden proces har skrevet — tæl op igen
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM text_cache").fetchone()[0]
+    if total <= MAX_BYTES:
+        _total = total
+        return
+    # Ældste først, indtil vi er under 90 % af grænsen
+    drop: list[str] = []
+    for key, size in conn.execute("SELECT key, size FROM text_cache ORDER BY last_used"):
+        if total <= _LOW_WATER:
+            break
+        drop.append(key)
+        total -= size
+    conn.executemany("DELETE FROM text_cache WHERE key = ?", ((k,) for k in drop))
+    stats["evictions"] += len(drop)
+    _total = total
+
+
+def _flush_at_exit() -> None:
+    # forbindelsen kan være åbnet i en anden tråd — tabt last_used er kun LRU-præcision
+    try:
+        flush()
+    except sqlite3.Error:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def summary() -> str:
+    lookups = stats["hits"] + stats["misses"]
+    rate = (100.0 * stats["hits"] / lookups) if lookups else 0.0
+    return (
+        f"hits={stats['hits']} misses={stats['misses']} "
+        f"hit_rate={rate:.0f}% evictions={stats['evictions']}"
+    )
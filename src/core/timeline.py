@@ -0,0 +1,293 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+
+# ---------------------------------------------------------------------------
+# Ledig tid pr. dag for en ressource (maler/tømrer) i del C
+#
+# Hver dag er en sorteret liste af disjunkte ledige intervaller i minutter
+# fra arbejdsdagens start: [(0, 480)] for en tom dag på 8 timer. Dage
+# oprettes først når de røres, og Timeline.first_open peger på første dag
+# med ledig tid, så fuldt bookede dage i starten af horisonten springes over.
+#
+# Inden for en dag findes første relevante hul med bisect på intervallernes
+# slut (O(log g) for g huller); derfra scanner first_fit/best_fit hullerne
+# lineært (O(g) i værste fald), og take/give splitter og fletter naboer med
+# liste-slicing (også O(g)). g er lille i praksis — en dag har højst nogle
+# få bookinger. Pr. dag holdes summen af ledig tid og det største hul ajour
+# ved hver take/give (det største hul tælles kun op igen når det er det der
+# bliver mindre), så en dag uden plads afvises uden at se på intervallerne.
+#
+# Placering (Timeline.find):
+#   earliest  første start hvor jobbet kan ligge (fylder huller foran)
+#   best      på første dag med plads: det mindste hul jobbet kan være i
+#             (store huller bevares til store jobs)
+# Et job der ikke kan være i ét hul, kan som før løbe over flere dage: det
+# starter i dagens sidste hul (det der når til fyraften) og fortsætter fra
+# morgenen de følgende dage.
+#
+# Dag-kapacitet: max_starts begrænser antal jobs der må starte pr. dag
+# (MAX_TASKS_PER_DAY_PER_PAINTER). starts[dag] tæller dem, og dage der er
+# lukket for nye jobs (max_starts nået eller ingen ledig tid) springes over
+# via _skip — "næste åbne dag" med stikomprimering (som union-find), så en
+# lang række lukkede dage kun gennemløbes én gang i alt, ikke pr. job.
+# ---------------------------------------------------------------------------
+
+FITS = ("earliest", "best")
+
+
+class DayFree:
+    __slots__ = ("starts", "ends", "free", "largest")
+
+    def __init__(self, day_minutes: int):
+        self.starts: list[int] = [0]
+        self.ends: list[int] = [day_minutes]
+        self.free = day_minutes
+        self.largest = day_minutes
+
+    def _refresh_largest(self) -> None:
+        self.largest = max((e - s for s, e in zip(self.starts, self.ends)), default=0)
+
+    def first_fit(self, minutes: int, after: int = 0) -> int | None:
+        """Tidligste start >= after hvor [start, start+minutes) er ledigt."""
+        if self.largest < minutes:
+            return None
+        i = bisect_right(self.ends, after)
+        for j in range(i, len(self.starts)):
+            s = max(self.starts[j], after)
+            if self.ends[j] - s >= minutes:
+                return s
+        return None
+
+    def best_fit(self, minutes: int, after: int = 0) -> int | None:
+        """Start i det mindste hul (efter after) der kan rumme minutes."""
+        if self.largest < minutes:
+            return None
+        best: tuple[int, int] | None = None
+        for j in range(bisect_right(self.ends, after), len(self.starts)):
+            s = max(self.starts[j], after)
+            gap = self.ends[j] - s
+            if gap >= minutes and (best is None or gap < best[0]):
+                best = (gap, s)
+                if gap == minutes:
+                    break
+        return best[1] if best else None
+
+    def tail(self, day_minutes: int, after: int = 0) -> int | None:
+        """Start af det hul der når til fyraften (til jobs der løber over flere dage)."""
+        if not self.ends or self.ends[-1] != day_minutes:
+            return None
+        s = max(self.starts[-1], after)
+        return s if s < day_minutes else None
+
+    def head(self) -> int:
+        """Ledige minutter fra morgenen (0 hvis dagen starter med en booking)."""
+        return self.ends[0] if self.starts and self.starts[0] == 0 else 0
+
+    def take(self, start: int, end: int) -> int:
+        """Marker [start, end) som optaget. Returnerer antal minutter der faktisk var ledige."""
+        i = bisect_right(self.ends, start)
+        j = bisect_left(self.starts, end)
+        if i >= j:
+            return 0
+        taken = 0
+        shrunk_largest = False
+        keep_s: list[int] = []
+        keep_e: list[int] = []
+        for s, e in zip(self.starts[i:j], self.ends[i:j]):
+            taken += min(e, end) - max(s, start)
+            shrunk_largest = shrunk_largest or e - s == self.largest
+            if s < start:
+                keep_s.append(s)
+                keep_e.append(start)
+            if e > end:
+                keep_s.append(end)
+                keep_e.append(e)
+        self.starts[i:j] = keep_s
+        self.ends[i:j] = keep_e
+        self.free -= taken
+        if shrunk_largest:
+            self._refresh_largest()
+        return taken
+
+    def give(self, start: int, end: int) -> None:
+        """Frigiv [start, end) igen; fletter med nabo-huller."""
+        if start >= end:
+            return
+        self.take(start, end)  # det allerede ledige fjernes først, så intet tælles dobbelt
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        if i + 1 < len(self.starts) and self.starts[i + 1] == end:
+            self.ends[i] = self.ends.pop(i + 1)
+            self.starts.pop(i + 1)
+        if i > 0 and self.ends[i - 1] == start:
+            self.ends[i - 1] = self.ends.pop(i)
+            self.starts.pop(i)
+            i -= 1
+        self.free += end - start
+        self.largest = max(self.largest, self.ends[i] - self.starts[i])
+
+
+class Timeline:
+    """
+    Ledige intervaller for én ressource: dag-indeks (0 = første plandag)
+    -> DayFree. Alle tider er (dag, minut fra arbejdsdagens start).
+    """
+
+    def __init__(self, day_minutes: int, max_starts: int | None = None):
+        self.day_minutes = day_minutes
+        self.max_starts = max_starts
+        self.days: dict[int, DayFree] = {}
+        self.starts: dict[int, int] = {}  # dag -> antal jobs der starter den dag
+        self.first_open = 0
+        self.booked = 0
+        self._touched: list[int] = []   # sorterede dag-indeks med bookinger
+        self._skip: dict[int, int] = {}  # lukket dag -> kandidat til næste åbne dag
+
+    def day(self, d: int) -> DayFree:
+        df = self.days.get(d)
+        if df is None:
+            df = self.days[d] = DayFree(self.day_minutes)
+        return df
+
+    def closed(self, d: int) -> bool:
+        """Kan der ikke starte flere jobs dag d?"""
+        df = self.days.get(d)
+        if df is not None and df.free == 0:
+            return True
+        return self.max_starts is not None and self.starts.get(d, 0) >= self.max_starts
+
+    def open_from(self, d: int) -> int:
+        """Første dag >= d hvor et nyt job kan starte."""
+        path = []
+        while True:
+            nxt = self._skip.get(d)
+            if nxt is None:
+                if not self.closed(d):
+                    break
+                nxt = d + 1
+            path.append(d)
+            d = nxt
+        for p in path:
+            self._skip[p] = d
+        return d
+
+    def capacity(self, d: int) -> tuple[int, int | None]:
+        """(ledige minutter, antal jobs der stadig kan starte — None = ubegrænset) for dag d."""
+        df = self.days.get(d)
+        free = df.free if df is not None else self.day_minutes
+        left = None if self.max_starts is None else max(0, self.max_starts - self.starts.get(d, 0))
+        return free, left
+
+    def _chain(self, d: int, start: int, minutes: int) -> list[tuple[int, int, int]] | None:
+        """Job der starter i dag d's sidste hul og fortsætter fra morgenen de næste dage."""
+        dm = self.day_minutes
+        chunks = [(d, start, dm)]
+        remaining = minutes - (dm - start)
+        nd = d + 1
+        while remaining > 0:
+            head = self.day(nd).head()
+            if head <= 0:
+                return None
+            if head < remaining and head < dm:
+                return None  # hullet slutter midt på dagen — jobbet kan ikke fortsætte
+            chunk = min(remaining, head)
+            chunks.append((nd, 0, chunk))
+            remaining -= chunk
+            nd += 1
+        return chunks
+
+    def find(
+        self,
+        minutes: int,
+        earliest: tuple[int, int] = (0, 0),
+        fit: str = "earliest",
+    ) -> list[tuple[int, int, int]]:
+        """
+        Placering af et job på minutes minutter, tidligst ved earliest = (dag, minut).
+        Returnerer [(dag, start, slut), ...] uden at booke noget.
+        """
+        dm = self.day_minutes
+        e_day, e_min = earliest
+        d = max(self.first_open, e_day)
+        while True:
+            d = self.open_from(d)
+            after = e_min if d == e_day else 0
+            df = self.day(d)
+            if after < dm and df.free > 0:
+                single = None
+                if minutes <= dm:
+                    single = df.best_fit(minutes, after) if fit == "best" else df.first_fit(minutes, after)
+                t = df.tail(dm, after)
+                chain = None
+                if t is not None and (single is None or (fit == "earliest" and t < single)):
+                    if dm - t < minutes:
+                        chain = self._chain(d, t, minutes)
+                if chain is not None and (single is None or chain[0][1] < single):
+                    return chain
+                if single is not None:
+                    return [(d, single, single + minutes)]
+            d += 1
+
+    def reserve(self, chunks: list[tuple[int, int, int]], count: bool = True) -> int:
+        """
+        Book [(dag, start, slut)]. Allerede optaget tid springes over.
+        count: jobbet tæller som startet på første chunks dag (max_starts).
+        Returnerer bookede minutter.
+        """
+        if count and chunks:
+            self.starts[chunks[0][0]] = self.starts.get(chunks[0][0], 0) + 1
+        taken = 0
+        for d, s, e in chunks:
+            s, e = max(0, s), min(self.day_minutes, e)
+            if s >= e:
+                continue
+            got = self.day(d).take(s, e)
+            if got:
+                taken += got
+                i = bisect_left(self._touched, d)
+                if i == len(self._touched) or self._touched[i] != d:
+                    insort(self._touched, d)
+        self.booked += taken
+        while self.day(self.first_open).free == 0:
+            self.first_open += 1
+        return taken
+
+    def release(self, chunks: list[tuple[int, int, int]], count: bool = True) -> None:
+        """Frigiv tidligere bookede [(dag, start, slut)] (count som i reserve)."""
+        if count and chunks and self.starts.get(chunks[0][0]):
+            self.starts[chunks[0][0]] -= 1
+        self._skip.clear()  # dage kan være åbnet igen
+        for d, s, e in chunks:
+            s, e = max(0, s), min(self.day_minutes, e)
+            if s >= e or d not in self.days:
+                continue
+            df = self.days[d]
+            before = df.free
+            df.give(s, e)
+            self.booked -= df.free - before
+            if df.free == self.day_minutes:
+                i = bisect_left(self._touched, d)
+                if i < len(self._touched) and self._touched[i] == d:
+                    self._touched.pop(i)
+            if d < self.first_open:
+                self.first_open = d
+
+    @property
+    def last_day(self) -> int:
+        """Sidste dag med en booking (-1 hvis ingen)."""
+        return self._touched[-1] if self._touched else -1
+
+    def end_minute(self) -> int:
+        """Hvor sidste booking slutter, i arbejdsminutter fra dag 0 (0 hvis ingen)."""
+        d = self.last_day
+        if d < 0:
+            return 0
+        df = self.days[d]
+        end = df.starts[-1] if df.ends and df.ends[-1] == self.day_minutes else self.day_minutes
+        return d * self.day_minutes + end
+
+    def utilization(self) -> float:
+        """Bookede minutter / arbejdstid fra første plandag til sidste bookede dag."""
+        span = self.last_day + 1
+        return self.booked / (span * self.day_minutes) if span > 0 else 0.0
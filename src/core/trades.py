@@ -0,0 +1,161 @@
+from __future__ import annotations
+import json
+import os
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+# ---------------------------------------------------------------------------
+# Fag-genkendelse (tømrer / maler / rengøring / ...)
+#
+# Alle fagenes ord samles i én Aho-Corasick-automat, så teksten kun læses
+# én gang uanset hvor mange fag og stavemåder der er. Tiden pr. tegn er
+# konstant — ordbogen kan vokse uden at matchningen bliver langsommere.
+#
+# Ordene matches som delstrenge uden skelnen mellem store/små bogstaver
+# ("tømrer" fanger også "tømrerfirma"). Varianter med ae/oe/aa for æ/ø/å
+# laves automatisk.
+#
+# TRADES_FILE=sti/til/fag.json tilføjer/udvider fag:
+#   {"carpenter": ["tømrerfirma"], "electrician": ["elektriker", "el-arbejde"]}
+# ---------------------------------------------------------------------------
+
+# Nøglerne matcher ressource-navnene i web-appen (carpenter/painter/cleaning)
+DEFAULT_TRADES: dict[str, tuple[str, ...]] = {
+    "carpenter": (
+        "tømrerarbejde",
+        "tømrer arbejde",
+        "tømrer",         # bred match — fanger "tømrer skal", "kræver tømrer" osv.
+        "tømrermester",
+        # Gamle stavefejl fra tidligere version — beholdes for sikkerhedsskyld
+        "tømmerarbejde",
+    ),
+    "painter": (
+        "maler",          # fanger også malerarbejde, malermester
+        "maling",
+        "males",
+        "spartel",
+    ),
+    "cleaning": (
+        "rengøring",      # fanger også slut-/flytte-/hovedrengøring
+        "rengøres",
+        "vinduespudsning",
+    ),
+}
+
+_TRANSLIT = {"æ": "ae", "ø": "oe", "å": "aa"}
+
+
+@dataclass(frozen=True)
+class TradeHit:
+    trade: str
+    keyword: str
+    start: int   # position i text.lower() (= teksten for danske bogstaver)
+    end: int
+
+
+def variants(word: str) -> set[str]:
+    """Ordet + alle kombinationer af æ/ø/å skrevet som ae/oe/aa."""
+    out = {""}
+    for ch in word.lower():
+        alts = (ch, _TRANSLIT[ch]) if ch in _TRANSLIT else (ch,)
+        out = {prefix + a for prefix in out for a in alts}
+    return out
+
+
+class TradeMatcher:
+    """
+    Aho-Corasick over alle fagenes ord, bygget helt ud til en DFA
+    (tilstand x tegn -> tilstand), så der er præcis ét dict-opslag pr. tegn.
+    """
+
+    def __init__(self, trades: dict[str, Iterable[str]]):
+        self.trade_names = list(trades)
+        goto: list[dict[str, int]] = [{}]
+        out: list[list[tuple[str, str]]] = [[]]
+
+        # 1) trie
+        for trade, words in trades.items():
+            for word in words:
+                for v in variants(word):
+                    s = 0
+                    for ch in v:
+                        nxt = goto[s].get(ch)
+                        if nxt is None:
+                            goto.append({})
+                            out.append([])
+                            nxt = goto[s][ch] = len(goto) - 1
+                        s = nxt
+                    if (trade, v) not in out[s]:
+                        out[s].append((trade, v))
+
+        # 2) fail-links (BFS) + DFA-overgange
+        delta: list[dict[str, int]] = [dict() for _ in goto]
+        delta[0] = dict(goto[0])
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, u in goto[r].items():
+                queue.append(u)
+                fail[u] = delta[fail[r]].get(ch, 0)
+                out[u] = out[u] + [o for o in out[fail[u]] if o not in out[u]]
+            # fail[r] ligger højere i trie'en og er allerede færdig (BFS)
+            delta[r] = {**delta[fail[r]], **goto[r]}
+
+        self._delta = delta
+        self._out = out
+
+    def find(self, text: str) -> list[TradeHit]:
+        """Alle forekomster (også overlappende) i tekst-rækkefølge."""
+        delta, out = self._delta, self._out
+        hits: list[TradeHit] = []
+        s = 0
+        for i, ch in enumerate(text.lower()):
+            s = delta[s].get(ch, 0)
+            if out[s]:
+                for trade, kw in out[s]:
+                    hits.append(TradeHit(trade, kw, i + 1 - len(kw), i + 1))
+        return hits
+
+    def trades(self, text: str) -> dict[str, bool]:
+        """Hvilke fag nævnes — stopper så snart alle fag er fundet."""
+        delta, out = self._delta, self._out
+        found: set[str] = set()
+        s = 0
+        for ch in text.lower():
+            s = delta[s].get(ch, 0)
+            if out[s]:
+                found.update(trade for trade, _kw in out[s])
+                if len(found) == len(self.trade_names):
+                    break
+        return {t: t in found for t in self.trade_names}
+
+
+def load_trades() -> dict[str, tuple[str, ...]]:
+    trades = {k: tuple(v) for k, v in DEFAULT_TRADES.items()}
+    path = os.getenv("TRADES_FILE")
+    if path:
+        extra = json.loads(Path(path).read_text(encoding="utf-8"))
+        for trade, words in extra.items():
+            trades[trade] = trades.get(trade, ()) + tuple(words)
+    return trades
+
+
+_matcher: TradeMatcher | None = None
+
+
+def default_matcher() -> TradeMatcher:
+    global _matcher
+    if _matcher is None:
+        _matcher = TradeMatcher(load_trades())
+    return _matcher
+
+
+def detect_trades(text: str) -> dict[str, bool]:
+    return default_matcher().trades(text)
+
+
+def find_trade_hits(text: str) -> list[TradeHit]:
+    return default_matcher().find(text)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import os
+
+import requests
+
+from src.core.models import TaskPlan, TaskRecord
+
+# ---------------------------------------------------------------------------
+# Planer som web-appen har rettet (Supabase-tabellen "tasks")
+#
+# /delay i app.py flytter blokke direkte i Supabase (reflow.py). Stage C
+# holder de planlagte tasks fast, så de skal læses fra samme sted som /delay
+# skriver til — ellers lægges nye tasks oven i de flyttede blokke. Her
+# hentes "plan" for de PLANNED tasks via Supabase's REST-API (PostgREST,
+# samme SUPABASE_URL/SUPABASE_KEY som web-appen; supabase-pakken er kun
+# med i requirements_web.txt). Uden SUPABASE_URL bruges den lokale state.
+# ---------------------------------------------------------------------------
+
+_CHUNK = 100  # task_id'er pr. kald (holder URL'en kort)
+
+
+def _fetch(url: str, key: str, task_ids: list[str]) -> dict[str, dict]:
+    headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+    plans: dict[str, dict] = {}
+    for i in range(0, len(task_ids), _CHUNK):
+        ids = ",".join(f'"{t}"' for t in task_ids[i:i + _CHUNK])
+        r = requests.get(
+            f"{url.rstrip('/')}/rest/v1/tasks",
+            params={"select": "task_id,plan", "task_id": f"in.({ids})"},
+            headers=headers,
+            timeout=30,
+        )
+        r.raise_for_status()
+        for row in r.json():
+            if row.get("plan"):
+                plans[str(row["task_id"])] = row["plan"]
+    return plans
+
+
+def apply_web_plans(committed: list[TaskRecord]) -> list[TaskRecord]:
+    """
+    Erstat de planlagte tasks' plan med web-appens (hvis den er ændret).
+    Returnerer de tasks hvis plan blev skiftet, så den lokale state kan
+    opdateres. Kan Supabase ikke nås, bruges den lokale plan (med advarsel).
+    """
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key or not committed:
+        return []
+    try:
+        remote = _fetch(url, key, [t.task_id for t in committed])
+    except (requests.RequestException, ValueError) as e:
+        print(f"[C] Kunne ikke hente planer fra Supabase ({e}) — bruger lokal state.")
+        return []
+
+    changed = []
+    for t in committed:
+        d = remote.get(t.task_id)
+        if d is None:
+            continue
+        try:
+            plan = TaskPlan.from_dict(d)
+        except (KeyError, TypeError, ValueError):
+            continue  # ufuldstændig blok i web-appens plan — behold den lokale
+        if t.plan is None or plan.blocks != t.plan.blocks:
+            t.plan = plan
+            changed.append(t)
+    return changed
@@ -1,19 +1,59 @@
 from __future__ import annotations
+import os
+import time
 import msal
 from src.config import Settings
+from src.core.storage import STATE_DIR
 
 GRAPH_SCOPE = ["https://graph.microsoft.com/.default"]
 
+# MSAL's token-cache gemmes mellem kørsler, så et gyldigt access token
+# genbruges i stedet for at hente et nyt fra Entra ID hver gang.
+# Filen indeholder tokens — den er i .gitignore.
+TOKEN_CACHE_PATH = STATE_DIR / "msal_token_cache.json"
+
+# Token i denne proces: (token, udløb som time.time())
+_token: tuple[str, float] | None = None
+
+
+def _load_cache() -> msal.SerializableTokenCache:
+    cache = msal.SerializableTokenCache()
+    if TOKEN_CACHE_PATH.exists():
+        try:
+            cache.deserialize(TOKEN_CACHE_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            pass  # korrupt cache — hent bare et nyt token
+    return cache
+
+
+def _save_cache(cache: msal.SerializableTokenCache) -> None:
+    if not cache.has_state_changed:
+        return
+    tmp = TOKEN_CACHE_PATH.with_suffix(".json.tmp")
+    tmp.write_text(cache.serialize(), encoding="utf-8")
+    os.replace(tmp, TOKEN_CACHE_PATH)
+
+
 def acquire_token(settings: Settings) -> str:
+    global _token
+    # 60 sek. margin, så vi ikke starter en kørsel med et token der udløber undervejs
+    if _token and _token[1] - 60 > time.time():
+        return _token[0]
+
+    cache = _load_cache()
     app = msal.ConfidentialClientApplication(
         client_id=settings.client_id,
         client_credential=settings.client_secret,
         authority=f"https://login.microsoftonline.com/{settings.tenant_id}",
+        token_cache=cache,
     )
-    result = app.acquire_token_silent(GRAPH_SCOPE, account=None)
-    if not result:
-        result = app.acquire_token_for_client(scopes=GRAPH_SCOPE)
+    # acquire_token_for_client slår selv op i cachen og returnerer et
+    # gyldigt token derfra; ellers hentes et nyt
+    result = app.acquire_token_for_client(scopes=GRAPH_SCOPE)
 
     if "access_token" not in result:
         raise RuntimeError(f"Token error: {result}")
+
+    _save_cache(cache)
+    _token = (result["access_token"], time.time() + float(result.get("expires_in", 0)))
     return result["access_token"]
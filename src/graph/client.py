@@ -1,28 +1,117 @@
 from __future__ import annotations
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+# Status-koder der er værd at prøve igen (throttling / midlertidigt nede).
+# POST (fx opret event) prøves kun igen når Graph ikke har udført kaldet.
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_RETRY_STATUS_POST = {429, 503}
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 60.0
+
+# Én Session for hele processen: keep-alive + connection pool genbruges
+# på tværs af GraphClient-instanser.
+_SESSION: requests.Session | None = None
+
+
+def _session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        s.headers.update({"Accept-Encoding": "gzip, deflate"})
+        _SESSION = s
+    return _SESSION
+
 
 class GraphClient:
-    def __init__(self, access_token: str):
-        self.base = "https://graph.microsoft.com/v1.0"
+    def __init__(self, access_token: str, base: str = "https://graph.microsoft.com/v1.0"):
+        self.base = base.rstrip("/")
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
         }
+        self.session = _session()
+        # pr. kald-type: antal, samlet/max latency (ms), retries
+        self.stats: dict[str, dict[str, float]] = {}
+
+    def _url(self, path: str) -> str:
+        # @odata.nextLink / @odata.deltaLink er fulde URL'er
+        return path if path.startswith(("https://", "http://")) else self.base + path
 
-    def get(self, path: str, params: dict | None = None) -> dict:
-        r = requests.get(self.base + path, headers=self.headers, params=params, timeout=60)
+    def _request(self, label: str, method: str, path: str, **kw) -> requests.Response:
+        """
+        Kald med bounded exponential backoff. 429/5xx og netværksfejl prøves
+        igen op til MAX_RETRIES gange; Retry-After fra Graph respekteres.
+        """
+        idempotent = method == "GET"
+        retry_status = _RETRY_STATUS if idempotent else _RETRY_STATUS_POST
+        st = self.stats.setdefault(label, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "retries": 0})
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                r = self.session.request(method, self._url(path), timeout=60, **kw)
+                err = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                r, err = None, e
+            ms = (time.perf_counter() - t0) * 1000
+            st["calls"] += 1
+            st["total_ms"] += ms
+            st["max_ms"] = max(st["max_ms"], ms)
+
+            if err is not None:
+                retryable = idempotent or isinstance(err, requests.ConnectTimeout)
+            else:
+                retryable = r.status_code in retry_status
+            if not retryable or attempt >= MAX_RETRIES:
+                if err is not None:
+                    raise RuntimeError(f"{label} {path} failed: {err}")
+                return r
+
+            attempt += 1
+            st["retries"] += 1
+            time.sleep(self._backoff(r, attempt))
+
+    @staticmethod
+    def _backoff(r: requests.Response | None, attempt: int) -> float:
+        if r is not None:
+            ra = r.headers.get("Retry-After")
+            if ra:
+                try:
+                    return min(float(ra), MAX_BACKOFF_SECONDS)
+                except ValueError:
+                    pass
+        return min(2 ** (attempt - 1), MAX_BACKOFF_SECONDS)
+
+    def get(self, path: str, params: dict | None = None, headers: dict | None = None) -> dict:
+        h = {**self.headers, **headers} if headers else self.headers
+        r = self._request("GET", "GET", path, headers=h, params=params)
         if not r.ok:
             raise RuntimeError(f"GET {path} failed: {r.status_code} {r.text}")
         return r.json()
 
     def get_bytes(self, path: str) -> bytes:
-        r = requests.get(self.base + path, headers=self.headers, timeout=60)
+        r = self._request("GET(bytes)", "GET", path, headers=self.headers)
         if not r.ok:
             raise RuntimeError(f"GET(bytes) {path} failed: {r.status_code} {r.text}")
         return r.content
 
     def post(self, path: str, json: dict) -> dict:
-        r = requests.post(self.base + path, headers=self.headers, json=json, timeout=60)
+        r = self._request("POST", "POST", path, headers=self.headers, json=json)
         if not r.ok:
             raise RuntimeError(f"POST {path} failed: {r.status_code} {r.text}")
         return r.json()
+
+    def stats_summary(self) -> str:
+        parts = []
+        for label, st in self.stats.items():
+            avg = st["total_ms"] / st["calls"] if st["calls"] else 0.0
+            parts.append(
+                f"{label}: {int(st['calls'])} kald, avg {avg:.0f} ms, max {st['max_ms']:.0f} ms, "
+                f"{int(st['retries'])} retries"
+            )
+        return " | ".join(parts) or "ingen kald"
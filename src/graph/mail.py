@@ -1,8 +1,9 @@
 from __future__ import annotations
 import base64
+import time
 from dataclasses import dataclass
-from typing import Iterable
-from src.graph.client import GraphClient
+from typing import Iterator
+from src.graph.client import GraphClient, MAX_BACKOFF_SECONDS
 
 @dataclass
 class GraphMessage:
@@ -18,40 +19,109 @@ class DownloadedAttachment:
     filename: str
     content: bytes
 
-def list_messages_in_date_range(
+_MESSAGE_SELECT = "id,subject,receivedDateTime,from,hasAttachments,bodyPreview"
+
+def _to_message(item: dict) -> GraphMessage:
+    frm = None
+    try:
+        frm = item.get("from", {}).get("emailAddress", {}).get("address")
+    except Exception:
+        frm = None
+    return GraphMessage(
+        id=item["id"],
+        subject=item.get("subject", ""),
+        received_datetime=item.get("receivedDateTime", ""),
+        from_address=frm,
+        body_preview=item.get("bodyPreview"),
+        has_attachments=bool(item.get("hasAttachments")),
+    )
+
+def iter_messages_in_date_range(
     gc: GraphClient,
     mailbox_upn: str,
     start_iso: str,
     end_iso: str,
     top: int = 200,
-) -> list[GraphMessage]:
+) -> Iterator[GraphMessage]:
+    """
+    Alle mails i vinduet, side for side (top = sidestørrelse).
+    Følger @odata.nextLink, så intet droppes efter første side.
+    """
     # Vi bruger $filter på receivedDateTime og sorterer desc.
     # (Query-parametre i Graph) :contentReference[oaicite:5]{index=5}
-    params = {
+    params: dict | None = {
         "$top": str(top),
         "$orderby": "receivedDateTime desc",
-        "$select": "id,subject,receivedDateTime,from,hasAttachments,bodyPreview",
+        "$select": _MESSAGE_SELECT,
         "$filter": f"receivedDateTime ge {start_iso} and receivedDateTime lt {end_iso}",
     }
-    data = gc.get(f"/users/{mailbox_upn}/mailFolders/Inbox/messages", params=params)
-    out: list[GraphMessage] = []
-    for item in data.get("value", []):
-        frm = None
-        try:
-            frm = item.get("from", {}).get("emailAddress", {}).get("address")
-        except Exception:
-            frm = None
-        out.append(
-            GraphMessage(
-                id=item["id"],
-                subject=item.get("subject", ""),
-                received_datetime=item.get("receivedDateTime", ""),
-                from_address=frm,
-                body_preview=item.get("bodyPreview"),
-                has_attachments=bool(item.get("hasAttachments")),
-            )
-        )
-    return out
+    url = f"/users/{mailbox_upn}/mailFolders/Inbox/messages"
+    while url:
+        data = gc.get(url, params=params)
+        for item in data.get("value", []):
+            yield _to_message(item)
+        url = data.get("@odata.nextLink")
+        params = None  # nextLink indeholder allerede query'en
+
+def list_messages_in_date_range(
+    gc: GraphClient,
+    mailbox_upn: str,
+    start_iso: str,
+    end_iso: str,
+    top: int = 200,
+) -> list[GraphMessage]:
+    return list(iter_messages_in_date_range(gc, mailbox_upn, start_iso, end_iso, top=top))
+
+class MessageDelta:
+    """
+    Inkrementel sync af Inbox via /messages/delta.
+
+        delta = MessageDelta(gc, upn, delta_link=gemt_link, start_iso=...)
+        for m in delta:        # kun nye/ændrede mails siden sidste deltaLink
+            ...
+        gem(delta.delta_link)  # sat når alle sider er hentet
+
+    Uden delta_link laves en første fuld sync (evt. afgrænset af start_iso).
+    Slettede mails (@removed) springes over.
+    """
+    def __init__(
+        self,
+        gc: GraphClient,
+        mailbox_upn: str,
+        delta_link: str | None = None,
+        start_iso: str | None = None,
+        page_size: int = 50,
+    ):
+        self.gc = gc
+        self.mailbox_upn = mailbox_upn
+        self.start_link = delta_link
+        self.start_iso = start_iso
+        self.page_size = page_size
+        self.delta_link: str | None = None
+        self.pages = 0
+
+    def __iter__(self) -> Iterator[GraphMessage]:
+        headers = {"Prefer": f"odata.maxpagesize={self.page_size}"}
+        if self.start_link:
+            url: str | None = self.start_link
+            params: dict | None = None
+        else:
+            url = f"/users/{self.mailbox_upn}/mailFolders/Inbox/messages/delta"
+            params = {"$select": _MESSAGE_SELECT}
+            if self.start_iso:
+                params["$filter"] = f"receivedDateTime ge {self.start_iso}"
+
+        while url:
+            data = self.gc.get(url, params=params, headers=headers)
+            self.pages += 1
+            for item in data.get("value", []):
+                if "@removed" in item:
+                    continue
+                yield _to_message(item)
+            params = None
+            url = data.get("@odata.nextLink")
+            if not url:
+                self.delta_link = data.get("@odata.deltaLink")
 
 def list_attachments(gc: GraphClient, mailbox_upn: str, message_id: str) -> list[dict]:
     data = gc.get(f"/users/{mailbox_upn}/messages/{message_id}/attachments", params={"$top": "50"})
@@ -80,6 +150,141 @@ def download_file_attachments(
         downloaded.append(DownloadedAttachment(filename=name, content=content))
     return downloaded
 
+# ---------------------------------------------------------------------------
+# Batched download via Graph JSON $batch (max 20 requests pr. kald)
+# ---------------------------------------------------------------------------
+BATCH_SIZE = 20
+_RETRY_STATUS = {429, 503, 504}
+
+def _batch_get(gc: GraphClient, urls: list[str], max_retries: int = 3) -> list[tuple[int, object]]:
+    """
+    GET af mange relative URL'er via POST /$batch, 20 ad gangen.
+    Returnerer (status, body) i samme rækkefølge som urls.
+    Items der svarer 429/503/504 sendes igen (efter Retry-After) op til
+    max_retries gange; andre fejl returneres som de er, så kalderen kan
+    håndtere dem pr. item. Fejler selve $batch-kaldet (fx 500/502/504, som
+    GraphClient ikke gentager for POST), får hele chunk'en status 0 — så
+    henter download_file_attachments_batch de mails enkeltvis.
+    """
+    results: list[tuple[int, object]] = [(0, None)] * len(urls)
+    todo = list(range(len(urls)))
+    attempt = 0
+
+    while todo:
+        retry: list[int] = []
+        wait: float | None = None  # største Retry-After blandt items der skal igen
+        for off in range(0, len(todo), BATCH_SIZE):
+            chunk = todo[off: off + BATCH_SIZE]
+            payload = {"requests": [
+                {"id": str(i), "method": "GET", "url": urls[i]} for i in chunk
+            ]}
+            try:
+                data = gc.post("/$batch", json=payload)
+            except RuntimeError as e:
+                print(f"[GRAPH] $batch fejlede ({len(chunk)} kald hentes enkeltvis): {e}")
+                for i in chunk:
+                    results[i] = (0, None)
+                continue
+            answered = set()
+            for resp in data.get("responses", []):
+                i = int(resp["id"])
+                answered.add(i)
+                status = int(resp.get("status", 0))
+                if status in _RETRY_STATUS and attempt < max_retries:
+                    retry.append(i)
+                    headers = {k.lower(): v for k, v in (resp.get("headers") or {}).items()}
+                    try:
+                        wait = max(wait or 0.0, float(headers["retry-after"]))
+                    except (KeyError, ValueError):
+                        pass
+                    continue
+                results[i] = (status, resp.get("body"))
+            # Items uden svar prøves igen
+            retry += [i for i in chunk if i not in answered and attempt < max_retries]
+
+        todo = sorted(retry)
+        attempt += 1
+        if todo:
+            # Retry-After loftes som i GraphClient._backoff, så et vildt svar ikke stopper stage A
+            time.sleep(min(wait, MAX_BACKOFF_SECONDS) if wait is not None else min(2 ** attempt, 30))
+
+    return results
+
+def _decode_body_bytes(body: object) -> bytes:
+    # Ikke-JSON svar (fx $value) kommer base64-kodet i batch-body
+    if isinstance(body, str):
+        return base64.b64decode(body)
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    raise ValueError(f"Uventet batch-body: {type(body).__name__}")
+
+def download_file_attachments_batch(
+    gc: GraphClient,
+    mailbox_upn: str,
+    message_ids: list[str],
+    max_retries: int = 3,
+) -> dict[str, list[DownloadedAttachment]]:
+    """
+    Som download_file_attachments, men for mange mails på én gang:
+    attachment-listerne og evt. $value-kald pakkes 20 pr. $batch.
+    Mails hvor et item fejler (efter retries) hentes enkeltvis som fallback;
+    fejler det også, er mailen ikke med i resultatet (prøves igen næste kørsel).
+    """
+    out: dict[str, list[DownloadedAttachment]] = {}
+    if not message_ids:
+        return out
+
+    lists = _batch_get(
+        gc,
+        [f"/users/{mailbox_upn}/messages/{mid}/attachments?$top=50" for mid in message_ids],
+        max_retries,
+    )
+
+    failed: set[str] = set()
+    # (message_id, position i listen, filnavn, attachment-id) for dem uden contentBytes
+    need_value: list[tuple[str, int, str, str]] = []
+
+    for mid, (status, body) in zip(message_ids, lists):
+        if status != 200 or not isinstance(body, dict):
+            failed.add(mid)
+            continue
+        downloaded: list[DownloadedAttachment] = []
+        for a in body.get("value", []):
+            if "fileAttachment" not in a.get("@odata.type", ""):
+                continue  # ignorer itemAttachment etc. i MVP
+            name = a.get("name") or "attachment.bin"
+            content_b64 = a.get("contentBytes")
+            if content_b64:
+                downloaded.append(DownloadedAttachment(filename=name, content=base64.b64decode(content_b64)))
+            else:
+                need_value.append((mid, len(downloaded), name, a["id"]))
+                downloaded.append(DownloadedAttachment(filename=name, content=b""))
+        out[mid] = downloaded
+
+    if need_value:
+        values = _batch_get(
+            gc,
+            [f"/users/{mailbox_upn}/messages/{mid}/attachments/{att_id}/$value" for mid, _, _, att_id in need_value],
+            max_retries,
+        )
+        for (mid, pos, name, _att_id), (status, body) in zip(need_value, values):
+            try:
+                if status != 200:
+                    raise ValueError(f"status {status}")
+                out[mid][pos] = DownloadedAttachment(filename=name, content=_decode_body_bytes(body))
+            except Exception:
+                failed.add(mid)
+
+    for mid in failed:
+        out.pop(mid, None)
+        try:
+            out[mid] = download_file_attachments(gc, mailbox_upn, mid)
+        except Exception as e:
+            print(f"[GRAPH] Kunne ikke hente vedhæftninger for {mid}: {e}")
+
+    # Samme rækkefølge som message_ids
+    return {mid: out[mid] for mid in message_ids if mid in out}
+
 def move_message_to_folder(
     gc: GraphClient,
     mailbox_upn: str,
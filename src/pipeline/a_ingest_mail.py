@@ -1,11 +1,23 @@
 from __future__ import annotations
+import os
 from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
 from src.config import get_settings
 from src.graph.auth import acquire_token
 from src.graph.client import GraphClient
-from src.graph.mail import list_messages_in_date_range, download_file_attachments
-from src.core.storage import load_seen, save_seen, load_tasks, save_tasks, save_attachment, sha256_bytes
-from src.core.pdf_extract import extract_text_from_pdf
+from src.graph.mail import (
+    GraphMessage, DownloadedAttachment, iter_messages_in_date_range, MessageDelta,
+    download_file_attachments, download_file_attachments_batch, BATCH_SIZE,
+)
+from src.core.storage import (
+    load_seen, update_seen, save_attachment, sha256_bytes, batched_writes,
+    load_delta_link, save_delta_link,
+)
+from src.core.models import TaskRecord, parse_datetime, upsert_records
+from src.core.dedupe import check_duplicate
+from src.core.pdf_extract import extract_stream
+from src.core import text_cache
 from src.core.parsing import extract_address_from_text
 
 def _month_window_iso(now_utc: datetime, day_start: int, day_end: int) -> tuple[str, str]:
@@ -15,75 +27,166 @@ def _month_window_iso(now_utc: datetime, day_start: int, day_end: int) -> tuple[
     end = datetime(y, m, day_end + 1, 0, 0, 0, tzinfo=timezone.utc)
     return start.isoformat(), end.isoformat()
 
+def _iter_downloads(gc: GraphClient, mailbox_upn: str, candidates, failed: list):
+    """
+    (message, attachments) for hver kandidat-mail. Default hentes
+    vedhæftningerne i Graph $batch-kald (20 mails ad gangen);
+    GRAPH_BATCH_DOWNLOAD=0 henter én mail ad gangen som før.
+    Mails der ikke kunne hentes lægges i failed og springes over.
+    """
+    if os.getenv("GRAPH_BATCH_DOWNLOAD", "1") != "1":
+        for m in candidates:
+            yield m, download_file_attachments(gc, mailbox_upn, m.id)
+        return
+
+    def flush(chunk):
+        got = download_file_attachments_batch(gc, mailbox_upn, [x.id for x in chunk])
+        for x in chunk:
+            if x.id in got:
+                yield x, got[x.id]
+            else:
+                failed.append(x.id)
+
+    chunk = []
+    for m in candidates:
+        chunk.append(m)
+        if len(chunk) == BATCH_SIZE:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+def open_message_source(gc: GraphClient, s) -> tuple[Iterator[GraphMessage], MessageDelta | None, str]:
+    """
+    Mails der skal kigges på i denne kørsel.
+    GRAPH_SYNC_MODE=window (default): hele vinduet listes hver gang (alle sider).
+    GRAPH_SYNC_MODE=delta: kun nye/ændrede mails siden sidste kørsel (deltaLink).
+    """
+    now = datetime.now(timezone.utc)
+    start_iso, end_iso = _month_window_iso(now, s.window_start_day, s.window_end_day)
+
+    delta_key = f"{s.mailbox_upn}/Inbox"
+    if os.getenv("GRAPH_SYNC_MODE", "window").strip().lower() == "delta":
+        delta = MessageDelta(gc, s.mailbox_upn, delta_link=load_delta_link(delta_key), start_iso=start_iso)
+        return iter(delta), delta, delta_key
+    return iter_messages_in_date_range(gc, s.mailbox_upn, start_iso, end_iso, top=200), None, delta_key
+
+def is_candidate(m: GraphMessage, s, seen: dict) -> bool:
+    # filter på afsender-domæne i kode
+    frm = (m.from_address or "").lower()
+    if "@" not in frm or not frm.endswith("@" + s.sender_domain):
+        return False
+
+    if not m.has_attachments:
+        return False
+
+    # dedupe pr message
+    return m.id not in seen
+
+def store_pdfs(m: GraphMessage, atts: list[DownloadedAttachment], seen: dict) -> tuple[list[tuple[Path, str]], dict]:
+    """
+    Gem mailens nye PDF'er (dedupe pr. attachment-hash).
+    Returnerer ([(sti, sha256), ...], seen-nøgler der skal gemmes for mailen).
+    """
+    msg_seen: dict = {}
+    pdfs = []
+
+    for a in atts:
+        # kun pdf i MVP
+        if not a.filename.lower().endswith(".pdf"):
+            continue
+        h = sha256_bytes(a.content)
+        # dedupe pr attachment-hash
+        if seen.get("attachment_hashes", {}).get(h):
+            continue
+
+        p = save_attachment(m.id, a.filename, a.content, sha=h)
+        pdfs.append((p, h))
+
+        seen.setdefault("attachment_hashes", {})[h] = {"message_id": m.id, "file": a.filename}
+        msg_seen.setdefault("attachment_hashes", {})[h] = seen["attachment_hashes"][h]
+
+    return pdfs, msg_seen
+
+def commit_task(m: GraphMessage, pdfs: list[tuple[Path, str]], texts: list[str], msg_seen: dict, seen: dict) -> TaskRecord:
+    """
+    Byg task'en ud fra PDF-teksterne (i vedhæftningsrækkefølge) og gem den.
+    """
+    pdf_paths = []
+    full_text_parts = []
+    address = None
+
+    for (p, _h), text in zip(pdfs, texts):
+        pdf_paths.append(str(p))
+        if text:
+            full_text_parts.append(text)
+            if address is None:
+                address = extract_address_from_text(text)
+
+    full_text = "\n\n".join(full_text_parts).strip()
+
+    task = TaskRecord(
+        task_id=f"{m.id}",
+        source_message_id=m.id,
+        received_at=parse_datetime(m.received_datetime),
+        from_address=m.from_address,
+        subject=m.subject,
+        address=address or "(ukendt adresse endnu)",
+        pdf_paths=pdf_paths,
+    )
+    task.text_raw = full_text  # gemmes komprimeret i data/blobs/text, task'en får text_sha
+    task = check_duplicate(task, seen, msg_seen)  # samme adresse for nylig -> DUPLICATE / merge
+    seen[m.id] = msg_seen[m.id] = {"received_at": m.received_datetime}
+
+    # Gem pr. mail (task før seen), så et crash ikke koster de mails
+    # vi allerede har hentet og parset. Kun de nye rækker skrives.
+    upsert_records([task])
+    update_seen(msg_seen)
+    return task
+
+def finish_sync(delta: MessageDelta | None, delta_key: str, failed: list[str], tag: str = "[A]") -> None:
+    if failed:
+        print(f"{tag} {len(failed)} mail(s) ikke gemt (download eller tekstudtræk fejlede) — prøves igen næste kørsel.")
+
+    # deltaLink gemmes først når alle mails fra denne sync er gemt som tasks
+    # (ellers ville de fejlede mails ikke komme med i næste delta)
+    if delta is not None and delta.delta_link and not failed:
+        save_delta_link(delta_key, delta.delta_link)
+        print(f"{tag} Delta sync: {delta.pages} side(r) hentet, deltaLink gemt.")
+
 def run():
+    # JSON-backend: tasks.json/seen.json skrives samlet (JSON_FLUSH_EVERY), ikke pr. mail
+    with batched_writes():
+        _run()
+
+def _run():
     s = get_settings()
     token = acquire_token(s)
     gc = GraphClient(token)
 
-    now = datetime.now(timezone.utc)
-    start_iso, end_iso = _month_window_iso(now, s.window_start_day, s.window_end_day)
-
-    msgs = list_messages_in_date_range(gc, s.mailbox_upn, start_iso, end_iso, top=200)
-
+    msgs, delta, delta_key = open_message_source(gc, s)
     seen = load_seen()
-    tasks = load_tasks()
 
-    added = 0
-    for m in msgs:
-        # filter på afsender-domæne i kode
-        frm = (m.from_address or "").lower()
-        if "@" not in frm or not frm.endswith("@" + s.sender_domain):
-            continue
+    # 1) Hent + gem PDF'er mail for mail (netværk/disk)
+    candidates = (m for m in msgs if is_candidate(m, s, seen))
+    failed: list[str] = []
 
-        if not m.has_attachments:
-            continue
+    def stored():
+        for m, atts in _iter_downloads(gc, s.mailbox_upn, candidates, failed):
+            pdfs, msg_seen = store_pdfs(m, atts, seen)
+            if pdfs:
+                yield (m, pdfs, msg_seen), pdfs
 
-        # dedupe pr message
-        if m.id in seen:
-            continue
-
-        atts = download_file_attachments(gc, s.mailbox_upn, m.id)
-        pdf_paths = []
-        full_text_parts = []
-        address = None
-
-        for a in atts:
-            # kun pdf i MVP
-            if not a.filename.lower().endswith(".pdf"):
-                continue
-            h = sha256_bytes(a.content)
-            # dedupe pr attachment-hash
-            if seen.get("attachment_hashes", {}).get(h):
-                continue
-
-            p = save_attachment(m.id, a.filename, a.content)
-            pdf_paths.append(str(p))
-
-            text = extract_text_from_pdf(p)
-            if text:
-                full_text_parts.append(text)
-                if address is None:
-                    address = extract_address_from_text(text)
-
-            seen.setdefault("attachment_hashes", {})[h] = {"message_id": m.id, "file": a.filename}
-
-        full_text = "\n\n".join(full_text_parts).strip()
-        if not full_text and not pdf_paths:
+    # 2) Tekstudtræk (evt. i process-pool, EXTRACT_WORKERS) strømmer i
+    #    mailrækkefølge, og hver task gemmes + markeres set så snart dens
+    #    tekster er klar — et crash koster kun de mails der er undervejs.
+    added = 0
+    for (m, pdfs, msg_seen), texts, ok in extract_stream(stored()):
+        if not ok:
+            # PDF'en hang/crashede i poolen: hverken task eller seen — prøves igen
+            failed.append(m.id)
             continue
-
-        task = {
-            "task_id": f"{m.id}",
-            "source_message_id": m.id,
-            "received_at": m.received_datetime,
-            "from": m.from_address,
-            "subject": m.subject,
-            "address": address or "(ukendt adresse endnu)",
-            "pdf_paths": pdf_paths,
-            "text_raw": full_text,  # MVP: dump alt her
-            "status": "NEW",
-        }
-        tasks.append(task)
-        seen[m.id] = {"received_at": m.received_datetime}
+        commit_task(m, pdfs, texts, msg_seen, seen)
         added += 1
 
         # Flyt mail (KLAR, men udkommenteret i MVP)
@@ -92,10 +195,11 @@ def run():
         #     if dest_id:
         #         move_message_to_folder(gc, s.mailbox_upn, m.id, dest_id)
 
-    save_seen(seen)
-    save_tasks(tasks)
+    finish_sync(delta, delta_key, failed)
 
-    print(f"[A] Done. Added tasks: {added}. Total tasks in state: {len(tasks)}")
+    print(f"[A] Done. Added tasks: {added}.")
+    print(f"[A] Graph: {gc.stats_summary()}")
+    print(f"[A] Text cache: {text_cache.summary()}")
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from src.config import get_settings
+from src.graph.auth import acquire_token
+from src.graph.client import GraphClient
+from src.graph.mail import GraphMessage, download_file_attachments
+from src.core.storage import batched_writes, load_seen
+from src.core.pdf_extract import ExtractPool
+from src.core import text_cache
+from src.pipeline.a_ingest_mail import (
+    open_message_source,
+    is_candidate,
+    store_pdfs,
+    commit_task,
+    finish_sync,
+)
+
+# ---------------------------------------------------------------------------
+# Stage A som asyncio-pipeline (samme resultat som a_ingest_mail.run)
+#
+#   list ──► [q_msgs] ──► N downloaders ──► [q_downloaded] ──► sequencer ──► [q_ready] ──► committer
+#                          (Graph, tråde)                      (hash+gem,    (venter på tekst,
+#                                                               starter       bygger + gemmer
+#                                                               udtræk)       task i rækkefølge)
+#
+# Listning, download, disk-skrivning og PDF-udtræk (executor) overlapper.
+# Køerne er begrænsede (ASYNC_QUEUE_SIZE), så en hurtig producer venter
+# på de langsomme trin i stedet for at holde hele indbakken i hukommelsen.
+# Sequencer og committer arbejder i listningsrækkefølge, så dedupe-
+# beslutninger og tasks.json/seen.json bliver de samme som i den serielle run().
+#
+# State og text_cache (SQLite-forbindelser caches pr. proces og må kun
+# bruges fra den tråd der åbnede dem) tilgås kun fra event-loop-tråden.
+# I tråde kører kun Graph-kald og skrivning af blobs.
+#
+# PDF-udtræk kører altid i en process-pool (ExtractPool fra pdf_extract.py,
+# EXTRACT_WORKERS processer; 0 = antal CPU'er). En PDF der hænger eller
+# crasher sin worker opgives efter EXTRACT_TIMEOUT_SECONDS: poolen
+# termineres og genstartes, og de andre igangværende PDF'er køres om. En
+# mail hvor en PDF fejlede gemmes ikke og markeres ikke som set — den
+# prøves igen næste kørsel (og deltaLink gemmes ikke).
+# ---------------------------------------------------------------------------
+
+DOWNLOAD_CONCURRENCY = int(os.getenv("ASYNC_DOWNLOADS", "4") or "4")
+QUEUE_SIZE = int(os.getenv("ASYNC_QUEUE_SIZE", "20") or "20")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0") or "0") or (os.cpu_count() or 2)
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "60") or "60")
+_POLL_SECONDS = 0.05
+
+_DONE = object()
+
+
+async def _extract(pool: ExtractPool, path: Path, sha: str) -> tuple[str, bool]:
+    """(tekst, ok) for én PDF. Cache-hits returneres med det samme."""
+    slot = pool.submit(path, sha)
+    # slot.job/started skiftes hvis poolen genstartes undervejs (anden PDF i timeout)
+    while not slot.done and not slot.job.ready() and time.monotonic() - slot.started < pool.timeout:
+        await asyncio.sleep(_POLL_SECONDS)
+    return pool.result(slot, timeout=0)
+
+
+async def _ingest(s, gc: GraphClient, pool: ExtractPool) -> tuple[int, list[str]]:
+    msgs, delta, delta_key = open_message_source(gc, s)
+    seen = load_seen()
+
+    q_msgs: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    q_downloaded: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    q_ready: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    failed: list[str] = []
+
+    async def producer() -> None:
+        # Listningen er synkron (Graph-sider) — hent næste mail i en tråd
+        it = iter(msgs)
+        idx = 0
+        while True:
+            m = await asyncio.to_thread(next, it, None)
+            if m is None:
+                break
+            if is_candidate(m, s, seen):
+                await q_msgs.put((idx, m))
+                idx += 1
+        for _ in range(DOWNLOAD_CONCURRENCY):
+            await q_msgs.put(_DONE)
+        await q_downloaded.put((idx, _DONE))  # sequencer ved hvor mange der kommer
+
+    async def downloader() -> None:
+        while True:
+            item = await q_msgs.get()
+            if item is _DONE:
+                return
+            idx, m = item
+            try:
+                atts = await asyncio.to_thread(download_file_attachments, gc, s.mailbox_upn, m.id)
+            except Exception as e:
+                print(f"[ASYNC A] Kunne ikke hente vedhæftninger for {m.id}: {e}")
+                atts = None
+            await q_downloaded.put((idx, (m, atts)))
+
+    async def sequencer() -> None:
+        # Bringer downloads tilbage i listningsrækkefølge
+        waiting: dict[int, tuple[GraphMessage, list | None]] = {}
+        total: int | None = None
+        nxt = 0
+        while total is None or nxt < total:
+            idx, payload = await q_downloaded.get()
+            if payload is _DONE:
+                total = idx
+                continue
+            waiting[idx] = payload
+            while nxt in waiting:
+                m, atts = waiting.pop(nxt)
+                nxt += 1
+                if atts is None:
+                    failed.append(m.id)
+                    continue
+                # Hash + dedupe + skriv til disk (i tråd, rækkefølge bevares)
+                pdfs, msg_seen = await asyncio.to_thread(store_pdfs, m, atts, seen)
+                if not pdfs:
+                    continue
+                jobs = [asyncio.ensure_future(_extract(pool, p, h)) for p, h in pdfs]
+                await q_ready.put((m, pdfs, jobs, msg_seen))
+        await q_ready.put(_DONE)
+
+    added = 0
+
+    async def committer() -> None:
+        nonlocal added
+        while True:
+            item = await q_ready.get()
+            if item is _DONE:
+                return
+            m, pdfs, jobs, msg_seen = item
+            done = await asyncio.gather(*jobs)
+            if not all(ok for _text, ok in done):
+                # ikke gemt og ikke set — udtrækket prøves igen næste kørsel
+                print(f"[ASYNC A] Tekstudtræk fejlede for {m.id} — springes over denne gang.")
+                failed.append(m.id)
+                continue
+            commit_task(m, pdfs, [text for text, _ok in done], msg_seen, seen)
+            added += 1
+
+    await asyncio.gather(
+        producer(),
+        *(downloader() for _ in range(DOWNLOAD_CONCURRENCY)),
+        sequencer(),
+        committer(),
+    )
+
+    finish_sync(delta, delta_key, failed, tag="[ASYNC A]")
+    return added, failed
+
+
+def run():
+    s = get_settings()
+    token = acquire_token(s)
+    gc = GraphClient(token)
+
+    pool = ExtractPool(EXTRACT_WORKERS, EXTRACT_TIMEOUT)
+    try:
+        with batched_writes():
+            added, _failed = asyncio.run(_ingest(s, gc, pool))
+    finally:
+        pool.close()  # terminate — en hængende worker kan ikke holde processen i live
+
+    print(f"[ASYNC A] Done. Added tasks: {added}.")
+    print(f"[ASYNC A] Graph: {gc.stats_summary()}")
+    print(f"[ASYNC A] Text cache: {text_cache.summary()}")
+
+
+if __name__ == "__main__":
+    run()
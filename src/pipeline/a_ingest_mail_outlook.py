@@ -4,18 +4,18 @@ import os
 from datetime import datetime
 from pathlib import Path
 
-import win32com.client
-
 from src.config import get_settings
 from src.core.storage import (
+    batched_writes,
     load_seen,
-    save_seen,
-    load_tasks,
-    save_tasks,
+    update_seen,
     save_attachment,
     sha256_bytes,
 )
-from src.core.pdf_extract import extract_text_from_pdf
+from src.core.models import TaskRecord, upsert_records
+from src.core.dedupe import check_duplicate
+from src.core.pdf_extract import extract_stream
+from src.core import text_cache
 from src.core.parsing import extract_address_from_text
 
 
@@ -104,9 +104,17 @@ def _has_pdf_attachment(attachments) -> bool:
 
 
 def run():
+    # JSON-backend: tasks.json/seen.json skrives samlet (JSON_FLUSH_EVERY), ikke pr. mail
+    with batched_writes():
+        _run()
+
+
+def _run():
     s = get_settings()
 
-    # Outlook COM
+    # Outlook COM (kun Windows — importeres først her)
+    import win32com.client
+
     outlook = win32com.client.Dispatch("Outlook.Application")
     namespace = outlook.GetNamespace("MAPI")
     inbox = _get_inbox_for_mailbox(namespace, getattr(s, "mailbox_upn", None))
@@ -118,127 +126,154 @@ def run():
     restricted = _restrict_messages_to_window(messages, s.window_start_day, s.window_end_day)
 
     seen = load_seen()
-    tasks = load_tasks()
 
     added = 0
     scanned = 0
 
-    # Vi looper kun restricted set
-    for msg in restricted:
-        scanned += 1
-
-        # ReceivedTime
-        try:
-            received = msg.ReceivedTime  # COM datetime
-        except Exception:
-            continue
-
-        sender = _get_sender_smtp(msg)
-        subject = str(getattr(msg, "Subject", "") or "")
+    def collect():
+        # (mail, [(sti, sha256), ...]) for hver ny mail med PDF'er, i restrict-rækkefølge
+        nonlocal scanned
+        # Vi looper kun restricted set
+        for msg in restricted:
+            scanned += 1
 
-        if DEBUG:
-            print(f"DEBUG: {received} | sender_raw: {sender} | subject: {subject}")
-
-        # domænefilter (kræver SENDER_DOMAIN)
-        if s.sender_domain:
-            if "@" not in sender or not sender.endswith("@" + s.sender_domain):
+            # ReceivedTime
+            try:
+                received = msg.ReceivedTime  # COM datetime
+            except Exception:
                 continue
 
-        # dedupe pr mail
-        entry_id = str(getattr(msg, "EntryID", "") or "")
-        if not entry_id:
-            continue
-        if entry_id in seen:
-            continue
+            sender = _get_sender_smtp(msg)
+            subject = str(getattr(msg, "Subject", "") or "")
 
-        attachments = msg.Attachments
-        if not attachments or int(attachments.Count) == 0:
-            continue
+            if DEBUG:
+                print(f"DEBUG: {received} | sender_raw: {sender} | subject: {subject}")
 
-        # kun mails med mindst én pdf
-        if not _has_pdf_attachment(attachments):
-            continue
+            # domænefilter (kræver SENDER_DOMAIN)
+            if s.sender_domain:
+                if "@" not in sender or not sender.endswith("@" + s.sender_domain):
+                    continue
 
-        full_text_parts: list[str] = []
-        pdf_paths: list[str] = []
-        address: str | None = None
+            # dedupe pr mail
+            entry_id = str(getattr(msg, "EntryID", "") or "")
+            if not entry_id:
+                continue
+            if entry_id in seen:
+                continue
 
-        # Gem og parse alle PDF attachments
-        for i in range(1, int(attachments.Count) + 1):
-            try:
-                att = attachments.Item(i)
-                filename = str(att.FileName or "")
-            except Exception:
+            attachments = msg.Attachments
+            if not attachments or int(attachments.Count) == 0:
                 continue
 
-            if not filename.lower().endswith(".pdf"):
+            # kun mails med mindst én pdf
+            if not _has_pdf_attachment(attachments):
                 continue
 
-            # SaveAsFile kræver en sti på disk først.
-            # Vi gemmer i en midlertidig fil i current working dir, læser bytes, og gemmer i data-folder.
-            tmp_name = filename.replace("/", "_").replace("\\", "_")
-            tmp_path = os.path.join(os.getcwd(), tmp_name)
+            msg_seen: dict = {}
+            pdfs: list[tuple[Path, str]] = []
 
-            try:
-                att.SaveAsFile(tmp_path)
-                content = Path(tmp_path).read_bytes()
-            finally:
-                # ryd temp
+            # Gem alle PDF attachments (teksten udtrækkes i extract_stream)
+            for i in range(1, int(attachments.Count) + 1):
                 try:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
+                    att = attachments.Item(i)
+                    filename = str(att.FileName or "")
                 except Exception:
-                    pass
+                    continue
+
+                if not filename.lower().endswith(".pdf"):
+                    continue
 
-            h = sha256_bytes(content)
+                # SaveAsFile kræver en sti på disk først.
+                # Vi gemmer i en midlertidig fil i current working dir, læser bytes, og gemmer i data-folder.
+                tmp_name = filename.replace("/", "_").replace("\\", "_")
+                tmp_path = os.path.join(os.getcwd(), tmp_name)
 
-            # dedupe attachment
-            if seen.get("attachment_hashes", {}).get(h):
+                try:
+                    att.SaveAsFile(tmp_path)
+                    content = Path(tmp_path).read_bytes()
+                finally:
+                    # ryd temp
+                    try:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    except Exception:
+                        pass
+
+                h = sha256_bytes(content)
+
+                # dedupe attachment
+                if seen.get("attachment_hashes", {}).get(h):
+                    continue
+
+                saved_path = save_attachment(entry_id, filename, content, sha=h)
+                pdfs.append((saved_path, h))
+
+                seen.setdefault("attachment_hashes", {})[h] = {"message_id": entry_id, "file": filename}
+                msg_seen.setdefault("attachment_hashes", {})[h] = seen["attachment_hashes"][h]
+
+            # Hvis vi af en eller anden grund ikke fik PDF ud, så skip
+            if not pdfs:
                 continue
 
-            saved_path = save_attachment(entry_id, filename, content)
-            pdf_paths.append(str(saved_path))
+            yield {
+                "entry_id": entry_id,
+                # COM-datetime (pywintypes) -> almindelig naiv datetime i lokal tid, som før
+                "received_at": datetime.fromisoformat(received.strftime("%Y-%m-%dT%H:%M:%S")),
+                "from": sender,
+                "subject": subject,
+                "pdfs": pdfs,
+                "msg_seen": msg_seen,
+            }, pdfs
+
+    # Tekstudtræk (evt. i process-pool, EXTRACT_WORKERS) strømmer i mail-
+    # rækkefølge; hver task gemmes + markeres set så snart dens tekster er klar.
+    for m, texts, ok in extract_stream(collect()):
+        entry_id = m["entry_id"]
+        if not ok:
+            # PDF'en hang/crashede i poolen: hverken task eller seen — prøves igen
+            print(f"[OUTLOOK A] Tekstudtræk fejlede for {entry_id} — springes over denne gang.")
+            continue
+        msg_seen = m["msg_seen"]
+        full_text_parts: list[str] = []
+        pdf_paths: list[str] = []
+        address: str | None = None
 
-            text = extract_text_from_pdf(saved_path)
+        for (saved_path, _h), text in zip(m["pdfs"], texts):
+            pdf_paths.append(str(saved_path))
             if text:
                 full_text_parts.append(text)
                 if address is None:
                     address = extract_address_from_text(text)
 
-            seen.setdefault("attachment_hashes", {})[h] = {"message_id": entry_id, "file": filename}
-
         full_text = "\n\n".join(full_text_parts).strip()
 
-        # Hvis vi af en eller anden grund ikke fik PDF ud, så skip
-        if not pdf_paths:
-            continue
-
-        task = {
-            "task_id": entry_id,
-            "source_message_id": entry_id,
-            "received_at": received.strftime("%Y-%m-%dT%H:%M:%S"),
-            "from": sender,
-            "subject": subject,
-            "address": address or "(ukendt adresse)",
-            "pdf_paths": pdf_paths,
-            "text_raw": full_text,  # MVP: dump alt her
-            "status": "NEW",
-        }
-
-        tasks.append(task)
-        seen[entry_id] = {"received_at": task["received_at"]}
+        task = TaskRecord(
+            task_id=entry_id,
+            source_message_id=entry_id,
+            received_at=m["received_at"],
+            from_address=m["from"],
+            subject=m["subject"],
+            address=address or "(ukendt adresse)",
+            pdf_paths=pdf_paths,
+        )
+        task.text_raw = full_text  # gemmes komprimeret i data/blobs/text, task'en får text_sha
+        task = check_duplicate(task, seen, msg_seen)  # samme adresse for nylig -> DUPLICATE / merge
+
+        seen[entry_id] = msg_seen[entry_id] = {"received_at": m["received_at"].isoformat()}
+
+        # Gem pr. mail (task før seen), så et crash ikke koster de mails
+        # vi allerede har hentet og parset. Kun de nye rækker skrives.
+        upsert_records([task])
+        update_seen(msg_seen)
         added += 1
 
         # Flyt mail (klar – udkommenteret indtil du vil bruge det)
         # NOTE: Outlook COM flyt kræver at vi finder/har en folder reference.
         # msg.Move(dest_folder)
 
-    save_seen(seen)
-    save_tasks(tasks)
-
     print(f"[OUTLOOK A] Scanned messages in window: {scanned}")
     print(f"[OUTLOOK A] Added tasks: {added}")
-    print(f"[OUTLOOK A] Total tasks: {len(tasks)}")
+    print(f"[OUTLOOK A] Text cache: {text_cache.summary()}")
 
 
 if __name__ == "__main__":
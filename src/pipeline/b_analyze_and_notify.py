@@ -5,36 +5,33 @@ from datetime import datetime
 from pathlib import Path
 
 from src.config import get_settings
-from src.core.storage import load_tasks, save_tasks, OUT_DIR
-from src.core.rules import analyze
+from src.core.storage import OUT_DIR
+from src.core.models import load_records_by_status, upsert_records
+from src.core.rules import refresh_analyses
 from src.core.outlook_send import send_mail_outlook
 
 
 def run():
     s = get_settings()
-    tasks = load_tasks()
+    # NEW analyseres; allerede analyserede (men ikke planlagte) tasks
+    # opdateres hvis teksten, parseren eller estimat-settings er ændret
+    tasks = load_records_by_status("NEW", "ANALYZED", "CARPENTER_REQUESTED")
+    had_carpenter = {t.task_id: bool(t.analysis and t.analysis.needs_carpenter) for t in tasks}
+
+    # 1) Features + estimater (ANALYZE_WORKERS>0: parsing i en process-pool)
+    changed, stats = refresh_analyses(tasks, s.minutes_per_sqm, s.setup_minutes, s.fallback_minutes)
 
     analyzed = 0
     carpenter_tasks = []
-
-    # 1) Analyze NEW tasks
     for t in tasks:
-        if t.get("status") != "NEW":
-            continue
-
-        text = t.get("text_raw", "") or ""
-        a = analyze(text, s.minutes_per_sqm, s.setup_minutes, s.fallback_minutes)
-
-        t["analysis"] = {
-            "needs_carpenter": bool(a.needs_carpenter),
-            "sqm": a.sqm,
-            "rooms": a.rooms,
-            "estimated_minutes": a.estimated_minutes,
-        }
-        t["status"] = "ANALYZED"
-        analyzed += 1
-
-        if a.needs_carpenter:
+        needs_carp = t.analysis.needs_carpenter
+        if t.status == "NEW":
+            t.status = "ANALYZED"
+            analyzed += 1
+            if needs_carp:
+                carpenter_tasks.append(t)
+        elif needs_carp and not had_carpenter[t.task_id] and not t.carpenter_notified:
+            # parser-/ordbogsændring har fundet tømrerarbejde i en ældre task
             carpenter_tasks.append(t)
 
     # 2) Build one carpenter email
@@ -54,39 +51,33 @@ def run():
         seen_attach: set[str] = set()
 
         for i, t in enumerate(carpenter_tasks, 1):
-            an = t.get("analysis", {}) or {}
-            addr = t.get("address") or "(ukendt adresse)"
+            an = t.analysis
+            addr = t.address or "(ukendt adresse)"
+            received = t.received_at.strftime("%Y-%m-%d %H:%M") if t.received_at else "?"
 
             lines.append(f"{i}) {addr}")
-            lines.append(f"   Modtaget:         {t.get('received_at')}")
-            lines.append(f"   m²:               {an.get('sqm')} | Værelser: {an.get('rooms')}")
-            lines.append(f"   Maler-estimat:    {an.get('estimated_minutes')} min")
+            lines.append(f"   Modtaget:         {received}")
+            lines.append(f"   m²:               {an.sqm} | Værelser: {an.rooms}")
+            lines.append(f"   Maler-estimat:    {an.estimated_minutes} min")
 
             # Tilføj planlagte tømrer-blokke hvis planen allerede er kørt
-            plan = t.get("plan", {}) or {}
-            carp_blocks = [b for b in plan.get("blocks", []) if b.get("kind") == "carpenter"]
+            carp_blocks = [b for b in t.plan.blocks if b.kind == "carpenter"] if t.plan else []
             if carp_blocks:
                 lines.append(f"   Jeres tidspunkt(er):")
                 for b in carp_blocks:
-                    try:
-                        sdt = datetime.fromisoformat(b["start"])
-                        edt = datetime.fromisoformat(b["end"])
-                        lines.append(
-                            f"     • {sdt.strftime('%A d. %d/%m/%Y kl. %H:%M')} – {edt.strftime('%H:%M')}"
-                        )
-                    except Exception:
-                        lines.append(f"     • {b.get('start')} – {b.get('end')}")
+                    lines.append(
+                        f"     • {b.start.strftime('%A d. %d/%m/%Y kl. %H:%M')} – {b.end.strftime('%H:%M')}"
+                    )
             else:
                 # Plan ikke kørt endnu — lad vide at tidspunkt følger
                 lines.append("   Tidspunkt:        Planlægges – du modtager besked.")
 
-            pdfs = t.get("pdf_paths", []) or []
-            for p in pdfs:
+            for p in t.pdf_paths:
                 if p and p not in seen_attach:
                     attach.append(p)
                     seen_attach.add(p)
 
-            excerpt = (t.get("text_raw", "") or "").replace("\n", " ")
+            excerpt = t.text_raw.replace("\n", " ")
             lines.append(f"   Uddrag fra PDF:   {excerpt[:250]}...")
             lines.append("")
 
@@ -117,11 +108,11 @@ def run():
                     attachment_paths=attach,
                 )
 
-                now = datetime.now().isoformat(timespec="seconds")
+                now = datetime.now()
                 for t in carpenter_tasks:
-                    t["status"] = "CARPENTER_REQUESTED"
-                    t["carpenter_notified"] = True
-                    t["carpenter_notified_at"] = now
+                    t.status = "CARPENTER_REQUESTED"
+                    t.carpenter_notified = True
+                    t.carpenter_notified_at = now
 
                 print("[B] Sent carpenter email via Outlook (with PDFs).")
         else:
@@ -129,8 +120,9 @@ def run():
     else:
         print("[B] No carpenter tasks found in analyzed batch.")
 
-    save_tasks(tasks)
-    print(f"[B] Done. Analyzed: {analyzed}")
+    upsert_records(changed)  # uændrede tasks skrives ikke
+    print(f"[B] Done. Analyzed: {analyzed} | Opdateret: {len(changed) - analyzed} ældre")
+    print(f"[B] Analyse: {stats.summary()}")
 
 
 if __name__ == "__main__":
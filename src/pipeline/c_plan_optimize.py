@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from datetime import date
+
+from src.core.models import TaskRecord
+from src.pipeline.c_plan_schedule import (
+    PLAN_FIT,
+    PlanChoices,
+    PlanResult,
+    build_plan,
+    extract_zone,
+)
+
+# ---------------------------------------------------------------------------
+# Lokalsøgning oven på zone-batchingen (del C, PLAN_OPTIMIZE_SECONDS > 0)
+#
+# Starter fra greedy-planen (greedy_choices) og prøver små ændringer af
+# PlanChoices inden for et tidsbudget:
+#   zone-flyt    alle en zones tasks til en anden maler
+#   zone-byt     to zoner med hver sin maler bytter maler
+#   task-flyt    én task til en anden maler
+#   omrokering   én task flyttes frem/tilbage i planlægningsrækkefølgen
+#                (halvdelen af gangene en forsinket task, der flyttes frem)
+# Hver kandidat planlægges forfra med build_plan(output=False) og
+# beholdes hvis målet ikke bliver værre (lige gode træk accepteres, så
+# søgningen kan bevæge sig hen over plateauer). Malernes dage sekvenseres
+# (kørsel) først i den endelige plan; rapportens tal for greedy og optimeret
+# er for de sekvenserede planer.
+#
+# Mål (lavere er bedre), i arbejdsminutter:
+#   LATE_PENALTY_DAYS arbejdsdage pr. task der ikke er færdig før deadline
+#   + makespan (til sidste blok slutter, alle ressourcer)
+#   + IDLE_WEIGHT * tomgang (huller i malernes kalendere før sidste blok)
+# ---------------------------------------------------------------------------
+
+LATE_PENALTY_DAYS = 5
+IDLE_WEIGHT = 0.25
+
+
+@dataclass(frozen=True)
+class PlanScore:
+    makespan: int
+    late: int
+    idle: int
+    cost: float
+
+    def describe(self, day_minutes: int) -> str:
+        return (
+            f"makespan {self.makespan / day_minutes:.1f} dage, "
+            f"forsinkede {self.late}, tomgang {self.idle / 60:.0f} t"
+        )
+
+
+def score(res: PlanResult, day_minutes: int) -> PlanScore:
+    makespan = res.makespan_minutes()
+    late = len(res.late)
+    idle = res.idle_minutes()
+    cost = LATE_PENALTY_DAYS * day_minutes * late + makespan + IDLE_WEIGHT * idle
+    return PlanScore(makespan, late, idle, cost)
+
+
+@dataclass
+class OptimizeReport:
+    greedy: PlanScore
+    best: PlanScore
+    evaluations: int
+    accepted: int
+    seconds: float
+    day_minutes: int
+
+    def gain(self) -> float:
+        return 1 - self.best.cost / self.greedy.cost if self.greedy.cost else 0.0
+
+    def lines(self) -> list[str]:
+        return [
+            f"Optimering ({self.seconds:.1f} s, {self.evaluations} planer, {self.accepted} forbedringer):",
+            f"  greedy:    {self.greedy.describe(self.day_minutes)}",
+            f"  optimeret: {self.best.describe(self.day_minutes)}",
+            f"  gevinst:   {self.gain():.1%} af målet "
+            f"({(self.greedy.makespan - self.best.makespan) / self.day_minutes:+.1f} dage makespan)",
+        ]
+
+
+class _Moves:
+    def __init__(self, pool: list[TaskRecord], painter_names: list[str], rng: random.Random):
+        self.rng = rng
+        self.painters = painter_names
+        self.zone_of = {t.task_id: extract_zone(t.address) for t in pool}
+        self.zones = sorted(set(self.zone_of.values()))
+        self.tasks_in: dict[str, list[str]] = {}
+        for tid, z in self.zone_of.items():
+            self.tasks_in.setdefault(z, []).append(tid)
+
+    def _other(self, name: str | None) -> str:
+        return self.rng.choice([p for p in self.painters if p != name] or self.painters)
+
+    def zone_move(self, c: PlanChoices, late: list[str]) -> None:
+        z = self.rng.choice(self.zones)
+        target = self._other(c.painter_of.get(self.tasks_in[z][0]))
+        for tid in self.tasks_in[z]:
+            c.painter_of[tid] = target
+
+    def zone_swap(self, c: PlanChoices, late: list[str]) -> None:
+        z1, z2 = self.rng.sample(self.zones, 2) if len(self.zones) > 1 else (self.zones[0],) * 2
+        p1 = c.painter_of.get(self.tasks_in[z1][0])
+        p2 = c.painter_of.get(self.tasks_in[z2][0])
+        for tid in self.tasks_in[z1]:
+            c.painter_of[tid] = p2
+        for tid in self.tasks_in[z2]:
+            c.painter_of[tid] = p1
+
+    def task_move(self, c: PlanChoices, late: list[str]) -> None:
+        tid = self.rng.choice(late) if late and self.rng.random() < 0.5 else self.rng.choice(c.order)
+        c.painter_of[tid] = self._other(c.painter_of.get(tid))
+
+    def reorder(self, c: PlanChoices, late: list[str]) -> None:
+        if late and self.rng.random() < 0.5:
+            tid = self.rng.choice(late)
+            i = c.order.index(tid)
+            c.order.pop(i)
+            c.order.insert(self.rng.randint(0, i), tid)
+            return
+        i = self.rng.randrange(len(c.order))
+        tid = c.order.pop(i)
+        c.order.insert(self.rng.randrange(len(c.order) + 1), tid)
+
+    def all(self):
+        moves = [self.zone_move, self.task_move, self.reorder]
+        if len(self.zones) > 1:
+            moves.append(self.zone_swap)
+        return moves
+
+
+def optimize(
+    pool: list[TaskRecord],
+    s,
+    start_date: date,
+    seconds: float,
+    fit: str = PLAN_FIT,
+    seed: int = 1,
+    committed: list[TaskRecord] | None = None,
+) -> tuple[PlanResult, OptimizeReport]:
+    """
+    Greedy-plan forbedret med lokalsøgning i højst seconds sekunder.
+    committed holdes fast som i build_plan; kun pool flyttes rundt.
+    Returnerer den endelige plan (output=True, t.plan sat) og en rapport.
+    """
+    t0 = time.perf_counter()
+    greedy = build_plan(pool, s, start_date, fit, output=False, committed=committed)
+    day_minutes = greedy.painters[0].day_minutes if greedy.painters else 1
+    best_choices = greedy.choices
+    best_res = greedy
+    best = score(greedy, day_minutes)
+
+    rng = random.Random(seed)
+    mv = _Moves(pool, [p.name for p in greedy.painters], rng)
+    moves = mv.all() if pool and greedy.painters else []
+    evaluations = accepted = 0
+
+    while moves and time.perf_counter() - t0 < seconds:
+        cand = best_choices.copy()
+        rng.choice(moves)(cand, best_res.late)
+        res = build_plan(pool, s, start_date, fit, choices=cand, output=False, committed=committed)
+        sc = score(res, day_minutes)
+        evaluations += 1
+        if sc.cost <= best.cost:
+            if sc.cost < best.cost:
+                accepted += 1
+            best, best_choices, best_res = sc, cand, res
+
+    final = build_plan(pool, s, start_date, fit, choices=best_choices, committed=committed)
+    # Rapporten sammenligner de sekvenserede planer (som de gemmes); søgningen
+    # ovenfor scorer kandidaterne uden sekvensering, da det er hurtigere
+    greedy_seq = build_plan(pool, s, start_date, fit, output=False, committed=committed, sequence=True)
+    report = OptimizeReport(
+        greedy=score(greedy_seq, day_minutes),
+        best=score(final, day_minutes),
+        evaluations=evaluations,
+        accepted=accepted,
+        seconds=time.perf_counter() - t0,
+        day_minutes=day_minutes,
+    )
+    return final, report
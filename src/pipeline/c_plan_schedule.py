@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import copy
 import math
+import os
 import re
+from bisect import insort
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, date, time
 from pathlib import Path
 
 from src.config import get_settings
-from src.core.storage import load_tasks, save_tasks, OUT_DIR
-from src.core.routing import route_bucket
+from src.core.storage import OUT_DIR
+from src.core.models import TaskRecord, TaskPlan, PlanBlock, load_records_by_status, upsert_records
+from src.core.postcodes import postcode_of, zone_of
 from src.core.ics import write_ics
+from src.core.routing import route_km, sequence, travel_minutes
+from src.core.timeline import FITS, Timeline
+from src.core.web_plans import apply_web_plans
 from src.core.parsing import extract_deadline
 
 
@@ -20,11 +26,14 @@ MAX_TASKS_PER_DAY_PER_PAINTER = 2
 PAINTERS_PER_JOB = 1
 CARPENTER_RATIO_OF_PAINTER = 0.33
 PLAN_START_OFFSET_DAYS = 1
+# earliest = tidligste ledige hul | best = mindste hul jobbet kan være i (src/core/timeline.py)
+PLAN_FIT = (os.getenv("PLAN_FIT") or "earliest").strip().lower()
+if PLAN_FIT not in FITS:
+    PLAN_FIT = "earliest"
+# >0 = forbedr greedy-planen med lokalsøgning i så mange sekunder (c_plan_optimize.py)
+PLAN_OPTIMIZE_SECONDS = float(os.getenv("PLAN_OPTIMIZE_SECONDS", "0") or "0")
 # =========================
 
-POSTCODE_RE = re.compile(r"\b(\d{4})\b")
-
-
 def parse_hhmm(s: str) -> tuple[int, int]:
     hh, mm = s.split(":")
     return int(hh), int(mm)
@@ -34,23 +43,36 @@ def iso(dt: datetime) -> str:
     return dt.isoformat(timespec="seconds")
 
 
+_PAINTER_LABEL_RE = re.compile(r"\((PAINTER_\d+)\)")
+
+
 def extract_zone(address: str | None) -> str:
+    # Zone fra postnummer-tabellen (8000/8200 -> "Aarhus");
+    # postnr uden for tabellen bruges som egen zone
     if not address:
         return "UNKNOWN"
-    m = POSTCODE_RE.search(address)
-    if m:
-        return m.group(1)
-    return route_bucket(address)
+    return zone_of(address) or postcode_of(address) or "UNKNOWN"
 
 
 class Resource:
     """
-    En ressource (maler/tømrer) med daglig arbejdstid.
-    
-    VIGTIGT: next_slots() er nu ikke-destruktiv (bruger ikke self.day/used direkte).
-    Brug commit_slots() for at bekræfte en allokering.
+    En ressource (maler/tømrer) med daglig arbejdstid og en kalender af ledig
+    tid pr. dag (src/core/timeline.py), så huller foran senere bookinger
+    (fx mens en maler venter på tømreren) fyldes af andre jobs.
+
+    find_slots() er ikke-destruktiv; reserve()/commit_slots() booker og
+    release() frigiver igen. max_tasks_per_day: højst så mange jobs må
+    starte pr. dag — find_slots() springer direkte til første dag med plads.
     """
-    def __init__(self, name: str, start_date: date, work_start: str, work_end: str):
+    def __init__(
+        self,
+        name: str,
+        start_date: date,
+        work_start: str,
+        work_end: str,
+        fit: str = "earliest",
+        max_tasks_per_day: int | None = None,
+    ):
         self.name = name
         self.start_date = start_date
         self.work_start_h, self.work_start_m = parse_hhmm(work_start)
@@ -59,204 +81,506 @@ class Resource:
             (self.work_end_h * 60 + self.work_end_m)
             - (self.work_start_h * 60 + self.work_start_m)
         )
-        self.day = 0
-        self.used = 0
+        self.fit = fit
+        self.timeline = Timeline(self.day_minutes, max_tasks_per_day)
+        # besøg pr. dag: [(start, slut, adresse, task_id)] i minutter, sorteret
+        # (bruges til kørselsbuffere og sekvensering af dagen)
+        self.sites: dict[int, list[tuple[int, int, str | None, str]]] = {}
+        self.fixed: set[str] = set()
 
     def _base_dt(self, d: date) -> datetime:
         return datetime(d.year, d.month, d.day, self.work_start_h, self.work_start_m)
 
-    def _compute_slots(
+    def _pos(self, dt: datetime) -> tuple[int, int]:
+        """datetime -> (dag-indeks fra start_date, minut fra arbejdsdagens start)."""
+        day = (dt.date() - self.start_date).days
+        minute = int((dt - self._base_dt(dt.date())).total_seconds() // 60)
+        return day, minute
+
+    def _dt(self, day: int, minute: int) -> datetime:
+        return self._base_dt(self.start_date + timedelta(days=day)) + timedelta(minutes=minute)
+
+    def _chunks(self, blocks: list[tuple[datetime, datetime]]) -> list[tuple[int, int, int]]:
+        out = []
+        for s, e in blocks:
+            d, sm = self._pos(s)
+            if d < 0:
+                continue  # før planens start
+            em = self._pos(e)[1] if e.date() == s.date() else self.day_minutes
+            out.append((d, sm, em))
+        return out
+
+    def find_slots(
         self,
         minutes: int,
-        earliest: datetime | None,
-        day_offset: int,
-        used_offset: int,
-    ) -> tuple[list[tuple[datetime, datetime]], int, int]:
-        """
-        Beregner blokke uden at ændre self.
-        Returnerer (blocks, final_day, final_used).
-        """
-        remaining = max(15, int(minutes))
-        blocks: list[tuple[datetime, datetime]] = []
-        cur_day = day_offset
-        cur_used = used_offset
-
-        while remaining > 0:
-            d = self.start_date + timedelta(days=cur_day)
-            base = self._base_dt(d)
-
-            if earliest and earliest.date() == d:
-                earliest_min = int((earliest - base).total_seconds() // 60)
-                if earliest_min > cur_used:
-                    cur_used = max(0, earliest_min)
-
-            available = self.day_minutes - cur_used
-            if available <= 0:
-                cur_day += 1
-                cur_used = 0
-                continue
-
-            chunk = min(remaining, available)
-            start_dt = base + timedelta(minutes=cur_used)
-            end_dt = start_dt + timedelta(minutes=chunk)
-
-            blocks.append((start_dt, end_dt))
-            cur_used += chunk
-            remaining -= chunk
+        earliest: datetime | None = None,
+    ) -> list[tuple[datetime, datetime]]:
+        """Beregn blokke UDEN at booke. Sikker at kalde flere gange."""
+        chunks = self.timeline.find(
+            max(15, int(minutes)),
+            max((0, 0), self._pos(earliest)) if earliest else (0, 0),
+            self.fit,
+        )
+        return [(self._dt(d, s), self._dt(d, e)) for d, s, e in chunks]
 
-            if cur_used >= self.day_minutes and remaining > 0:
-                cur_day += 1
-                cur_used = 0
+    def reserve(self, blocks: list[tuple[datetime, datetime]], count: bool = True) -> None:
+        """Book blokke (fx fra find_slots eller allerede planlagte tasks); count = tæller som ét job."""
+        self.timeline.reserve(self._chunks(blocks), count)
 
-        return blocks, cur_day, cur_used
+    def release(self, blocks: list[tuple[datetime, datetime]], count: bool = True) -> None:
+        self.timeline.release(self._chunks(blocks), count)
 
-    def peek_slots(
+    def commit_slots(
         self,
         minutes: int,
         earliest: datetime | None = None,
-        extra_day_offset: int = 0,
     ) -> list[tuple[datetime, datetime]]:
-        """
-        Beregn blokke UDEN at committe. Sikker at kalde flere gange.
-        extra_day_offset: bruges til at skubbe fremad for MAX-check.
-        """
-        blocks, _, _ = self._compute_slots(
-            minutes, earliest, self.day + extra_day_offset, self.used if extra_day_offset == 0 else 0
-        )
+        """Beregn OG book blokke."""
+        blocks = self.find_slots(minutes, earliest)
+        self.reserve(blocks)
         return blocks
 
-    def commit_slots(
+    def _neighbours(self, d: int, s: int, e: int):
+        """Besøget der slutter senest før s og det der starter først efter e på dag d."""
+        prev = nxt = None
+        for site in self.sites.get(d, ()):
+            if site[1] <= s:
+                prev = site
+            elif site[0] >= e and nxt is None:
+                nxt = site
+        return prev, nxt
+
+    def find_visit(
         self,
         minutes: int,
-        earliest: datetime | None = None,
-    ) -> list[tuple[datetime, datetime]]:
+        earliest: datetime | None,
+        address: str | None,
+    ) -> tuple[list[tuple[datetime, datetime]], tuple[datetime, datetime] | None]:
         """
-        Beregn OG committe blokke. Kun kald denne når du er sikker på valget.
+        Som find_slots, men med kørsel: der skal være tid til at køre fra dagens
+        forrige besøg (og videre til det næste, hvis jobbet lægges i et hul).
+        Returnerer (blokke, kørselsbuffer før første blok eller None).
         """
-        blocks, new_day, new_used = self._compute_slots(minutes, earliest, self.day, self.used)
-        self.day = new_day
-        self.used = new_used
-        return blocks
-
-    def advance_to_next_day(self) -> None:
-        self.day += 1
-        self.used = 0
-
+        minutes = max(15, int(minutes))
+        pos = max((0, 0), self._pos(earliest)) if earliest else (0, 0)
+        chunks = self.timeline.find(minutes, pos, self.fit)
+        # hvert nyt forsøg starter senere end det forrige, så løkken slutter
+        # (senest på en dag uden andre besøg)
+        while True:
+            d, s, e = chunks[0]
+            prev, _ = self._neighbours(d, s, e)
+            need = travel_minutes(prev[2], address) if prev else 0
+            if prev and s < prev[1] + need:
+                chunks = self.timeline.find(minutes, max(pos, (d, prev[1] + need)), self.fit)
+                continue
+            # videre til dagens næste besøg (efter sidste chunk)
+            ld, ls, le = chunks[-1]
+            _, nxt = self._neighbours(ld, ls, le)
+            if nxt and le + travel_minutes(address, nxt[2]) > nxt[0]:
+                chunks = self.timeline.find(minutes, max(pos, (ld, nxt[1])), self.fit)
+                continue
+            buffer = (d, s - need, s) if need else None
+            break
+        blocks = [(self._dt(d, s), self._dt(d, e)) for d, s, e in chunks]
+        travel = (self._dt(buffer[0], buffer[1]), self._dt(buffer[0], buffer[2])) if buffer else None
+        return blocks, travel
 
-def _get_deadline_dt(task: dict, workday_end: str) -> datetime | None:
+    def book_visit(
+        self,
+        task_id: str,
+        address: str | None,
+        blocks: list[tuple[datetime, datetime]],
+        travel: tuple[datetime, datetime] | None = None,
+        count: bool = True,
+        fixed: bool = False,
+    ) -> None:
+        """
+        Book et job (og kørslen derhen) og husk besøgene til sekvenseringen.
+        fixed: blokke der allerede er planlagt (committed) — dagen omrokeres ikke.
+        """
+        self.reserve(blocks, count=count)
+        if fixed:
+            self.fixed.add(task_id)
+        if travel:
+            self.reserve([travel], count=False)
+        for d, s, e in self._chunks(blocks):
+            insort(self.sites.setdefault(d, []), (s, e, address, task_id))
+
+    def sequence_days(
+        self,
+        earliest_of: dict[str, datetime],
+    ) -> tuple[dict[tuple[str, datetime], tuple[datetime, datetime]], "RouteStats"]:
+        """
+        Ordner hver dags besøg med nearest neighbour + 2-opt (src/core/routing.py)
+        og lægger dem igen efter hinanden med kørselsbuffere. Et job der
+        fortsætter fra i går / i morgen bliver liggende først / sidst; de andre
+        må ikke starte før earliest_of[task_id] (tømreren) og skal nå at blive
+        færdige inden dagens næste faste punkt — ellers beholdes rækkefølgen.
+        Omrokerede dage bookes forfra i kalenderen (_rebook_day).
+        Returnerer {(task_id, gammel start): (ny start, ny slut)} og km-tal.
+        """
+        stats = RouteStats()
+        moves: dict[tuple[str, datetime], tuple[datetime, datetime]] = {}
+        dm = self.day_minutes
+        for d in sorted(self.sites):
+            lst = self.sites[d]
+            prev_tasks = {x[3] for x in self.sites.get(d - 1, ()) if x[1] == dm}
+            next_tasks = {x[3] for x in self.sites.get(d + 1, ()) if x[0] == 0}
+            head = lst[0] if lst[0][0] == 0 and lst[0][3] in prev_tasks else None
+            tail = lst[-1] if lst[-1][1] == dm and lst[-1][3] in next_tasks and lst[-1] is not head else None
+            movable = [x for x in lst if x is not head and x is not tail]
+            # dage med allerede planlagte (faste) besøg omrokeres ikke
+            movable_ok = not any(x[3] in self.fixed for x in movable)
+            h_addr = head[2] if head else None
+            t_addr = tail[2] if tail else None
+
+            before = route_km([x[2] for x in movable], h_addr, t_addr)
+            stats.km_before += before
+            new = movable
+            if movable_ok and len(movable) > 1:
+                order = sequence([x[2] for x in movable], h_addr, t_addr)
+                cand = [movable[i] for i in order]
+                if cand != movable and route_km([x[2] for x in cand], h_addr, t_addr) < before - 1e-9:
+                    retimed = self._retime(d, cand, head, tail, earliest_of)
+                    if retimed is not None:
+                        new = retimed
+            after = route_km([x[2] for x in new], h_addr, t_addr)
+            stats.km_after += after
+
+            if new is not movable:
+                by_task = {x[3]: x for x in new}
+                for old in movable:
+                    nw = by_task[old[3]]
+                    if nw[:2] != old[:2]:
+                        moves[(old[3], self._dt(d, old[0]))] = (self._dt(d, nw[0]), self._dt(d, nw[1]))
+                        stats.moved += 1
+                self.sites[d] = sorted(([head] if head else []) + new + ([tail] if tail else []))
+                self._rebook_day(d)
+
+            seq = self.sites[d]
+            stats.travel_minutes += sum(travel_minutes(a[2], b[2]) for a, b in zip(seq, seq[1:]))
+        return moves, stats
+
+    def _rebook_day(self, d: int) -> None:
+        """
+        Book dag d forfra efter sekvenseringen: besøgene i sites[d] og kørslen
+        mellem dem. Kalenderen (og dermed udnyttelse, makespan og tomgang)
+        følger så den nye rækkefølge. Antal job-starter pr. dag er uændret —
+        et besøg flyttes kun inden for dagen.
+        """
+        seq = self.sites[d]
+        chunks = [(d, x[0], x[1]) for x in seq]
+        chunks += [
+            (d, max(a[1], b[0] - travel_minutes(a[2], b[2])), b[0]) for a, b in zip(seq, seq[1:])
+        ]
+        self.timeline.release([(d, 0, self.day_minutes)], count=False)
+        self.timeline.reserve(sorted(chunks), count=False)
+
+    def _retime(
+        self,
+        d: int,
+        order: list[tuple[int, int, str | None, str]],
+        head: tuple[int, int, str | None, str] | None,
+        tail: tuple[int, int, str | None, str] | None,
+        earliest_of: dict[str, datetime],
+    ) -> list[tuple[int, int, str | None, str]] | None:
+        """Læg besøgene i order efter hinanden med kørsel; None hvis det ikke kan nå."""
+        cursor = head[1] if head else min(x[0] for x in order)
+        prev = head[2] if head else None
+        out = []
+        for s, e, addr, tid in order:
+            start = cursor + (travel_minutes(prev, addr) if prev else 0)
+            if tid in earliest_of:
+                ed, em = self._pos(earliest_of[tid])
+                if ed == d:
+                    start = max(start, em)
+                elif ed > d:
+                    return None
+            out.append((start, start + (e - s), addr, tid))
+            cursor, prev = start + (e - s), addr
+        limit = tail[0] - travel_minutes(prev, tail[2]) if tail else self.day_minutes
+        return out if cursor <= limit else None
+
+    def next_free(self) -> datetime:
+        """Første ledige minut (til at vælge den mindst belastede ressource)."""
+        d = self.timeline.first_open
+        return self._dt(d, self.timeline.day(d).starts[0])
+
+    def utilization(self) -> float:
+        return self.timeline.utilization()
+
+
+def _get_deadline_dt(task: TaskRecord, workday_end: str) -> datetime | None:
     """
     Returner deadline som datetime (slutningen af dagen), eller None.
     """
-    raw = task.get("deadline") or extract_deadline(task.get("text_raw", "") or "")
-    if not raw:
-        return None
-    try:
-        d = date.fromisoformat(raw)
-        h, m = parse_hhmm(workday_end)
-        return datetime(d.year, d.month, d.day, h, m)
-    except Exception:
+    d = task.deadline
+    if d is None:
+        if task.features is not None:
+            d = task.features.deadline  # parset i stage B
+        else:
+            raw = extract_deadline(task.text_raw)
+            d = date.fromisoformat(raw) if raw else None
+    if d is None:
         return None
+    h, m = parse_hhmm(workday_end)
+    return datetime(d.year, d.month, d.day, h, m)
+
+
+@dataclass
+class RouteStats:
+    km_before: float = 0.0      # dagenes ruter i placeringsrækkefølge
+    km_after: float = 0.0       # efter sekvensering
+    travel_minutes: int = 0     # kørselsbuffere i de endelige dage
+    moved: int = 0              # blokke der fik nyt tidspunkt
+
+    def add(self, other: "RouteStats") -> None:
+        self.km_before += other.km_before
+        self.km_after += other.km_after
+        self.travel_minutes += other.travel_minutes
+        self.moved += other.moved
+
+    def describe(self) -> str:
+        return (
+            f"{self.km_after:.0f} km ({self.km_before:.0f} km i placeringsrækkefølge, "
+            f"sparet {self.km_before - self.km_after:.0f} km), kørsel {self.travel_minutes / 60:.1f} t, "
+            f"{self.moved} blokke omrokeret"
+        )
 
 
-def run():
-    s = get_settings()
-    tasks = load_tasks()
-
-    pool = [t for t in tasks if t.get("status") in ("ANALYZED", "CARPENTER_REQUESTED")]
-    if not pool:
-        out_txt = OUT_DIR / "plan_preview.txt"
-        out_txt.write_text("Ingen tasks klar til plan.\n", encoding="utf-8")
-        print(f"[C] Wrote plan preview: {out_txt}")
-        print("[C] Planned tasks: 0")
-        write_ics([], Path("data/out/plan_preview.ics"))
-        return
-
-    pool.sort(key=lambda t: (extract_zone(t.get("address")), t.get("received_at", "")))
-
-    start_date = datetime.now().date() + timedelta(days=PLAN_START_OFFSET_DAYS)
-
-    carpenter = Resource("CARPENTER", start_date, s.workday_start, s.workday_end)
-    painters = [
-        Resource(f"PAINTER_{i+1}", start_date, s.workday_start, s.workday_end)
-        for i in range(s.num_painters)
-    ]
-
-    tasks_per_day: dict[tuple[str, date], int] = {}
-
-    def painter_day_count(p: Resource, d: date) -> int:
-        return tasks_per_day.get((p.name, d), 0)
+@dataclass
+class PlanChoices:
+    """
+    Beslutningerne bag en plan: rækkefølgen tasks planlægges i (de deler
+    tømreren, og tidligere tasks får de tidligste huller) og hvilken maler
+    der har hver task. greedy_choices() giver zone-batchingen;
+    c_plan_optimize.py forbedrer dem med lokalsøgning.
+    """
+    order: list[str]
+    painter_of: dict[str, str]
+
+    def copy(self) -> "PlanChoices":
+        return PlanChoices(list(self.order), dict(self.painter_of))
+
+
+@dataclass
+class PlanResult:
+    lines: list[str] = field(default_factory=list)
+    events: list[dict] = field(default_factory=list)
+    carpenter_lines: list[str] = field(default_factory=list)
+    scheduled: int = 0
+    carpenter: Resource | None = None
+    painters: list[Resource] = field(default_factory=list)
+    choices: PlanChoices | None = None
+    late: list[str] = field(default_factory=list)   # tasks hvor maleren ikke er færdig inden deadline
+    route: RouteStats = field(default_factory=RouteStats)
+
+    def utilization_lines(self) -> list[str]:
+        out = []
+        for r in self.painters + ([self.carpenter] if self.carpenter else []):
+            tl = r.timeline
+            out.append(
+                f"  - {r.name}: {tl.booked} min over {tl.last_day + 1} dage ({r.utilization():.0%})"
+            )
+        return out
+
+    def makespan_minutes(self) -> int:
+        """Arbejdsminutter fra planens start til sidste blok slutter (alle ressourcer)."""
+        res = self.painters + ([self.carpenter] if self.carpenter else [])
+        return max((r.timeline.end_minute() for r in res), default=0)
+
+    def idle_minutes(self) -> int:
+        """Ledig tid hos malerne før deres sidste blok (huller i kalenderen)."""
+        return sum(
+            p.timeline.end_minute() - p.timeline.booked for p in self.painters if p.timeline.booked
+        )
 
-    def bump_painter_day(p: Resource, d: date) -> None:
-        tasks_per_day[(p.name, d)] = painter_day_count(p, d) + 1
 
-    # --------------------------
-    # GROUP + ZONE ASSIGNMENT
-    # --------------------------
-    zone_tasks: dict[str, list[dict]] = {}
+def reserve_committed(
+    committed: list[TaskRecord],
+    carpenter: Resource,
+    painter_by_name: dict[str, Resource],
+) -> tuple[int, int]:
+    """
+    Blokkene fra allerede planlagte tasks (PLANNED) bookes som optaget tid,
+    så nye tasks lægges uden om dem. Blokke før planens start ignoreres.
+    Returnerer (tasks, blokke) der blev holdt fast.
+    """
+    n_tasks = n_blocks = 0
+    for t in committed:
+        if t.plan is None:
+            continue
+        per_resource: dict[str, list[tuple[datetime, datetime]]] = {}
+        for b in t.plan.blocks:
+            if b.kind == "carpenter":
+                name = carpenter.name
+            else:
+                m = _PAINTER_LABEL_RE.search(b.label)
+                name = m.group(1) if m else None
+            if name is not None and (name == carpenter.name or name in painter_by_name):
+                per_resource.setdefault(name, []).append((b.start, b.end))
+        held = 0
+        for name, blocks in per_resource.items():
+            r = carpenter if name == carpenter.name else painter_by_name[name]
+            blocks.sort()
+            future = [(bs, be) for bs, be in blocks if bs.date() >= r.start_date]
+            if future:
+                # tæller kun som nyt job pr. dag hvis jobbet starter i planens horisont
+                r.book_visit(t.task_id, t.address, future, count=future[0] == blocks[0], fixed=True)
+                held += len(future)
+        if held:
+            n_tasks += 1
+            n_blocks += held
+    return n_tasks, n_blocks
+
+
+def zone_minutes_of(pool: list[TaskRecord], zone_of_task: dict[str, str]) -> dict[str, int]:
     zone_minutes: dict[str, int] = {}
-
     for t in pool:
-        zone = extract_zone(t.get("address"))
-        zone_tasks.setdefault(zone, []).append(t)
-        an = t.get("analysis", {}) or {}
-        est = max(60, int(an.get("estimated_minutes") or 0))
+        zone = zone_of_task[t.task_id]
+        est = max(60, t.analysis.estimated_minutes if t.analysis else 0)
         zone_minutes[zone] = zone_minutes.get(zone, 0) + est
+    return zone_minutes
+
+
+def greedy_choices(
+    pool: list[TaskRecord],
+    zone_of_task: dict[str, str],
+    painter_names: list[str],
+    load: dict[str, int] | None = None,
+) -> PlanChoices:
+    """
+    Zone-batching: zoner sorteret efter minutter, hver zone til den maler
+    med mindst belastning (load = allerede bookede minutter pr. maler);
+    inden for zonen i modtagelsesrækkefølge.
+    """
+    zone_tasks: dict[str, list[TaskRecord]] = {}
+    for t in pool:
+        zone_tasks.setdefault(zone_of_task[t.task_id], []).append(t)
+    zone_minutes = zone_minutes_of(pool, zone_of_task)
 
     zones_sorted = sorted(zone_tasks.keys(), key=lambda z: zone_minutes.get(z, 0), reverse=True)
 
-    painter_load: dict[str, int] = {p.name: 0 for p in painters}
+    painter_load: dict[str, int] = {name: (load or {}).get(name, 0) for name in painter_names}
     zone_assignment: dict[str, str] = {}
 
     for z in zones_sorted:
-        best = min(painters, key=lambda p: painter_load[p.name])
-        zone_assignment[z] = best.name
-        painter_load[best.name] += zone_minutes.get(z, 0)
+        best = min(painter_names, key=lambda name: painter_load[name])
+        zone_assignment[z] = best
+        painter_load[best] += zone_minutes.get(z, 0)
 
-    # --------------------------
-    # PLAN
-    # --------------------------
-    plan_lines = []
-    plan_lines.append("PLAN — zone-batching + max tasks/day + tømrer->maler")
-    plan_lines.append(f"Startdato: {start_date.isoformat()}")
-    plan_lines.append(f"Arbejdstid: {s.workday_start}-{s.workday_end} | Malere: {s.num_painters}")
-    plan_lines.append(f"MAX_TASKS_PER_DAY_PER_PAINTER={MAX_TASKS_PER_DAY_PER_PAINTER}")
-    plan_lines.append("")
-    plan_lines.append("Zone assignment:")
+    order: list[str] = []
     for z in zones_sorted:
-        plan_lines.append(f"  - zone {z}: {zone_assignment[z]} (min={zone_minutes.get(z, 0)})")
-    plan_lines.append("")
-
-    events = []
-    scheduled = 0
-    # Denne liste bruges til at bygge tømrermail-tillæg med tidspunkter
-    carpenter_schedule_lines: list[str] = []
-
-    for zone in zones_sorted:
-        zone_tasks[zone].sort(key=lambda t: t.get("received_at", ""))
-
-        for t in zone_tasks[zone]:
-            an = t.get("analysis", {}) or {}
-            est_maler = max(60, int(an.get("estimated_minutes") or 0))
-            needs_carp = bool(an.get("needs_carpenter"))
-            addr = t.get("address", "(ukendt)")
-
-            # Respekter deadline hvis den er sat
-            deadline_dt = _get_deadline_dt(t, s.workday_end)
+        order.extend(t.task_id for t in sorted(zone_tasks[z], key=lambda t: t.received_ts))
+    return PlanChoices(order, {tid: zone_assignment[zone_of_task[tid]] for tid in order})
+
+
+def build_plan(
+    pool: list[TaskRecord],
+    s,
+    start_date: date,
+    fit: str = PLAN_FIT,
+    choices: PlanChoices | None = None,
+    output: bool = True,
+    committed: list[TaskRecord] | None = None,
+    sequence: bool | None = None,
+) -> PlanResult:
+    """
+    Planlægger pool (ANALYZED/CARPENTER_REQUESTED) fra start_date uden IO.
+    committed: allerede planlagte tasks hvis blokke holdes fast som optaget
+    tid — kun pool planlægges (inkrementelt).
+    choices=None giver zone-batchingen (greedy_choices). Med output=True
+    sættes t.plan/t.status og preview/ICS-linjerne bygges; output=False
+    bruges af optimeringen, der kun skal bruge kalenderne og nøgletallene.
+    sequence: omroker malernes dage for kortere kørsel (default = output);
+    kalenderne og nøgletallene beskriver så den sekvenserede plan.
+    """
+    if sequence is None:
+        sequence = output
+    res = PlanResult()
 
-            blocks = []
-            carp_end = None
+    # Zone slås op én gang pr. task og genbruges til sortering og gruppering
+    zone_of_task = {t.task_id: extract_zone(t.address) for t in pool}
+    pool.sort(key=lambda t: (zone_of_task[t.task_id], t.received_ts))
+    by_id = {t.task_id: t for t in pool}
 
-            # -------------------
-            # TØMRER først
-            # -------------------
-            if needs_carp:
-                est_carp = max(60, int(round(est_maler * CARPENTER_RATIO_OF_PAINTER)))
-                carp_blocks = carpenter.commit_slots(est_carp)
-                carp_end = carp_blocks[-1][1]
+    carpenter = Resource("CARPENTER", start_date, s.workday_start, s.workday_end, fit)
+    painters = [
+        Resource(
+            f"PAINTER_{i+1}", start_date, s.workday_start, s.workday_end, fit,
+            max_tasks_per_day=MAX_TASKS_PER_DAY_PER_PAINTER,
+        )
+        for i in range(s.num_painters)
+    ]
+    painter_by_name = {p.name: p for p in painters}
+    res.carpenter, res.painters = carpenter, painters
+    held_tasks, held_blocks = reserve_committed(committed or [], carpenter, painter_by_name)
 
-                for cs, ce in carp_blocks:
-                    blocks.append(("TØMRER", cs, ce, "carpenter"))
+    # --------------------------
+    # GROUP + ZONE ASSIGNMENT
+    # --------------------------
+    if choices is None:
+        choices = greedy_choices(
+            pool, zone_of_task, [p.name for p in painters],
+            {p.name: p.timeline.booked for p in painters},
+        )
+    res.choices = choices
 
+    # --------------------------
+    # PLAN
+    # --------------------------
+    plan_lines = res.lines
+    events = res.events
+    # Denne liste bruges til at bygge tømrermail-tillæg med tidspunkter
+    carpenter_schedule_lines = res.carpenter_lines
+
+    if output:
+        zone_minutes = zone_minutes_of(pool, zone_of_task)
+        zone_painters: dict[str, list[str]] = {}
+        for tid in choices.order:
+            names = zone_painters.setdefault(zone_of_task[tid], [])
+            if choices.painter_of.get(tid) not in names:
+                names.append(choices.painter_of.get(tid))
+        plan_lines.append("PLAN — zone-batching + max tasks/day + tømrer->maler")
+        plan_lines.append(f"Startdato: {start_date.isoformat()}")
+        plan_lines.append(f"Arbejdstid: {s.workday_start}-{s.workday_end} | Malere: {s.num_painters}")
+        plan_lines.append(f"MAX_TASKS_PER_DAY_PER_PAINTER={MAX_TASKS_PER_DAY_PER_PAINTER} | PLAN_FIT={fit}")
+        if held_tasks:
+            plan_lines.append(f"Allerede planlagt (holdt fast): {held_tasks} tasks, {held_blocks} blokke")
+        plan_lines.append("")
+        plan_lines.append("Zone assignment:")
+        for z, names in zone_painters.items():
+            plan_lines.append(f"  - zone {z}: {', '.join(map(str, names))} (min={zone_minutes.get(z, 0)})")
+        plan_lines.append("")
+
+    placed: list[tuple[TaskRecord, str, str, datetime | None, list]] = []
+    carp_end_of: dict[str, datetime] = {}
+    for tid in choices.order:
+        t = by_id[tid]
+        zone = zone_of_task[tid]
+        an = t.analysis
+        est_maler = max(60, an.estimated_minutes if an else 0)
+        needs_carp = bool(an and an.needs_carpenter)
+        addr = t.address or "(ukendt)"
+
+        # Respekter deadline hvis den er sat
+        deadline_dt = _get_deadline_dt(t, s.workday_end)
+
+        blocks = []
+        carp_end = None
+
+        # -------------------
+        # TØMRER først
+        # -------------------
+        if needs_carp:
+            est_carp = max(60, int(round(est_maler * CARPENTER_RATIO_OF_PAINTER)))
+            carp_blocks = carpenter.commit_slots(est_carp)
+            carp_end = carp_blocks[-1][1]
+
+            for cs, ce in carp_blocks:
+                blocks.append(("TØMRER", cs, ce, "carpenter"))
+
+            if output:
                 # Gem til tømrermail
                 carp_start_str = carp_blocks[0][0].strftime("%A d. %d/%m/%Y kl. %H:%M")
                 carp_end_str = carp_blocks[-1][1].strftime("%H:%M")
@@ -264,128 +588,166 @@ def run():
                     f"  → {addr}: {carp_start_str}–{carp_end_str}  (~{est_carp} min)"
                 )
 
-            # -------------------
-            # MALER — find rigtig maler for zone
-            # -------------------
-            primary_name = zone_assignment.get(zone)
-            chosen_painters: list[Resource] = []
-
-            primary = next((p for p in painters if p.name == primary_name), None)
-            if primary:
-                chosen_painters.append(primary)
-            else:
-                chosen_painters.append(min(painters, key=lambda r: (r.day, r.used)))
+        # -------------------
+        # MALER — maleren valgt for tasken (zonens maler i greedy)
+        # -------------------
+        chosen_painters: list[Resource] = []
+
+        primary = painter_by_name.get(choices.painter_of.get(tid))
+        if primary:
+            chosen_painters.append(primary)
+        else:
+            chosen_painters.append(min(painters, key=lambda r: r.next_free()))
+
+        if PAINTERS_PER_JOB > 1:
+            others = sorted(
+                [p for p in painters if p not in chosen_painters],
+                key=lambda r: r.next_free(),
+            )
+            chosen_painters.extend(others[: PAINTERS_PER_JOB - 1])
+
+        per_painter_minutes = int(math.ceil(est_maler / max(1, len(chosen_painters))))
+
+        late = False
+        for p in chosen_painters:
+            # Første placering på en dag hvor maleren ikke har nået max tasks
+            # (kapacitetsindekset i p.timeline springer fulde dage over)
+            # (med kørselsbuffer fra dagens forrige besøg, src/core/routing.py)
+            tentative, travel = p.find_visit(per_painter_minutes, carp_end, t.address)
+
+            # Deadline-check: starter maler-blokken inden deadline?
+            if deadline_dt and tentative[0][0] > deadline_dt:
+                late = True
+                if output:
+                    plan_lines.append(
+                        f"  [ADVARSEL] Task {t.task_id} kan ikke planlægges inden deadline {deadline_dt.date()}!"
+                    )
+                continue
 
-            if PAINTERS_PER_JOB > 1:
-                others = sorted(
-                    [p for p in painters if p not in chosen_painters],
-                    key=lambda r: (r.day, r.used),
-                )
-                chosen_painters.extend(others[: PAINTERS_PER_JOB - 1])
+            p.book_visit(tid, t.address, tentative, travel)
+            if deadline_dt and tentative[-1][1] > deadline_dt:
+                late = True
+            label = f"MALER ({p.name})"
+            for ps, pe in tentative:
+                blocks.append((label, ps, pe, "painter"))
+
+        if late:
+            res.late.append(tid)
+        res.scheduled += 1
+        if output:
+            placed.append((t, zone, addr, deadline_dt, blocks))
+        if sequence and carp_end:
+            carp_end_of[tid] = carp_end
+
+    if not output and not sequence:
+        return res  # optimeringens kandidater: kun kalenderne og nøgletallene
+
+    # -------------------
+    # Sekvensering: hver malers dage i kort rækkefølge (nearest neighbour + 2-opt)
+    # -------------------
+    moves: dict[tuple[str, str, datetime], tuple[datetime, datetime]] = {}
+    for p in painters if sequence else ():
+        m, st = p.sequence_days(carp_end_of)
+        moves.update({(f"MALER ({p.name})", tid, sdt): v for (tid, sdt), v in m.items()})
+        res.route.add(st)
+    if not output:
+        return res
+
+    # -------------------
+    # Output
+    # -------------------
+    for t, zone, addr, deadline_dt, blocks in placed:
+        # én malerblok pr. dag, så blokkenes rækkefølge er uændret
+        blocks = [
+            (label, *moves.get((label, t.task_id, sdt), (sdt, edt)), kind)
+            for label, sdt, edt, kind in blocks
+        ]
+        plan_lines.append(f"- Task: {t.task_id} | zone={zone} | adresse={addr}")
+        plan_lines.append(f"  Fra: {t.from_address} | Emne: {t.subject}")
+        if deadline_dt:
+            plan_lines.append(f"  Deadline: {deadline_dt.date()}")
+        for label, sdt, edt, _kind in blocks:
+            plan_lines.append(
+                f"    [{label}] {sdt.strftime('%Y-%m-%d %H:%M')} -> {edt.strftime('%H:%M')}"
+            )
+        plan_lines.append("")
+
+        t.plan = TaskPlan(
+            zone=zone,
+            blocks=[PlanBlock(label, sdt, edt, kind) for label, sdt, edt, kind in blocks],
+        )
+        t.status = "PLANNED"
+
+        for label, sdt, edt, _kind in blocks:
+            events.append({
+                "title": label,
+                "start": iso(sdt),
+                "end": iso(edt),
+                "location": addr,
+                "description": (
+                    f"Task: {t.task_id}\n"
+                    f"Zone: {zone}\n"
+                    f"Fra: {t.from_address}\n"
+                    f"Emne: {t.subject}"
+                ),
+            })
+
+    plan_lines.append("Udnyttelse (bookede minutter / arbejdstid til sidste bookede dag):")
+    plan_lines.extend(res.utilization_lines())
+    plan_lines.append(f"Kørsel malere: {res.route.describe()}")
+    return res
 
-            per_painter_minutes = int(math.ceil(est_maler / max(1, len(chosen_painters))))
 
-            for p in chosen_painters:
-                # FIX: brug peek_slots til at finde første dag, commit kun når dag er godkendt
-                extra_offset = 0
-                MAX_ATTEMPTS = 30  # sikkerhedsventil
-                attempts = 0
+def run():
+    s = get_settings()
+    pool = load_records_by_status("ANALYZED", "CARPENTER_REQUESTED")
+    if not pool:
+        out_txt = OUT_DIR / "plan_preview.txt"
+        out_txt.write_text("Ingen tasks klar til plan.\n", encoding="utf-8")
+        print(f"[C] Wrote plan preview: {out_txt}")
+        print("[C] Planned tasks: 0")
+        write_ics([], Path("data/out/plan_preview.ics"))
+        return
 
-                while attempts < MAX_ATTEMPTS:
-                    tentative = p.peek_slots(
-                        per_painter_minutes,
-                        earliest=carp_end,
-                        extra_day_offset=extra_offset,
-                    )
-                    if not tentative:
-                        break
-
-                    first_day = tentative[0][0].date()
-
-                    # Deadline-check: starter maler-blokken inden deadline?
-                    if deadline_dt and tentative[0][0] > deadline_dt:
-                        plan_lines.append(
-                            f"  [ADVARSEL] Task {t['task_id']} kan ikke planlægges inden deadline {deadline_dt.date()}!"
-                        )
-                        break
-
-                    if painter_day_count(p, first_day) < MAX_TASKS_PER_DAY_PER_PAINTER:
-                        # Godkendt — committe nu
-                        # Vi er nødt til at sætte painter til den rigtige position
-                        # ekstra_offset er antal ekstra dage fra nuværende position
-                        if extra_offset > 0:
-                            p.advance_to_next_day()
-                            # Gentag til vi er på den rigtige dag
-                            for _ in range(extra_offset - 1):
-                                p.advance_to_next_day()
-
-                        actual_blocks = p.commit_slots(per_painter_minutes, earliest=carp_end)
-                        bump_painter_day(p, actual_blocks[0][0].date())
-
-                        label = f"MALER ({p.name})"
-                        for ps, pe in actual_blocks:
-                            blocks.append((label, ps, pe, "painter"))
-                        break
-                    else:
-                        extra_offset += 1
-                        attempts += 1
-
-            # -------------------
-            # Output
-            # -------------------
-            plan_lines.append(f"- Task: {t['task_id']} | zone={zone} | adresse={addr}")
-            plan_lines.append(f"  Fra: {t.get('from')} | Emne: {t.get('subject')}")
-            if deadline_dt:
-                plan_lines.append(f"  Deadline: {deadline_dt.date()}")
-            for label, sdt, edt, _kind in blocks:
-                plan_lines.append(
-                    f"    [{label}] {sdt.strftime('%Y-%m-%d %H:%M')} -> {edt.strftime('%H:%M')}"
-                )
-            plan_lines.append("")
-
-            t["plan"] = {
-                "zone": zone,
-                "blocks": [
-                    {"label": label, "start": iso(sdt), "end": iso(edt), "kind": kind}
-                    for label, sdt, edt, kind in blocks
-                ],
-            }
-            t["status"] = "PLANNED"
-            scheduled += 1
-
-            for label, sdt, edt, _kind in blocks:
-                events.append({
-                    "title": label,
-                    "start": iso(sdt),
-                    "end": iso(edt),
-                    "location": addr,
-                    "description": (
-                        f"Task: {t.get('task_id')}\n"
-                        f"Zone: {zone}\n"
-                        f"Fra: {t.get('from')}\n"
-                        f"Emne: {t.get('subject')}"
-                    ),
-                })
+    start_date = datetime.now().date() + timedelta(days=PLAN_START_OFFSET_DAYS)
+    # Planlagte tasks flyttes ikke — nye tasks lægges i hullerne omkring dem.
+    # Deres blokke læses fra web-appen (Supabase) hvis den er sat op, da
+    # /delay flytter blokkene dér; den lokale state opdateres med dem.
+    committed = load_records_by_status("PLANNED")
+    from_web = apply_web_plans(committed)
+    if from_web:
+        upsert_records(from_web)
+        print(f"[C] {len(from_web)} planlagte task(s) hentet med ændret plan fra web-appen.")
+    if PLAN_OPTIMIZE_SECONDS > 0:
+        from src.pipeline.c_plan_optimize import optimize
+
+        res, report = optimize(pool, s, start_date, PLAN_OPTIMIZE_SECONDS, committed=committed)
+        res.lines += [""] + report.lines()
+        for line in report.lines():
+            print(f"[C] {line}")
+    else:
+        res = build_plan(pool, s, start_date, committed=committed)
 
     # Gem tømrer-tidspunkter til b_analyze_and_notify.py
-    if carpenter_schedule_lines:
+    if res.carpenter_lines:
         sched_path = OUT_DIR / "carpenter_schedule.txt"
         sched_path.write_text(
             "TØMRER-TIDSPUNKTER (genereret af planlægger):\n\n"
-            + "\n".join(carpenter_schedule_lines),
+            + "\n".join(res.carpenter_lines),
             encoding="utf-8",
         )
         print(f"[C] Wrote carpenter schedule: {sched_path}")
 
     out_txt = OUT_DIR / "plan_preview.txt"
-    out_txt.write_text("\n".join(plan_lines), encoding="utf-8")
+    out_txt.write_text("\n".join(res.lines), encoding="utf-8")
     print(f"[C] Wrote plan preview: {out_txt}")
-    print(f"[C] Planned tasks: {scheduled}")
+    print(f"[C] Planned tasks: {res.scheduled}")
+    print(f"[C] Kørsel malere: {res.route.describe()}")
 
-    write_ics(events, Path("data/out/plan_preview.ics"))
+    write_ics(res.events, Path("data/out/plan_preview.ics"))
     print("[C] Wrote calendar ICS: data/out/plan_preview.ics")
 
-    save_tasks(tasks)
+    upsert_records(pool)
 
 
 if __name__ == "__main__":
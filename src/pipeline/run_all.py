@@ -1,14 +1,46 @@
 from __future__ import annotations
 
+import importlib
+import os
+import time
 from pathlib import Path
 from datetime import datetime
+from typing import Callable
 
 from src.logging_setup import setup_logging
 
-#from src.pipeline.a_ingest_mail import run as run_a
-from src.pipeline.a_ingest_mail_outlook import run as run_a
-from src.pipeline.b_analyze_and_notify import run as run_b
-from src.pipeline.c_plan_schedule import run as run_c
+# Pipeline-delene importeres først når de skal køres, så fx en ren
+# planlægning ikke betaler for win32com/pdfplumber/fitz/msal/requests
+# (og kan køre på Linux).
+# INGEST_SOURCE vælger del A: outlook (default) | graph | graph-async
+INGEST_MODULES = {
+    "outlook": "src.pipeline.a_ingest_mail_outlook",
+    "graph": "src.pipeline.a_ingest_mail",
+    "graph-async": "src.pipeline.a_ingest_mail_async",
+}
+STEP_MODULES = {
+    "analyze": "src.pipeline.b_analyze_and_notify",
+    "plan": "src.pipeline.c_plan_schedule",
+}
+
+# modul -> import-tid i ms (til rapportering)
+IMPORT_MS: dict[str, float] = {}
+
+
+def ingest_source(source: str | None = None) -> str:
+    src = (source or os.getenv("INGEST_SOURCE") or "outlook").strip().lower()
+    if src not in INGEST_MODULES:
+        raise ValueError(f"Ukendt INGEST_SOURCE: {src} (vælg {', '.join(INGEST_MODULES)})")
+    return src
+
+
+def load_step(step: str, source: str | None = None) -> Callable[[], None]:
+    """run()-funktionen for "ingest" / "analyze" / "plan" — importeres her."""
+    name = INGEST_MODULES[ingest_source(source)] if step == "ingest" else STEP_MODULES[step]
+    t0 = time.perf_counter()
+    mod = importlib.import_module(name)
+    IMPORT_MS.setdefault(name, (time.perf_counter() - t0) * 1000)
+    return mod.run
 
 
 def _assert_exists(path: Path, logger, label: str) -> None:
@@ -18,23 +50,23 @@ def _assert_exists(path: Path, logger, label: str) -> None:
         logger.warning(f"[WARN] {label} was not created: {path}")
 
 
-def run_all():
+def run_all(source: str | None = None):
     logger = setup_logging("run_all")
 
     logger.info("=== job_mail_planner: RUN ALL (A -> B -> C) ===")
     logger.info(f"Started at: {datetime.now().isoformat(timespec='seconds')}")
 
     # A) ingest
-    logger.info("=== Running A: ingest mails + pdf + text ===")
-    run_a()
+    logger.info(f"=== Running A: ingest mails + pdf + text ({ingest_source(source)}) ===")
+    load_step("ingest", source)()
 
     # B) analyze + carpenter preview
     logger.info("=== Running B: analyze + carpenter preview ===")
-    run_b()
+    load_step("analyze")()
 
     # C) plan schedule preview
     logger.info("=== Running C: plan schedule preview ===")
-    run_c()
+    load_step("plan")()
 
     # Expected outputs
     tasks_path = Path("data/state/tasks.json")
@@ -46,6 +78,7 @@ def run_all():
     _assert_exists(carpenter_preview, logger, "carpenter_email_preview.txt")
     _assert_exists(plan_preview, logger, "plan_preview.txt")
 
+    logger.info("Imports: " + ", ".join(f"{k} {v:.0f} ms" for k, v in IMPORT_MS.items()))
     logger.info("=== DONE ===")
 
 
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import pytest
+
+from src.core.parsing import address_key, extract_address_from_text
+
+# ---------------------------------------------------------------------------
+# Adressenøgler til dublet-tjek: "st."/"kl." er en etage, og en arbejdsseddel
+# med sådan en adresse må ikke falde tilbage på udlejerens adresse i
+# sidefoden (så ville to forskellige opgaver få samme nøgle).
+# ---------------------------------------------------------------------------
+
+FOOTER = "Boligselskabet Aros, Vestergade 2, 8000 Aarhus C"
+
+
+def _order(address: str) -> str:
+    return f"Arbejdsseddel\nAdresse: {address}\nMaling af 2 værelser\n\n{FOOTER}\n"
+
+
+@pytest.mark.parametrize("address, key", [
+    ("Nørregade 45, st. th., 8000 Aarhus C", "noerregade|45|st|th|8000"),
+    ("Skolegade 12, kl. tv, 8000 Aarhus C", "skolegade|12|kl|tv|8000"),
+    ("NOERREGADE 45 2.TH 8000 Aarhus", "noerregade|45|2|th|8000"),
+])
+def test_floor_address_gets_its_own_key(address, key):
+    found = extract_address_from_text(_order(address))
+    assert address in found
+    assert address_key(found) == key
+
+
+def test_two_ground_floor_orders_with_same_footer_differ():
+    a = address_key(extract_address_from_text(_order("Nørregade 45, st. th., 8000 Aarhus C")))
+    b = address_key(extract_address_from_text(_order("Nørregade 45, st. tv., 8000 Aarhus C")))
+    assert a != b
+    assert address_key(FOOTER) not in (a, b)
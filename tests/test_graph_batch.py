@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import base64
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.graph import mail
+from src.graph.client import GraphClient
+
+# ---------------------------------------------------------------------------
+# download_file_attachments_batch mod en lokal stand-in for Graph:
+#   POST /$batch                                  JSON-batch (max 20 requests)
+#   GET  /users/<upn>/messages/<id>/attachments   enkelt-download (fallback)
+# Hver mail har én PDF med contentBytes; mails i no_inline har ingen
+# contentBytes, så indholdet hentes via .../$value (base64 i batch-body).
+# ---------------------------------------------------------------------------
+
+UPN = "planner@example.dk"
+_LIST_RE = re.compile(r"^/users/[^/]+/messages/([^/?]+)/attachments(?:\?.*)?$")
+_VALUE_RE = re.compile(r"^/users/[^/]+/messages/([^/]+)/attachments/([^/]+)/\$value$")
+
+
+class FakeGraph:
+    def __init__(self):
+        self.batches: list[list[str]] = []   # request-url'er pr. $batch-kald
+        self.single_gets: list[str] = []
+        self.batch_status = 200              # != 200: selve $batch-kaldet fejler
+        self.throttle_once: set[str] = set()  # mail-id'er hvis liste svarer 429 første gang
+        self.no_inline: set[str] = set()
+        self.retry_after = "0"                # Retry-After på 429-svar
+
+    def attachment(self, mid: str, inline: bool = True) -> dict:
+        a = {"@odata.type": "#microsoft.graph.fileAttachment", "id": f"a-{mid}", "name": f"{mid}.pdf"}
+        if inline:
+            a["contentBytes"] = base64.b64encode(f"pdf {mid}".encode()).decode()
+        return a
+
+    def answer(self, url: str) -> dict:
+        m = _VALUE_RE.match(url)
+        if m:
+            body = base64.b64encode(f"pdf {m.group(1)}".encode()).decode()
+            return {"status": 200, "body": body}
+        m = _LIST_RE.match(url)
+        mid = m.group(1)
+        if mid in self.throttle_once:
+            self.throttle_once.discard(mid)
+            return {"status": 429, "headers": {"Retry-After": self.retry_after}, "body": {"error": {"code": "TooManyRequests"}}}
+        return {"status": 200, "body": {"value": [self.attachment(mid, mid not in self.no_inline)]}}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    fake = FakeGraph()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: dict) -> None:
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            reqs = payload["requests"]
+            fake.batches.append([r["url"] for r in reqs])
+            if fake.batch_status != 200:
+                self._send(fake.batch_status, {"error": {"code": "BadGateway"}})
+                return
+            responses = [{"id": r["id"], **fake.answer(r["url"])} for r in reqs]
+            self._send(200, {"responses": responses})
+
+        def do_GET(self):
+            path = self.path.split("/v1.0", 1)[-1]
+            fake.single_gets.append(path)
+            mid = _LIST_RE.match(path).group(1)
+            self._send(200, {"value": [fake.attachment(mid)]})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(mail.time, "sleep", lambda _s: None)
+    fake.client = GraphClient("token", base=f"http://127.0.0.1:{server.server_address[1]}/v1.0")
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def _contents(got: dict) -> dict[str, list[bytes]]:
+    return {mid: [a.content for a in atts] for mid, atts in got.items()}
+
+
+def test_batches_are_split_in_chunks_of_20(graph):
+    ids = [f"m{i}" for i in range(45)]
+    got = mail.download_file_attachments_batch(graph.client, UPN, ids)
+
+    assert [len(b) for b in graph.batches] == [20, 20, 5]
+    assert list(got) == ids
+    assert _contents(got)["m44"] == [b"pdf m44"]
+    assert graph.single_gets == []
+
+
+def test_throttled_items_are_retried_alone(graph):
+    ids = [f"m{i}" for i in range(5)]
+    graph.throttle_once = {"m1", "m3"}
+    got = mail.download_file_attachments_batch(graph.client, UPN, ids)
+
+    assert len(graph.batches) == 2
+    assert [_LIST_RE.match(u).group(1) for u in graph.batches[1]] == ["m1", "m3"]
+    assert list(got) == ids
+    assert _contents(got)["m3"] == [b"pdf m3"]
+    assert graph.single_gets == []
+
+
+def test_retry_after_is_capped(graph, monkeypatch):
+    slept: list[float] = []
+    monkeypatch.setattr(mail.time, "sleep", slept.append)
+    graph.throttle_once = {"m0"}
+    graph.retry_after = "86400"
+    got = mail.download_file_attachments_batch(graph.client, UPN, ["m0"])
+
+    assert slept == [mail.MAX_BACKOFF_SECONDS]
+    assert _contents(got) == {"m0": [b"pdf m0"]}
+
+
+def test_attachment_without_content_bytes_uses_value_batch(graph):
+    ids = ["m0", "m1"]
+    graph.no_inline = {"m1"}
+    got = mail.download_file_attachments_batch(graph.client, UPN, ids)
+
+    assert len(graph.batches) == 2
+    assert graph.batches[1] == [f"/users/{UPN}/messages/m1/attachments/a-m1/$value"]
+    assert _contents(got) == {"m0": [b"pdf m0"], "m1": [b"pdf m1"]}
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_failed_batch_call_falls_back_to_single_downloads(graph, status):
+    ids = [f"m{i}" for i in range(25)]
+    graph.batch_status = status
+    got = mail.download_file_attachments_batch(graph.client, UPN, ids)
+
+    assert [len(b) for b in graph.batches] == [20, 5]
+    assert len(graph.single_gets) == 25
+    assert list(got) == ids
+    assert _contents(got)["m24"] == [b"pdf m24"]
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from src.core.reflow import reflow
+
+# ---------------------------------------------------------------------------
+# reflow når /delay rykker en blok tidligere: blokke foran den på samme
+# ressource må ikke ende med at overlappe den, og et senere fag starter
+# ikke før det tidligere fag på samme task er færdigt.
+# ---------------------------------------------------------------------------
+
+PAINTER = "MALER (PAINTER_1)"
+
+
+def _block(label: str, kind: str, start: str, end: str) -> dict:
+    return {"label": label, "kind": kind, "start": f"2026-03-02T{start}:00", "end": f"2026-03-02T{end}:00"}
+
+
+def _plans() -> dict[str, list[dict]]:
+    return {
+        "a": [_block(PAINTER, "painter", "07:00", "09:00")],
+        "b": [_block(PAINTER, "painter", "09:00", "11:00")],
+        "c": [_block(PAINTER, "painter", "11:00", "13:00")],
+        "d": [_block("TØMRER", "carpenter", "07:00", "09:30"), _block(PAINTER, "painter", "13:00", "14:00")],
+    }
+
+
+def _spans(plans: dict[str, list[dict]], label: str) -> list[tuple[str, str]]:
+    return sorted((b["start"], b["end"]) for bl in plans.values() for b in bl if b["label"] == label)
+
+
+def test_moving_earlier_pushes_overlapped_predecessors():
+    plans = _plans()
+    moved = reflow(plans, "c", "painter", datetime(2026, 3, 2, 8, 0))
+
+    assert moved[0].task_id == "c"
+    assert plans["c"][0]["start"] == "2026-03-02T08:00:00"
+    spans = _spans(plans, PAINTER)
+    assert all(prev_end <= start for (_s, prev_end), (start, _e) in zip(spans, spans[1:]))
+    assert {m.task_id for m in moved} == {"a", "b", "c", "d"}
+
+
+def test_moving_earlier_waits_for_earlier_trade():
+    plans = _plans()
+    reflow(plans, "d", "painter", datetime(2026, 3, 2, 7, 0))
+
+    assert plans["d"][1]["start"] == "2026-03-02T09:30:00"
+    spans = _spans(plans, PAINTER)
+    assert all(prev_end <= start for (_s, prev_end), (start, _e) in zip(spans, spans[1:]))